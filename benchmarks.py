@@ -0,0 +1,1196 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmarks for the recipe parser; these all run offline on the sample recipe below
+(same style of lines as the AllRecipes pages listed at the top of recipe_parser_final.py), so they
+can be rerun after any lexicon / parser change to check that nothing got slower.
+Run with: python benchmarks.py [saved AllRecipes .html pages, for the extraction benchmark]
+or, for the per-stage suite with its baseline check: python benchmarks.py --stages (see run_stage_suite)
+"""
+
+import time
+import tracemalloc
+
+import recipe_parser_final as rp
+
+SAMPLE_INGREDIENTS = ["4 ounces linguine pasta", "2 boneless skinless chicken breast halves, sliced into thin strips",
+                      "2 teaspoons Cajun seasoning", "2 tablespoons butter", "1 green bell pepper, chopped",
+                      "1/2 red bell pepper, chopped", "4 fresh mushrooms, sliced", "1 green onion, minced",
+                      "1 cup heavy cream", "1/4 teaspoon dried basil", "1/4 teaspoon lemon pepper",
+                      "1/4 teaspoon salt", "1/8 teaspoon garlic powder", "1/8 teaspoon ground black pepper",
+                      "1/4 cup all-purpose flour, plus extra for dusting", "1 (16 ounce) package bacon",
+                      "salt and pepper to taste", "2 tablespoons olive oil"]
+
+SAMPLE_DIRECTIONS = ["Bring a large pot of lightly salted water to a boil. Add linguine pasta, and cook for 8 to 10 minutes or until al dente; drain.",
+                     "Meanwhile, place chicken and Cajun seasoning in a bowl, and toss to coat.",
+                     "In a large skillet over medium heat, saute chicken in butter until no longer pink and juices run clear, about 5 to 7 minutes.",
+                     "Add green and red bell peppers, sliced mushrooms and green onions; cook for 2 to 3 minutes.",
+                     "Reduce heat, and stir in heavy cream. Season the sauce with basil, lemon pepper, salt, garlic powder and ground black pepper, and heat through.",
+                     "Add pasta, and toss. Serve with grated Parmesan cheese on the side."]
+
+
+def time_call(func, repeats):
+    #  best-of-n wall time, in seconds
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def benchmark_ingredient_parsing(num_recipes=50, repeats=5):
+    #  per-line parse_ingredient (one tokenize + one pos_tag per line) vs. parse_ingredients_batch
+    recipes = [SAMPLE_INGREDIENTS] * num_recipes
+    num_lines = sum(len(recipe) for recipe in recipes)
+    rp.find_ingredients_objects(SAMPLE_INGREDIENTS)     # first call pays for model loading; keep it out of the timings
+
+    def per_line():
+        return [[rp.parse_ingredient(line) for line in recipe] for recipe in recipes]
+
+    def batched():
+        return rp.parse_ingredients_batch(recipes)
+
+    cache, rp.ingredient_cache = rp.ingredient_cache, None    # every line gets parsed for real here
+    try:
+        assert per_line() == batched()
+        per_line_time = time_call(per_line, repeats)
+        batched_time = time_call(batched, repeats)
+    finally:
+        rp.ingredient_cache = cache
+    print("Ingredient parsing ({0} recipes, {1} lines):".format(num_recipes, num_lines))
+    print("    per-line: {0:.0f} lines/s".format(num_lines / per_line_time))
+    print("    batched:  {0:.0f} lines/s ({1:.2f}x)".format(num_lines / batched_time, per_line_time / batched_time))
+
+
+def ingredient_corpus(num_recipes, rng, unique_share=0.2):
+    #  recipes made of the sample lines (which repeat across recipes like real ones do) plus some one-off lines
+    recipes = []
+    for n in range(num_recipes):
+        recipe = rng.sample(SAMPLE_INGREDIENTS, 12)
+        for i in range(len(recipe)):
+            if rng.random() < unique_share:
+                recipe[i] = "{0} cups chopped vegetable number {1}".format(rng.randint(1, 4), n * 100 + i)
+        recipes.append(recipe)
+    return recipes
+
+
+def benchmark_ingredient_cache(num_recipes=300, repeats=3):
+    #  parse_ingredients_batch with and without the memoized parses, plus a check of the on-disk store
+    import os
+    import random
+    import tempfile
+    recipes = ingredient_corpus(num_recipes, random.Random(0))
+    num_lines = sum(len(recipe) for recipe in recipes)
+    cache = rp.ingredient_cache
+    try:
+        rp.ingredient_cache = None
+        expected = rp.parse_ingredients_batch(recipes)
+        uncached_time = time_call(lambda: rp.parse_ingredients_batch(recipes), repeats)
+
+        def cold_cache():
+            #  one recipe at a time, the way the batch workers see them
+            rp.ingredient_cache = rp.IngredientParseCache()
+            return [rp.find_ingredients_objects(recipe) for recipe in recipes]
+        assert cold_cache() == expected
+        hit_rate = rp.ingredient_cache.hit_rate()
+        cold_time = time_call(cold_cache, repeats)
+        warm_time = time_call(lambda: rp.parse_ingredients_batch(recipes), repeats)
+        result = rp.parse_ingredients_batch(recipes)
+        result[0][0]['name'].append('changed')
+        assert rp.parse_ingredients_batch(recipes) == expected, "cached parses must be handed out as copies"
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'parses.sqlite')
+            rp.ingredient_cache = rp.IngredientParseCache(path=path)
+            rp.parse_ingredients_batch(recipes)
+            rp.ingredient_cache.close()
+            rp.ingredient_cache = rp.IngredientParseCache(path=path)
+            assert rp.parse_ingredients_batch(recipes) == expected
+            disk_hits = rp.ingredient_cache.stats['disk_hits']
+            rp.ingredient_cache.close()
+            rp.MEASUREMENT_BANS.append('benchmark-only')   # any lexicon change has to throw the saved parses away
+            try:
+                rp.ingredient_cache = rp.IngredientParseCache(path=path)
+                rp.parse_ingredients_batch(recipes)
+                stale_hits = rp.ingredient_cache.stats['disk_hits']
+                rp.ingredient_cache.close()
+            finally:
+                rp.MEASUREMENT_BANS.remove('benchmark-only')
+        assert stale_hits == 0
+    finally:
+        rp.ingredient_cache = cache
+    print("Ingredient parse cache ({0} recipes, {1} lines):".format(num_recipes, num_lines))
+    print("    uncached:   {0:.0f} lines/s".format(num_lines / uncached_time))
+    print("    cold cache: {0:.0f} lines/s ({1:.0%} hit rate)".format(num_lines / cold_time, hit_rate))
+    print("    warm cache: {0:.0f} lines/s ({1:.1f}x)".format(num_lines / warm_time, uncached_time / warm_time))
+    print("    new run on the saved file: {0} of {1} distinct lines from disk".format(disk_hits, len(set(rp.normalize_ingredient_line(line) for recipe in recipes for line in recipe))))
+
+
+def retained_bytes(build):
+    #  memory still held by whatever build() returns
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def benchmark_record_memory(num_recipes=200):
+    #  bytes per analyzed recipe (analyze_recipe with every transform, i.e. after the whole pipeline has read and
+    #  transformed the records): the old dict-of-lists objects (each with its own copy of every word, like the
+    #  tokenizer hands them out) vs. the Ingredient / Instruction records that analyze_recipe actually keeps
+    transforms = sorted(rp.TRANSFORMS)
+
+    def kept_records(record):
+        variants = [(variant['ingredients'], variant['instructions']) for variant in record['transforms'].values() if 'error' not in variant]
+        return [(record['ingredients'], record['instructions'])] + variants
+
+    def analyzed():
+        import random
+        random.seed(0)
+        return [kept_records(rp.analyze_recipe(SAMPLE_INGREDIENTS, SAMPLE_DIRECTIONS, 'Cajun Chicken Pasta', transforms))
+                for _ in range(num_recipes)]
+
+    def fresh(words):
+        return [word.encode().decode() if isinstance(word, str) else word for word in words]
+
+    template = analyzed()[0]    # (also fills the parser's caches, so that they don't count below)
+    for ingredients, instructions in template:
+        for record in ingredients + instructions:
+            assert all(type(getattr(record, field)) is tuple for field in record.FIELDS), "analyzed records should stay tuples"
+
+    def as_dicts():
+        return [[([{field: fresh(words) for field, words in ingredient.to_dict().items()} for ingredient in ingredients],
+                  [{field: fresh(words) for field, words in instruction.to_dict().items()} for instruction in instructions])
+                 for ingredients, instructions in template]
+                for _ in range(num_recipes)]
+
+    dict_bytes = retained_bytes(as_dicts) / num_recipes
+    record_bytes = retained_bytes(analyzed) / num_recipes
+    print("Analyzed recipe memory ({0} ingredients, {1} instructions, {2} variants per recipe):".format(
+        len(template[0][0]), len(template[0][1]), len(template) - 1))
+    print("    dicts of lists: {0:.0f} bytes/recipe".format(dict_bytes))
+    print("    records:        {0:.0f} bytes/recipe ({1:.1f}x smaller)".format(record_bytes, dict_bytes / record_bytes))
+
+
+def run_transforms(ingredients, instructions, copy_inputs):
+    #  every transform on one parsed recipe; copy_inputs deep-copies the inputs first, like analyze_recipe used to
+    import copy
+    import random
+    results = {}
+    for name, transform in sorted(rp.TRANSFORMS.items()):
+        random.seed(0)      # italian_transform picks random spices
+        if copy_inputs:
+            results[name] = transform(copy.deepcopy(ingredients), copy.deepcopy(instructions))
+        else:
+            results[name] = transform(ingredients, instructions)
+    return results
+
+
+def benchmark_transforms(repeats=20):
+    #  all transforms on one parse: deep copies per transform vs. the copy-on-write records
+    ingredients = rp.find_ingredients_objects(SAMPLE_INGREDIENTS)
+    instructions = rp.RecipeAnalysis(SAMPLE_DIRECTIONS, rp.full_ingredients_list(ingredients)).instruction_objects
+    before = [record.to_dict() for record in ingredients + instructions]
+    assert run_transforms(ingredients, instructions, False) == run_transforms(ingredients, instructions, True)
+    assert [record.to_dict() for record in ingredients + instructions] == before, "a transform changed its input"
+    copied_time = time_call(lambda: run_transforms(ingredients, instructions, True), repeats)
+    shared_time = time_call(lambda: run_transforms(ingredients, instructions, False), repeats)
+    results = run_transforms(ingredients, instructions, False)
+    shared = sum(1 for new_instructions, new_ingredients in results.values()
+                 for record in new_ingredients + new_instructions if any(record is old for old in ingredients + instructions))
+    total = sum(len(new_ingredients) + len(new_instructions) for new_instructions, new_ingredients in results.values())
+    print("All {0} transforms on one recipe:".format(len(rp.TRANSFORMS)))
+    print("    deep copies:   {0:.2f} ms".format(copied_time * 1000))
+    print("    copy-on-write: {0:.2f} ms ({1:.1f}x), {2} of {3} result records shared with the parse".format(
+        shared_time * 1000, copied_time / shared_time, shared, total))
+
+
+def parsed_corpus(num_recipes, rng):
+    #  [(ingredient objects, instruction objects), ...] for varied recipes
+    parsed = []
+    for ing_strings in ingredient_corpus(num_recipes, rng):
+        ingredients = rp.find_ingredients_objects(ing_strings)
+        directions = rng.sample(SAMPLE_DIRECTIONS, 4)
+        parsed.append((ingredients, rp.RecipeAnalysis(directions, rp.full_ingredients_list(ingredients)).instruction_objects))
+    return parsed
+
+
+def benchmark_transform_throughput(num_recipes=100, repeats=3):
+    #  recipes/s for each transform on its own, over parses of varied recipes
+    import random
+    parsed = parsed_corpus(num_recipes, random.Random(0))
+    print("Transform throughput ({0} recipes):".format(num_recipes))
+    for name, transform in sorted(rp.TRANSFORMS.items()):
+        def run():
+            random.seed(0)
+            for ingredients, instructions in parsed:
+                try:
+                    transform(ingredients, instructions)
+                except IndexError:      # south-asian / italian trip over some recipes (see analyze_recipe)
+                    pass
+        print("    {0:15} {1:.0f} recipes/s".format(name + ':', num_recipes / time_call(run, repeats)))
+
+
+def benchmark_transform_all(num_recipes=100, repeats=3):
+    #  all six variants of every recipe: one call per transform vs. transform_all
+    import random
+    parsed = parsed_corpus(num_recipes, random.Random(0))
+
+    def one_by_one():
+        results = []
+        for ingredients, instructions in parsed:
+            variants = {}
+            for name, transform in rp.TRANSFORMS.items():
+                if name == 'italian':
+                    random.seed(0)
+                try:
+                    variants[name] = transform(ingredients, instructions)
+                except IndexError:
+                    variants[name] = 'IndexError'
+            results.append(variants)
+        return results
+
+    def fused():
+        results = []
+        for ingredients, instructions in parsed:
+            errors = {}
+            variants = rp.transform_all(ingredients, instructions, seed=0, errors=errors)
+            variants.update((name, type(error).__name__) for name, error in errors.items())
+            results.append(variants)
+        return results
+
+    assert fused() == one_by_one(), "transform_all has to give the same variants as the transforms on their own"
+    separate_time = time_call(one_by_one, repeats)
+    fused_time = time_call(fused, repeats)
+    print("All variants of {0} recipes:".format(num_recipes))
+    print("    one transform at a time: {0:.0f} recipes/s".format(num_recipes / separate_time))
+    print("    transform_all:           {0:.0f} recipes/s ({1:.2f}x)".format(num_recipes / fused_time, separate_time / fused_time))
+
+
+def write_dump(path, num_recipes, rng):
+    #  a gzipped recipe dump in the format run_dump reads
+    import gzip
+    import json
+    with gzip.open(path, 'wt') as dump:
+        for n, ing_strings in enumerate(ingredient_corpus(num_recipes, rng, unique_share=0)):
+            dump.write(json.dumps({'title': 'recipe {0}'.format(n), 'ingredients': ing_strings,
+                                   'directions': rng.sample(SAMPLE_DIRECTIONS, 4)}) + '\n')
+
+
+def benchmark_dump_streaming(sizes=(100, 400)):
+    #  run_dump throughput and peak memory; the peak should stay flat as the dump grows
+    import os
+    import random
+    import tempfile
+    directory = tempfile.mkdtemp()
+    print("Streaming a gzipped dump (all transforms):")
+    try:
+        for num_recipes in sizes:
+            dump = os.path.join(directory, 'dump{0}.jsonl.gz'.format(num_recipes))
+            write_dump(dump, num_recipes, random.Random(0))
+            output = os.path.join(directory, 'out.jsonl')
+            elapsed = time_call(lambda: rp.run_dump(dump, output, sorted(rp.TRANSFORMS)), 1)
+            peak = measure(lambda: rp.run_dump(dump, output, sorted(rp.TRANSFORMS)))[1]
+            print("    {0} recipes: {1:.0f} recipes/s, {2:.2f} MB peak".format(num_recipes, num_recipes / elapsed, peak / 1e6))
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+def benchmark_service(num_requests=200, max_waits=(0.0, 0.005), clients=(1, 16)):
+    #  the HTTP service under local load: client-side p50 / p99 and how many requests each tagging batch merged
+    import asyncio
+    import random
+    import threading
+    rng = random.Random(0)
+    payloads = [{'title': 'recipe {0}'.format(n), 'ingredients': ing_strings, 'directions': rng.sample(SAMPLE_DIRECTIONS, 4),
+                 'transforms': sorted(rp.TRANSFORMS)} for n, ing_strings in enumerate(ingredient_corpus(50, rng))]
+    rp.preload_models()
+    print("HTTP service ({0} POST /transform requests):".format(num_requests))
+    for max_wait in max_waits:
+        loop = asyncio.new_event_loop()
+        service = rp.RecipeService(max_wait=max_wait)
+        loop.run_until_complete(service.start('127.0.0.1', 0))
+        server_thread = threading.Thread(target=loop.run_forever)
+        server_thread.start()
+        try:
+            for client_count in clients:
+                batches, calls = service.batcher.stats['batches'], service.batcher.stats['calls']
+                result = rp.load_test('http://127.0.0.1:{0}/transform'.format(service.port), payloads, num_requests, client_count)
+                merged = (service.batcher.stats['calls'] - calls) / max(1, service.batcher.stats['batches'] - batches)
+                print("    max wait {0:.0f} ms, {1:2} clients: {2:.0f} requests/s, p50 {3:.1f} ms, p99 {4:.1f} ms, "
+                      "{5:.1f} tagging calls per batch".format(max_wait * 1000, client_count, result['requests_per_second'],
+                                                                result['p50_ms'], result['p99_ms'], merged))
+                assert result['failures'] == 0
+        finally:
+            asyncio.run_coroutine_threadsafe(service.shutdown(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            server_thread.join()
+            loop.close()
+
+
+def benchmark_instrumentation(num_recipes=50, repeats=3):
+    #  analyze_recipe with instrumentation off (nothing wrapped) vs. on; off should be the same as before it existed
+    import random
+    rng = random.Random(0)
+    recipes = [(ing_strings, rng.sample(SAMPLE_DIRECTIONS, 4)) for ing_strings in ingredient_corpus(num_recipes, rng)]
+
+    def run():
+        for ing_strings, dir_strings in recipes:
+            rp.analyze_recipe(ing_strings, dir_strings, 'recipe', sorted(rp.TRANSFORMS))
+    run()
+    off_time = time_call(run, repeats)
+    rp.enable_instrumentation()
+    try:
+        on_time = time_call(run, repeats)
+    finally:
+        collected = rp.disable_instrumentation()
+    print("Instrumentation ({0} recipes, all transforms):".format(num_recipes))
+    print("    off: {0:.0f} recipes/s".format(num_recipes / off_time))
+    print("    on:  {0:.0f} recipes/s ({1:.1f}% overhead), {2} traces".format(
+        num_recipes / on_time, (on_time / off_time - 1) * 100, len(collected.traces)))
+
+
+def benchmark_rendering(num_recipes=100, repeats=3):
+    #  writing the ingredients and steps of many recipes to a file: print line by line vs. a TextRenderer
+    import contextlib
+    import os
+    import random
+    rng = random.Random(0)
+    parsed = [(ingredients, rp.merge_output_steps(instructions)) for ingredients, instructions in parsed_corpus(num_recipes, rng)]
+
+    def printed():
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for ingredients, steps in parsed:
+                for ingredient in ingredients:
+                    line = rp.generate_ingredient_string(ingredient)
+                    if line is not None:
+                        print(line)
+                for line in rp.output_step_lines(steps):
+                    print(line)
+
+    def rendered():
+        with open(os.devnull, 'w') as devnull:
+            renderer = rp.TextRenderer(devnull)
+            for ingredients, steps in parsed:
+                renderer.ingredients(ingredients).steps(steps)
+    print_time = time_call(printed, repeats)
+    render_time = time_call(rendered, repeats)
+    print("Rendering ({0} recipes):".format(num_recipes))
+    print("    print per line: {0:.0f} recipes/s".format(num_recipes / print_time))
+    print("    TextRenderer:   {0:.0f} recipes/s ({1:.2f}x)".format(num_recipes / render_time, print_time / render_time))
+
+
+def count_calls(func, names=('word_tokenize',)):
+    #  counts calls to the named parser-module functions made while running func
+    calls = [0]
+    originals = {name: getattr(rp, name) for name in names}
+
+    def counting(original):
+        def wrapper(*args, **kwargs):
+            calls[0] += 1
+            return original(*args, **kwargs)
+        return wrapper
+    for name, original in originals.items():
+        setattr(rp, name, counting(original))
+    try:
+        func()
+    finally:
+        for name, original in originals.items():
+            setattr(rp, name, original)
+    return calls[0]
+
+
+def benchmark_instruction_tokenization(repeats=5):
+    #  string-based analyzers (each one tokenizes the direction again) vs. one shared tokenize_instructions pass
+    all_ingredients = rp.full_ingredients_list(rp.find_ingredients_objects(SAMPLE_INGREDIENTS))
+
+    def per_analyzer():
+        for dir_string in SAMPLE_DIRECTIONS:
+            rp.find_instruction_ingredients(dir_string, all_ingredients)
+            rp.parse_tools(dir_string)
+            rp.infer_tools(dir_string)
+            rp.parse_methods(dir_string, all_ingredients)
+            rp.fetch_cooking_time(dir_string)
+
+    def shared():
+        docs = rp.tokenize_instructions(SAMPLE_DIRECTIONS)
+        for doc in docs:
+            rp.find_instruction_ingredients_helper(doc['tokens'], all_ingredients)
+            rp.parse_tools_helper(doc['lower_tokens'])
+            rp.infer_tools_helper(doc['lower_tokens'])
+            rp.parse_methods_helper(doc['tagged'], all_ingredients)
+            rp.fetch_cooking_time_helper(doc['tokens'])
+
+    directions = SAMPLE_DIRECTIONS + ["Preheat oven to 350 degrees F. Mix the flour and sugar in a bowl."]
+    for dir_string, doc in zip(directions, rp.tokenize_instructions(directions)):
+        assert doc['tokens'] == rp.word_tokenize(dir_string)
+        assert doc['lower_tokens'] == rp.word_tokenize(dir_string.lower())
+        assert doc['tagged'] == rp.pos_tag(rp.word_tokenize(dir_string.lower()))
+    print("Instruction analysis ({0} directions):".format(len(SAMPLE_DIRECTIONS)))
+    print("    per-analyzer: {0} tokenizer calls, {1:.2f} ms".format(count_calls(per_analyzer), time_call(per_analyzer, repeats) * 1000))
+    print("    shared docs:  {0} tokenizer calls, {1:.2f} ms".format(count_calls(shared), time_call(shared, repeats) * 1000))
+
+
+ANALYZER_STAGES = ('parse_tools_helper', 'infer_tools_helper', 'parse_methods_helper', 'find_instruction_ingredients_helper',
+                   'fetch_cooking_time_helper')
+
+
+def benchmark_recipe_analysis(repeats=5):
+    #  old __main__ flow (full_tools_list + full_methods_list + assemble_instruction_objects) vs. one RecipeAnalysis
+    all_ingredients = rp.full_ingredients_list(rp.find_ingredients_objects(SAMPLE_INGREDIENTS))
+
+    def three_pass():
+        all_tools = rp.full_tools_list(SAMPLE_DIRECTIONS)
+        all_methods = rp.full_methods_list(SAMPLE_DIRECTIONS, all_ingredients)
+        rp.find_primary_cooking_method(all_methods['parsed_methods'] + all_methods['inferred_methods'])
+        rp.assemble_instruction_objects(SAMPLE_DIRECTIONS, all_ingredients)
+        return all_tools, all_methods
+
+    def one_pass():
+        return rp.RecipeAnalysis(SAMPLE_DIRECTIONS, all_ingredients)
+
+    all_tools, all_methods = three_pass()
+    analysis = one_pass()
+    for key in all_tools:
+        assert sorted(all_tools[key]) == sorted(analysis.all_tools[key])
+    for key in all_methods:
+        assert sorted(all_methods[key]) == sorted(analysis.all_methods[key])
+
+    print("Recipe analysis ({0} directions):".format(len(SAMPLE_DIRECTIONS)))
+    print("    three-pass:     {0} tokenizer calls, {1} analyzer stages, {2:.2f} ms".format(
+        count_calls(three_pass), count_calls(three_pass, ANALYZER_STAGES), time_call(three_pass, repeats) * 1000))
+    print("    RecipeAnalysis: {0} tokenizer calls, {1} analyzer stages, {2:.2f} ms".format(
+        count_calls(one_pass), count_calls(one_pass, ANALYZER_STAGES), time_call(one_pass, repeats) * 1000))
+
+
+def benchmark_lexicon_matching(lexicon_sizes=(20, 200, 2000), repeats=3):
+    #  substring lookup of every token against a growing word list: python loop vs. LexiconMatcher
+    tokens = [token.lower() for line in SAMPLE_INGREDIENTS + SAMPLE_DIRECTIONS for token in line.split()] * 20
+    print("Lexicon matching ({0} tokens):".format(len(tokens)))
+    for size in lexicon_sizes:
+        #  the real measurement words plus made-up ones that never match, to grow the lexicon
+        words = rp.MEASUREMENT_WORDS + ['zq{0}x'.format(i) for i in range(size - len(rp.MEASUREMENT_WORDS))]
+        matcher = rp.LexiconMatcher({'MEASUREMENT': words})
+
+        def loop():
+            return [any(word in token for word in words) for token in tokens]
+
+        def automaton():
+            return ['MEASUREMENT' in matcher.labels(token) for token in tokens]
+
+        assert loop() == automaton()
+        loop_time = time_call(loop, repeats)
+        automaton_time = time_call(automaton, repeats)
+        print("    {0:>5} words: loop {1:.2f} ms, automaton {2:.2f} ms".format(size, loop_time * 1000, automaton_time * 1000))
+
+
+def benchmark_ingredient_mentions(num_ingredients=40, repeats=3):
+    #  all-pairs misspelling() scan (the old find_instruction_ingredients) vs. IngredientMentionIndex
+    all_ingredients = rp.full_ingredients_list(rp.find_ingredients_objects(SAMPLE_INGREDIENTS))
+    all_ingredients = (all_ingredients + ['ingredient{0}'.format(i) for i in range(num_ingredients)])[:num_ingredients]
+    token_lists = [rp.word_tokenize(dir_string) for dir_string in SAMPLE_DIRECTIONS] * 10
+
+    def all_pairs():
+        results = []
+        for tokens in token_lists:
+            found = []
+            for ingredient in all_ingredients:
+                for token in tokens:
+                    if token == ingredient or rp.misspelling(token, ingredient):
+                        found.append(token)
+                        break
+            results.append(sorted(set(found)))
+        return results
+
+    def indexed():
+        index = rp.IngredientMentionIndex(all_ingredients)
+        return [sorted(rp.find_instruction_ingredients_helper(tokens, all_ingredients, index)) for tokens in token_lists]
+
+    assert all_pairs() == indexed()
+    ingredients = rp.find_ingredients_objects(SAMPLE_INGREDIENTS)
+    mentions = rp.RecipeAnalysis(SAMPLE_DIRECTIONS, rp.full_ingredients_list(ingredients),
+                                 ingredient_phrases=rp.full_ingredient_phrases(ingredients)).ingredient_mentions
+    assert 'heavy cream' in mentions[4] and 'green onion' in mentions[3], "multi-word names get found as phrases"
+    print("Ingredient mentions ({0} ingredients, {1} directions):".format(len(all_ingredients), len(token_lists)))
+    print("    all-pairs: {0:.2f} ms".format(time_call(all_pairs, repeats) * 1000))
+    print("    indexed:   {0:.2f} ms".format(time_call(indexed, repeats) * 1000))
+
+
+def baseline_infer_methods(method_word, tools):
+    #  infer_methods as it was before the rule engine (with ('grill',) as a real tuple), kept here as the reference
+    combined_list = method_word + tools
+    inferred_methods = []
+    rules = {('cook', 'skillet', 'oil'): 'fry', ('grill',): 'grill', ('pot', 'water'): 'boil', ('drain', 'pot'): 'boil'}
+    for key_words in rules.keys():
+        common_words = [word for word in combined_list if word in key_words]
+        if len(common_words) == len(key_words):
+            inferred_methods.append(rules[key_words])
+    return inferred_methods
+
+
+def quadratic_method_inference(steps):
+    #  what assemble_instruction_objects used to do: re-run infer_methods over the whole history at every step
+    tools_list = []
+    methods_list = []
+    inferred_methods = []
+    per_step = []
+    for methods, tools in steps:
+        tools_list = tools_list + tools
+        methods_list = methods_list + methods
+        potentially_inferred = list(set(baseline_infer_methods(methods_list, tools_list)))
+        new_methods = [method for method in potentially_inferred if method not in inferred_methods]
+        inferred_methods = inferred_methods + new_methods
+        per_step.append(sorted(new_methods))
+    return per_step
+
+
+def incremental_method_inference(steps):
+    inferrer = rp.IncrementalMethodInferrer()
+    return [sorted(inferrer.update(methods + tools)) for methods, tools in steps]
+
+
+def quadratic_output_steps(instructions_objects):
+    #  the merge generate_output_steps used to do: nearest step by scanning every valid step, a deepcopy, and a
+    #  dedup by comparing whole dicts
+    import copy
+    instruction_list = []
+    for i, instruction in enumerate(instructions_objects):
+        instruction_list.append({'ingredients': list(set(instruction['ingredients']))[::-1],
+                                 'tools': list(set(instruction['parsed_tools'] + instruction['inferred_tools'])),
+                                 'primary_methods': list(instruction['primary_method']),
+                                 'other_methods': list(instruction['other_method']),
+                                 'cooking_time': list(instruction['cooking_time']), 'step': i + 1})
+    valid_steps = [ins['step'] - 1 for ins in instruction_list if ins['ingredients']]
+    empty_steps = [ins['step'] - 1 for ins in instruction_list if not ins['ingredients']]
+    merge_list = {}
+    for empty_step in empty_steps:
+        difference = [abs(empty_step - valid_step) for valid_step in valid_steps]
+        merge_list[valid_steps[difference.index(min(difference))]] = empty_step
+    new_instruction_list = copy.deepcopy(instruction_list)
+    merged_output = []
+    for i in range(len(instruction_list)):
+        if i in empty_steps:
+            continue
+        base_step = new_instruction_list[i]
+        if i in merge_list:
+            for field in ('primary_methods', 'other_methods', 'tools'):
+                base_step[field] = list(set(base_step[field] + new_instruction_list[merge_list[i]][field]))
+        if base_step not in merged_output:
+            merged_output.append(base_step)
+    return merged_output
+
+
+def output_steps_corpus(count, rng):
+    #  count steps, about a third of which don't mention an ingredient; never two of those in a row, and never the first
+    #  step, so each one has its own step to get merged into (quadratic_output_steps keeps only one per step)
+    instructions = []
+    for n in range(count):
+        empty = n > 0 and bool(instructions[-1]['ingredients']) and rng.random() < 0.5
+        instructions.append({'ingredients': [] if empty else rng.sample(['chicken', 'rice', 'onion', 'garlic', 'butter'], rng.choice([1, 2])),
+                             'parsed_tools': [rng.choice(['skillet', 'pot'])], 'inferred_tools': [],
+                             'primary_method': [rng.choice(['saute', 'bake'])], 'other_method': [rng.choice(['stir', 'drain'])],
+                             'cooking_time': ['{0} minutes'.format(n)]})
+    return instructions
+
+
+def benchmark_output_steps(num_steps=(10, 100, 1000), repeats=3):
+    #  merging the steps of longer and longer recipes, a third of whose steps don't mention an ingredient
+    import random
+    rng = random.Random(0)
+    print("Output step merging:")
+    for count in num_steps:
+        instructions = output_steps_corpus(count, rng)
+        before, now = quadratic_output_steps(instructions), rp.merge_output_steps(instructions)
+        #  the old merge kept the steps' original numbers, and renumbering them is all that's new
+        assert [step['step'] for step in now] == list(range(1, len(before) + 1))
+        for old_step, new_step in zip(before, now):
+            assert old_step['ingredients'] == new_step['ingredients'] and old_step['cooking_time'] == new_step['cooking_time']
+            for field in ('tools', 'primary_methods', 'other_methods'):
+                assert set(old_step[field]) == set(new_step[field]), "merge_output_steps has to merge the same steps"
+        old_time = time_call(lambda: quadratic_output_steps(instructions), repeats)
+        new_time = time_call(lambda: rp.merge_output_steps(instructions), repeats)
+        print("    {0} steps: {1:.2f} ms before, {2:.2f} ms now ({3:.1f}x)".format(count, old_time * 1000, new_time * 1000,
+                                                                               old_time / new_time))
+
+
+def random_method_steps(num_steps, rng):
+    #  random (parsed methods, tools) per step, drawn from the words the inference rules care about plus some noise
+    words = ['cook', 'skillet', 'oil', 'grill', 'pot', 'water', 'drain', 'stir', 'bowl', 'pan', 'g', 'rill']
+    return [(rng.sample(words, rng.randint(0, 3)), rng.sample(words, rng.randint(0, 3))) for _ in range(num_steps)]
+
+
+def long_recipe_directions(num_steps, rng):
+    #  num_steps direction lines for one long recipe: the sample directions, then made-up steps after them
+    directions = list(SAMPLE_DIRECTIONS)
+    while len(directions) < num_steps:
+        directions.append(synthetic_recipe(rng, len(directions))[2][0])
+    return directions
+
+
+def check_assembled_method_inference(num_steps=60, seed=0):
+    #  runs assemble_instruction_objects on a long recipe and checks every step's inferred methods against the old
+    #  quadratic loop (and the old infer_methods) fed the same parsed methods / tools
+    import random
+    dir_strings = long_recipe_directions(num_steps, random.Random(seed))
+    all_ingredients = rp.full_ingredients_list(rp.find_ingredients_objects(SAMPLE_INGREDIENTS))
+    instruction_objects = rp.assemble_instruction_objects(dir_strings, all_ingredients)
+    steps = [(list(instruction['parsed_methods']), list(instruction['parsed_tools']) + list(instruction['inferred_tools']))
+             for instruction in instruction_objects]
+    expected = quadratic_method_inference(steps)
+    for number, (instruction, methods) in enumerate(zip(instruction_objects, expected)):
+        assert sorted(instruction['inferred_methods']) == methods, \
+            "step {0}: inferred {1}, the old loop inferred {2}".format(number + 1, sorted(instruction['inferred_methods']), methods)
+    return len(instruction_objects)
+
+
+def benchmark_method_inference(num_steps=(10, 50, 200), num_recipes=200, repeats=3):
+    #  checks the incremental inference against the old quadratic loop, on a long parsed recipe and on long random
+    #  ones, then times both
+    import random
+    check_assembled_method_inference()
+    rng = random.Random(0)
+    for _ in range(num_recipes):
+        steps = random_method_steps(rng.choice(num_steps), rng)
+        assert quadratic_method_inference(steps) == incremental_method_inference(steps)
+    print("Method inference:")
+    for size in num_steps:
+        steps = random_method_steps(size, rng)
+        quadratic_time = time_call(lambda: quadratic_method_inference(steps), repeats)
+        incremental_time = time_call(lambda: incremental_method_inference(steps), repeats)
+        print("    {0:>4} steps: re-run {1:.2f} ms, incremental {2:.2f} ms".format(size, quadratic_time * 1000, incremental_time * 1000))
+
+
+def benchmark_rule_engine(rule_counts=(10, 100, 1000, 10000), repeats=3):
+    #  scanning every rule (the old infer_methods) vs. the word-indexed MethodRuleEngine, as the rule table grows
+    import random
+    rng = random.Random(0)
+    vocabulary = ['word{0}'.format(i) for i in range(2000)] + ['cook', 'skillet', 'oil', 'grill', 'pot', 'water', 'drain']
+    words = rng.sample(vocabulary, 40) + ['cook', 'skillet', 'oil', 'pot', 'water']
+    print("Method rule engine ({0} words per lookup):".format(len(words)))
+    for count in rule_counts:
+        rules = rp.load_method_rules() + [(tuple(rng.sample(vocabulary, rng.randint(1, 4))), 'method{0}'.format(i)) for i in range(count)]
+        engine = rp.MethodRuleEngine(rules)
+
+        def scan():
+            return [method for rule_words, method in engine.rules
+                    if len([word for word in words if word in rule_words]) == len(rule_words)]
+
+        def indexed():
+            return engine.infer(words)
+
+        assert sorted(scan()) == sorted(indexed())
+        scan_time = time_call(scan, repeats)
+        indexed_time = time_call(indexed, repeats)
+        print("    {0:>6} rules: scan {1:.3f} ms, indexed {2:.3f} ms".format(len(rules), scan_time * 1000, indexed_time * 1000))
+
+
+def recipe_page(title, ing_strings, dir_strings, filler_blocks=3000):
+    #  stand-in for a saved AllRecipes page: the recipe spans, plus a lot of the markup we don't care about
+    filler = '<div class="ad-slot"><a href="/recipes/"><img src="x.jpg"><p>Related recipes <b>you might like</b></p></a></div>'
+    ingredients = ''.join('<li><label><span class="recipe-ingred_txt added">{0}</span></label></li>'.format(line) for line in ing_strings)
+    directions = ''.join('<li><span class="recipe-directions__list--item">{0}</span></li>'.format(line) for line in dir_strings)
+    return ('<html><head><title>{0} Recipe - Allrecipes.com</title><script>var x = 1;</script></head><body>'.format(title)
+            + filler * (filler_blocks // 2) + '<ul>' + ingredients + '</ul><ol>' + directions + '</ol>'
+            + filler * (filler_blocks // 2) + '</body></html>').encode('utf-8')
+
+
+def sample_page(filler_blocks=3000):
+    return recipe_page('Cajun Chicken Pasta', SAMPLE_INGREDIENTS, SAMPLE_DIRECTIONS, filler_blocks)
+
+
+def measure(func):
+    #  (seconds, peak bytes allocated) for one call
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def benchmark_extraction(paths=None, repeats=3):
+    #  full BeautifulSoup tree vs. SoupStrainer'd extraction, on saved pages (paths) or the sample page
+    pages = []
+    for path in paths or []:
+        with open(path, 'rb') as page_file:
+            pages.append((path, page_file.read()))
+    if not pages:
+        pages = [('sample page', sample_page())]
+    print("HTML extraction:")
+    for name, page in pages:
+        assert rp.extract_recipe(page, fast=False) == rp.extract_recipe(page, fast=True)
+        full_time = time_call(lambda: rp.extract_recipe(page, fast=False), repeats)
+        fast_time = time_call(lambda: rp.extract_recipe(page, fast=True), repeats)
+        full_peak = measure(lambda: rp.extract_recipe(page, fast=False))[1]
+        fast_peak = measure(lambda: rp.extract_recipe(page, fast=True))[1]
+        print("    {0} ({1} KB): full tree {2:.1f} ms / {3:.2f} MB peak, strained {4:.1f} ms / {5:.2f} MB peak".format(
+            name, len(page) // 1024, full_time * 1000, full_peak / 1e6, fast_time * 1000, fast_peak / 1e6))
+
+
+def benchmark_crawler(num_recipes=40, concurrency=4, failing_attempts=2):
+    #  crawl_recipes against a local http.server with recipe_page pages: every 10th recipe (starting at 3) answers 503
+    #  failing_attempts times before it works, every 10th (starting at 7) is a 404. Checks the pages, the retries, that
+    #  the keep-alive connections get reused, and then that a second crawl with a stale PageCache only revalidates
+    import http.server
+    import random
+    import shutil
+    import tempfile
+    import threading
+    rng = random.Random(0)
+    pages = {recipe_id: recipe_page('Recipe {0}'.format(recipe_id), ing_strings, rng.sample(SAMPLE_DIRECTIONS, 4), 300)
+             for recipe_id, ing_strings in enumerate(ingredient_corpus(num_recipes, rng))}
+    requests = {}
+    counts = {'connections': 0, 'not_modified': 0}
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'   # keep-alive
+
+        def setup(self):
+            with lock:
+                counts['connections'] += 1
+            http.server.BaseHTTPRequestHandler.setup(self)
+
+        def do_GET(self):
+            recipe_id = int(self.path.strip('/').split('/')[-1])
+            etag = '"{0}"'.format(recipe_id)
+            with lock:
+                requests[recipe_id] = requests.get(recipe_id, 0) + 1
+                attempt = requests[recipe_id]
+            if recipe_id % 10 == 7:
+                self.reply(404, b'not found')
+            elif recipe_id % 10 == 3 and attempt <= failing_attempts:
+                self.reply(503, b'try again')
+            elif self.headers.get('If-None-Match') == etag:
+                with lock:
+                    counts['not_modified'] += 1
+                self.reply(304, b'', etag)
+            else:
+                self.reply(200, pages[recipe_id], etag)
+
+        def reply(self, status, body, etag=None):
+            self.send_response(status)
+            if etag is not None:
+                self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:{0}'.format(server.server_port)
+    cache_dir = tempfile.mkdtemp()
+    options = {'base_url': base_url, 'concurrency': concurrency, 'requests_per_second': 1000, 'retries': failing_attempts,
+               'backoff': 0.01, 'cache': rp.PageCache(cache_dir, ttl=0)}
+    try:
+        start = time.perf_counter()
+        results = rp.crawl_recipes(range(num_recipes), **options)
+        crawl_time = time.perf_counter() - start
+        assert sorted(result['source'] for result in results) == list(range(num_recipes))
+        for result in results:
+            recipe_id = result['source']
+            if recipe_id % 10 == 7:
+                assert 'HTTP 404' in result['error'] and result['recipe'] is None
+                assert requests[recipe_id] == result['network']['attempts'] == 1, "404s don't get retried"
+            else:
+                assert result['error'] is None, result['error']
+                assert result['recipe'] == rp.extract_recipe(pages[recipe_id])
+                expected = failing_attempts + 1 if recipe_id % 10 == 3 else 1
+                assert requests[recipe_id] == result['network']['attempts'] == expected
+        total_requests = sum(requests.values())
+        assert counts['connections'] <= concurrency < total_requests, "keep-alive connections should get reused"
+        first_connections = counts['connections']
+
+        fetched = sum(1 for recipe_id in pages if recipe_id % 10 != 7)
+        options['cache'].close()
+        options['cache'] = rp.PageCache(cache_dir, ttl=0)      # everything in it is stale straight away
+        start = time.perf_counter()
+        revalidated = rp.crawl_recipes(range(num_recipes), **options)
+        revalidate_time = time.perf_counter() - start
+        assert [result['recipe'] for result in sorted(revalidated, key=lambda result: result['source'])] == \
+               [result['recipe'] for result in sorted(results, key=lambda result: result['source'])]
+        assert options['cache'].stats['revalidated'] == counts['not_modified'] == fetched
+        assert all(result['network']['cache'] == 'revalidated' for result in revalidated if result['error'] is None)
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(cache_dir)
+    print("Crawler ({0} pages from a local server, {1} workers):".format(num_recipes, concurrency))
+    print("    {0:.0f} pages/s, {1} requests over {2} connections".format(num_recipes / crawl_time, total_requests, first_connections))
+    print("    stale cache: {0:.0f} pages/s, {1} revalidated with a 304".format(num_recipes / revalidate_time, counts['not_modified']))
+
+
+def benchmark_page_cache(num_pages=2000, page_bytes=2048, keep=100):
+    #  stores num_pages pages (every 5th one a copy of an earlier page) into a PageCache with room for about keep of
+    #  them; checks that the pages fit, that the page files on disk are exactly the ones still pointed at, and that
+    #  reopening the cache after close() sees the same index
+    import os
+    import random
+    import shutil
+    import tempfile
+    rng = random.Random(0)
+    pages = []
+    for number in range(num_pages):
+        if number % 5 == 4:
+            pages.append(pages[rng.randrange(len(pages))])
+        else:
+            pages.append('{0}:'.format(number).encode() + bytes(rng.getrandbits(8) for _ in range(page_bytes)))
+    cache_dir = tempfile.mkdtemp()
+    try:
+        cache = rp.PageCache(cache_dir, max_bytes=keep * page_bytes)
+        start = time.perf_counter()
+        for number, page in enumerate(pages):
+            cache.store('https://www.allrecipes.com/recipe/{0}/'.format(number), page)
+            if number % 3 == 0:
+                cache.lookup('https://www.allrecipes.com/recipe/{0}/'.format(number // 2))
+        store_time = time.perf_counter() - start
+        assert cache.total_bytes <= cache.max_bytes
+        on_disk = sorted(name[:-len('.html')] for name in os.listdir(os.path.join(cache_dir, 'pages')))
+        assert on_disk == sorted(set(entry['digest'] for entry in cache.index.values())) == sorted(cache.references)
+        cache.close()
+        reopened = rp.PageCache(cache_dir, max_bytes=keep * page_bytes)
+        assert reopened.index == cache.index
+        assert reopened.total_bytes == cache.total_bytes
+    finally:
+        shutil.rmtree(cache_dir)
+    print("Page cache ({0} stores, room for ~{1} pages):".format(num_pages, keep))
+    print("    {0:.3f} ms per store, {1} evictions, {2} pages kept".format(store_time / num_pages * 1000, cache.stats['evictions'], len(cache.index)))
+
+
+def warmup_run(warm, num_recipes, processes, results):
+    #  runs in a fresh process, so that nothing is loaded yet when the pool gets made
+    page = sample_page(200)
+    start = time.perf_counter()
+    with rp.make_worker_pool(processes, warm) as pool:
+        pool.submit(rp.process_page, page, ()).result()
+        first_result = time.perf_counter() - start
+        batch_start = time.perf_counter()
+        list(pool.map(rp.process_page, [page] * num_recipes, [()] * num_recipes))
+        per_recipe = (time.perf_counter() - batch_start) / num_recipes
+    results.put((warm, first_result, per_recipe))
+
+
+def benchmark_worker_warmup(num_recipes=40, processes=4):
+    #  time to the first result, and then per-recipe latency, for each way of getting the NLTK models into the workers
+    import multiprocessing
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    print("Worker warm-up ({0} processes, {1} recipes):".format(processes, num_recipes))
+    for warm in rp.WARM_MODES:
+        runner = context.Process(target=warmup_run, args=(warm, num_recipes, processes, results))
+        runner.start()
+        warm, first_result, per_recipe = results.get()
+        runner.join()
+        print("    {0:<12} first result {1:.0f} ms, then {2:.1f} ms/recipe".format(warm, first_result * 1000, per_recipe * 1000))
+
+
+SCRIPT = rp.__file__
+
+
+def time_until_output(command, marker, stdin_data=None):
+    #  seconds from launching command until marker shows up in its output
+    import subprocess
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if stdin_data is not None:
+        process.stdin.write(stdin_data)
+        process.stdin.close()
+    seen = b''
+    while marker not in seen:
+        char = process.stdout.read(1)
+        if not char:
+            break
+        seen += char
+    elapsed = time.perf_counter() - start
+    process.kill()
+    process.wait()
+    return elapsed
+
+
+def benchmark_startup(repeats=3):
+    #  time to the interactive prompt, and to the first batch result for a saved page (no network involved)
+    import os
+    import subprocess
+    import sys
+    import tempfile
+    imported = subprocess.check_output([sys.executable, '-c', 'import sys; sys.path.insert(0, {0!r}); import recipe_parser_final; '
+                                        'print(" ".join(m for m in ("nltk", "bs4", "urllib.request", "http.client", "asyncio") '
+                                        'if m in sys.modules) or "none")'.format(os.path.dirname(SCRIPT))]).decode().strip()
+    with tempfile.NamedTemporaryFile(suffix='.html', delete=False) as page_file:
+        page_file.write(sample_page(200))
+    try:
+        first_prompt = min(time_until_output([sys.executable, '-u', SCRIPT], b'Enter a URL') for _ in range(repeats))
+        first_result = min(time_until_output([sys.executable, SCRIPT, '--batch', '-', '-j', '1', '--warm', 'none'], b'\n',
+                                             (page_file.name + '\n').encode()) for _ in range(repeats))
+    finally:
+        os.remove(page_file.name)
+    print("Startup:")
+    print("    heavy modules imported by 'import recipe_parser_final': {0}".format(imported))
+    print("    time to first prompt: {0:.0f} ms".format(first_prompt * 1000))
+    print("    time to first result (saved page, batch mode): {0:.0f} ms".format(first_result * 1000))
+
+
+#  Word lists for synthetic_recipe; picked so that every transform has something to change in most recipes
+SYNTHETIC_PROTEINS = ['chicken breast', 'ground beef', 'pork chops', 'salmon fillets', 'shrimp', 'bacon', 'tofu', 'lamb',
+                      'turkey', 'eggs']
+SYNTHETIC_PRODUCE = ['onion', 'garlic', 'green bell pepper', 'mushrooms', 'tomatoes', 'carrots', 'zucchini', 'spinach',
+                     'broccoli', 'potatoes', 'cabbage', 'lettuce']
+SYNTHETIC_PANTRY = ['butter', 'olive oil', 'vegetable oil', 'heavy cream', 'sour cream', 'milk', 'all-purpose flour',
+                    'white sugar', 'brown sugar', 'soy sauce', 'cheddar cheese', 'chicken broth', 'rice', 'linguine pasta']
+SYNTHETIC_SPICES = ['salt', 'ground black pepper', 'cumin', 'dried basil', 'oregano', 'paprika', 'Cajun seasoning',
+                    'cayenne pepper', 'curry powder', 'garlic powder']
+SYNTHETIC_UNITS = ['cup', 'cups', 'tablespoons', 'teaspoon', 'teaspoons', 'ounces', 'pound', 'pounds']
+SYNTHETIC_PREPARATIONS = ['chopped', 'sliced', 'minced', 'diced', 'cut into 1 inch pieces', 'softened']
+SYNTHETIC_STEPS = ["Preheat oven to {temp} degrees F.",
+                   "Heat {fat} in a large skillet over medium heat. Add {protein} and cook until browned, about {minutes} minutes.",
+                   "Bring a large pot of lightly salted water to a boil. Add {starch} and cook for {minutes} minutes; drain.",
+                   "Stir in {produce} and {produce2}; saute until tender.",
+                   "In a bowl, whisk together {pantry}, {spice} and {spice2}.",
+                   "Pour the sauce over the {protein} and bake in the preheated oven for {minutes} minutes.",
+                   "Reduce heat, cover, and simmer for {minutes} minutes, stirring occasionally.",
+                   "Season with {spice} and {spice2}. Serve over {starch}."]
+
+
+def synthetic_recipe(rng, number):
+    #  (title, ingredient lines, direction lines) for a made-up but AllRecipes-shaped recipe
+    protein = rng.choice(SYNTHETIC_PROTEINS)
+    produce = rng.sample(SYNTHETIC_PRODUCE, rng.randint(2, 5))
+    pantry = rng.sample(SYNTHETIC_PANTRY, rng.randint(3, 6))
+    spices = rng.sample(SYNTHETIC_SPICES, rng.randint(2, 5))
+    ing_strings = ["{0} {1} {2}".format(rng.randint(1, 3), rng.choice(SYNTHETIC_UNITS), protein)]
+    for name in produce:
+        ing_strings.append("{0} {1}, {2}".format(rng.choice(['1', '2', '1/2', '3']), name, rng.choice(SYNTHETIC_PREPARATIONS)))
+    for name in pantry:
+        ing_strings.append("{0} {1} {2}".format(rng.choice(['1', '2', '1/2', '1/4', '3/4']), rng.choice(SYNTHETIC_UNITS), name))
+    for name in spices:
+        ing_strings.append("{0} teaspoon {1}".format(rng.choice(['1', '1/2', '1/4', '1/8']), name))
+    names = {'protein': protein, 'produce': produce[0], 'produce2': produce[-1], 'pantry': pantry[0], 'spice': spices[0],
+             'spice2': spices[-1], 'fat': rng.choice(['butter', 'olive oil', 'vegetable oil']),
+             'starch': rng.choice(['rice', 'linguine pasta', 'potatoes'])}
+    dir_strings = [step.format(temp=rng.choice([350, 375, 400]), minutes=rng.randint(5, 45), **names)
+                   for step in rng.sample(SYNTHETIC_STEPS, rng.randint(3, 6))]
+    return "Synthetic {0} Recipe {1}".format(protein.title(), number), ing_strings, dir_strings
+
+
+def write_fixture_pages(directory, count=3, seed=0):
+    #  the pages committed in fixtures/: full-size recipe_page pages, the sample recipe and then synthetic ones
+    import os
+    import random
+    rng = random.Random(seed)
+    recipes = [('Cajun Chicken Pasta', SAMPLE_INGREDIENTS, SAMPLE_DIRECTIONS)]
+    while len(recipes) < count:
+        recipes.append(synthetic_recipe(rng, len(recipes)))
+    os.makedirs(directory, exist_ok=True)
+    for number, (title, ing_strings, dir_strings) in enumerate(recipes[:count]):
+        with open(os.path.join(directory, 'recipe_{0}.html'.format(number)), 'wb') as page_file:
+            page_file.write(recipe_page(title, ing_strings, dir_strings))
+
+
+def stage_corpus(num_recipes, fixture_pages=(), seed=0):
+    #  [(page, title, ing_strings, dir_strings), ...]: the saved pages first, then synthetic recipes up to num_recipes
+    import random
+    rng = random.Random(seed)
+    corpus = []
+    for page in fixture_pages:
+        ing_strings, dir_strings, title = rp.extract_recipe(page)
+        corpus.append((page, title, ing_strings, dir_strings))
+    while len(corpus) < num_recipes:
+        title, ing_strings, dir_strings = synthetic_recipe(rng, len(corpus))
+        corpus.append((recipe_page(title, ing_strings, dir_strings, 200), title, ing_strings, dir_strings))
+    return corpus
+
+
+def stage_runners(corpus):
+    #  (stage name, what gets counted, function running the stage over the whole corpus); the inputs of every stage
+    #  are worked out up front, so each one is timed on its own
+    import contextlib
+    import os
+    import random
+    lines = [line for page, title, ing_strings, dir_strings in corpus for line in ing_strings]
+    directions = [line for page, title, ing_strings, dir_strings in corpus for line in dir_strings]
+    parsed = []
+    for page, title, ing_strings, dir_strings in corpus:
+        ingredients = rp.find_ingredients_objects(ing_strings)
+        all_ingredients = rp.full_ingredients_list(ingredients)
+        parsed.append((ingredients, all_ingredients, dir_strings, rp.assemble_instruction_objects(dir_strings, all_ingredients)))
+    direction_ingredients = [(line, all_ingredients) for ingredients, all_ingredients, dir_strings, instructions in parsed
+                             for line in dir_strings]
+
+    def extraction():
+        for page, title, ing_strings, dir_strings in corpus:
+            rp.extract_recipe(page)
+
+    def ingredient_parsing():
+        cache, rp.ingredient_cache = rp.ingredient_cache, None      # the parsing itself, not the memoized parses
+        try:
+            for line in lines:
+                rp.parse_ingredient(line)
+        finally:
+            rp.ingredient_cache = cache
+
+    def tools():
+        for line in directions:
+            rp.parse_tools(line)
+            rp.infer_tools(line)
+
+    def methods():
+        for line, all_ingredients in direction_ingredients:
+            rp.parse_methods(line, all_ingredients)
+
+    def instruction_objects():
+        for ingredients, all_ingredients, dir_strings, instructions in parsed:
+            rp.assemble_instruction_objects(dir_strings, all_ingredients)
+
+    def transform(function):
+        #  south-asian / italian trip over some recipes (see analyze_recipe); run.skipped says how many, so the
+        #  rate isn't taken for more than it is
+        def run():
+            random.seed(0)
+            skipped = 0
+            for ingredients, all_ingredients, dir_strings, instructions in parsed:
+                try:
+                    function(ingredients, instructions)
+                except IndexError:
+                    skipped += 1
+            run.skipped = skipped
+        run.skipped = 0
+        return run
+
+    def output_steps():
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for ingredients, all_ingredients, dir_strings, instructions in parsed:
+                rp.generate_output_steps(instructions)
+
+    runners = [('extraction', 'pages', len(corpus), extraction),
+               ('parse_ingredient', 'lines', len(lines), ingredient_parsing),
+               ('parse_tools+infer_tools', 'steps', len(directions), tools),
+               ('parse_methods', 'steps', len(directions), methods),
+               ('assemble_instruction_objects', 'recipes', len(corpus), instruction_objects)]
+    for name, function in sorted(rp.TRANSFORMS.items()):
+        runners.append(('transform: ' + name, 'recipes', len(corpus), transform(function)))
+    runners.append(('generate_output_steps', 'recipes', len(corpus), output_steps))
+    return runners
+
+
+def benchmark_stages(sizes=(25, 100, 400), fixture_pages=(), repeats=3):
+    #  {size: {stage: {'per_second', 'unit', 'peak_mb'}}}, printed as it goes; see compare_to_baseline
+    results = {}
+    for size in sizes:
+        corpus = stage_corpus(size, fixture_pages)
+        print("Stages ({0} recipes, {1} of them saved pages):".format(len(corpus), min(len(fixture_pages), len(corpus))))
+        results[str(size)] = {}
+        for name, unit, count, run in stage_runners(corpus):
+            elapsed = time_call(run, repeats)
+            peak = measure(run)[1]
+            results[str(size)][name] = {'per_second': round(count / elapsed, 1), 'unit': unit, 'peak_mb': round(peak / 1e6, 3)}
+            skipped = getattr(run, 'skipped', 0)
+            if skipped:
+                results[str(size)][name]['skipped'] = skipped
+            print("    {0:30} {1:10.0f} {2}/s {3:8.2f} MB peak{4}".format(
+                name, count / elapsed, unit, peak / 1e6, " ({0} skipped: IndexError)".format(skipped) if skipped else ""))
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25):
+    #  [message, ...] for every stage that got more than tolerance slower, or needed more than tolerance more memory
+    regressions = []
+    for size, stages in sorted(results.items()):
+        for name, result in sorted(stages.items()):
+            before = baseline.get(size, {}).get(name)
+            if before is None:
+                continue
+            if result['per_second'] < before['per_second'] * (1 - tolerance):
+                regressions.append("{0} recipes, {1}: {2} {3}/s, baseline {4}".format(
+                    size, name, result['per_second'], result['unit'], before['per_second']))
+            #  small peaks are mostly noise, so memory only counts once it's over a megabyte
+            if result['peak_mb'] > max(before['peak_mb'] * (1 + tolerance), 1.0):
+                regressions.append("{0} recipes, {1}: {2} MB peak, baseline {3} MB".format(
+                    size, name, result['peak_mb'], before['peak_mb']))
+    return regressions
+
+
+def run_stage_suite(argv):
+    '''
+    python benchmarks.py --stages [--sizes 25 100 400] [--fixtures DIR] [--baseline FILE] [--save-baseline] [--tolerance 0.25]
+    Times every stage on its own over corpora of growing size (the saved .html pages in --fixtures, then synthetic
+    recipes); exits with status 1 and lists every stage that regressed against the baseline file, or if there isn't
+    one. Baselines are per machine, so make one with --save-baseline before changing anything.
+    The pages in fixtures/ come from write_fixture_pages
+    '''
+    import argparse
+    import glob
+    import json
+    import os
+    import sys
+    parser = argparse.ArgumentParser(prog='benchmarks.py --stages')
+    parser.add_argument('--stages', action='store_true')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[25, 100, 400])
+    parser.add_argument('--fixtures', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures'),
+                        help="directory of saved AllRecipes .html pages (default: fixtures/ next to this file)")
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help="write the results to --baseline instead of comparing")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args(argv)
+    fixture_pages = []
+    for path in sorted(glob.glob(os.path.join(args.fixtures, '*.html'))):
+        with open(path, 'rb') as page_file:
+            fixture_pages.append(page_file.read())
+    rp.preload_models()
+    results = benchmark_stages(args.sizes, fixture_pages, args.repeats)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=1, sort_keys=True)
+        print("baseline saved to " + args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print("no baseline at {0}; run with --save-baseline first".format(args.baseline), file=sys.stderr)
+        return 1
+    with open(args.baseline) as baseline_file:
+        regressions = compare_to_baseline(results, json.load(baseline_file), args.tolerance)
+    if regressions:
+        print("REGRESSIONS against {0} (more than {1:.0%} worse):".format(args.baseline, args.tolerance), file=sys.stderr)
+        for regression in regressions:
+            print("    " + regression, file=sys.stderr)
+        return 1
+    print("no regressions against " + args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    if '--stages' in sys.argv[1:]:
+        sys.exit(run_stage_suite(sys.argv[1:]))
+    benchmark_ingredient_parsing()
+    benchmark_ingredient_cache()
+    benchmark_record_memory()
+    benchmark_transforms()
+    benchmark_transform_throughput()
+    benchmark_transform_all()
+    benchmark_dump_streaming()
+    benchmark_service()
+    benchmark_instrumentation()
+    benchmark_instruction_tokenization()
+    benchmark_recipe_analysis()
+    benchmark_lexicon_matching()
+    benchmark_ingredient_mentions()
+    benchmark_method_inference()
+    benchmark_output_steps()
+    benchmark_rendering()
+    benchmark_rule_engine()
+    benchmark_extraction(sys.argv[1:])
+    benchmark_crawler()
+    benchmark_page_cache()
+    benchmark_worker_warmup()
+    benchmark_startup()
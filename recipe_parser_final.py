@@ -34,14 +34,24 @@ For not healthy to healthy, can use the following food 'hacks':
     - https://www.swansonvitamins.com/blog/natural-health-tips/food-replacement-hacks
 """
 
-from bs4 import BeautifulSoup
-import urllib.request
-from nltk import pos_tag, word_tokenize,sent_tokenize
+#  Only the light standard library modules get imported up front; NLTK, BeautifulSoup, the network modules (urllib.request,
+#  http.client, asyncio) etc. get imported the first time something needs them, so starting up (and running offline
+#  from saved / cached pages) doesn't pay for what it doesn't use
+import bisect
+import collections
+import collections.abc
 import copy
+import hashlib
+import itertools
+import json
+import math
+import os
+import re
 import string
 import sys
-from nltk.stem.porter import *
-import random
+import threading
+import time
+import urllib.parse
 #   For now, the URL has to be manually changed here
 #   Ideally by the end we'll have some walkthrough / user input interface which will be nicer
 # set_url = "https://www.allrecipes.com/recipe/242314/browned-butter-banana-bread/"
@@ -50,23 +60,515 @@ import random
 # set_url ='https://www.allrecipes.com/recipe/16669/fried-chicken-tenders/?internalSource=staff%20pick&referringId=650&referringContentType=recipe%20hub'
 # set_url = 'https://www.allrecipes.com/recipe/8970/millie-pasquinellis-fried-chicken/?internalSource=hub%20recipe&referringId=650&referringContentType=recipe%20hub'
 set_url = "https://www.allrecipes.com/recipe/8778/cajun-chicken-pasta/?internalSource=staff%20pick&referringId=1981&referringContentType=recipe%20hub"
-def fetch_page(link):
+#  NLTK's models (the perceptron tagger and punkt) take a while to load, so they get loaded once per process and kept
+_tagger = None
+_word_tokenize = None
+
+def get_tagger():
+    #  older NLTK versions' pos_tag builds (and loads) a new PerceptronTagger on every single call
+    global _tagger
+    if _tagger is None:
+        from nltk.tag.perceptron import PerceptronTagger
+        _tagger = PerceptronTagger()
+    return _tagger
+
+def word_tokenize(text):
+    global _word_tokenize
+    if _word_tokenize is None:
+        from nltk import word_tokenize as _word_tokenize
+    return _word_tokenize(text)
+
+def pos_tag(tokens):
+    return get_tagger().tag(tokens)
+
+def pos_tag_sents(sentences, tag_batcher=None):
+    #  tag_batcher: the HTTP service's TagBatcher, so that the tagging for concurrent requests gets merged into one call
+    if tag_batcher is not None:
+        return tag_batcher.tag_sents(sentences)
+    return tag_sentences(sentences)
+
+def tag_sentences(sentences):
+    tagger = get_tagger()
+    return [tagger.tag(tokens) for tokens in sentences]
+
+def preload_models():
+    #  loads the tagger and the punkt tokenizer model up front, instead of on the first recipe; returns how long it took
+    start = time.perf_counter()
+    get_tagger()
+    word_tokenize("Preheat the oven. Add the flour.")
+    return time.perf_counter() - start
+
+WARM_MODES = ['none', 'initializer', 'fork']
+
+def worker_started():
+    return os.getpid()
+
+def start_worker(preload, instrument):
+    #  initializer for make_worker_pool's worker processes
+    if preload:
+        preload_models()
+    if instrument:
+        enable_instrumentation()
+
+def make_worker_pool(processes=None, warm='fork', instrument=False):
+    #  Process pool for the batch mode, with the NLTK models already loaded in the workers:
+    #      - 'initializer': every worker process loads the models once when it starts, and keeps them for its lifetime
+    #      - 'fork': the models get loaded here, and the workers are forked afterwards, so they all share the parent's
+    #                copy (copy-on-write); only on platforms that have fork, otherwise this is the same as 'initializer'
+    #      - 'none': each worker loads the models whenever its first recipe needs them
+    #  instrument: turn instrumentation on in every worker (see enable_instrumentation), so each record has its trace
+    import concurrent.futures
+    import multiprocessing
+    if warm == 'fork' and 'fork' in multiprocessing.get_all_start_methods():
+        preload_models()
+        pool = concurrent.futures.ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('fork'),
+                                                      initializer=start_worker, initargs=(False, instrument))
+        #  the workers only get forked on the first submit; that has to happen now, before the batch mode starts the
+        #  crawler's threads, or a worker could inherit a lock one of them was holding
+        concurrent.futures.wait([pool.submit(worker_started) for _ in range(0, processes or os.cpu_count() or 1)])
+        return pool
+    return concurrent.futures.ProcessPoolExecutor(processes, initializer=start_worker,
+                                                  initargs=(warm in ('fork', 'initializer'), instrument))
+
+def fetch_page(link, cache=None):
+    #  cache is an optional PageCache; without one the page always gets downloaded
+    if cache is not None:
+        return extract_recipe(cache.fetch(link))
+    import urllib.request
     with urllib.request.urlopen(link) as url:
-        s = url.read()
+        return extract_recipe(url.read())
+
+def extract_recipe(s, fast=True):
+    # Pulls [ingredients, directions, title] out of an AllRecipes page's HTML
+    # Everything we want is in a <span> or the <title>, so by default the parser only builds those into the tree
+    # (SoupStrainer) and skips the rest of the page; fast=False builds the whole page like we used to
+    from bs4 import BeautifulSoup, SoupStrainer
+    if fast:
+        soup = BeautifulSoup(s, "lxml", parse_only=SoupStrainer(["span", "title"]))
+    else:
         soup = BeautifulSoup(s, "lxml")
-        
-        # Fetch ingredients
-        ing_spans = soup.findAll("span", {"class": "recipe-ingred_txt added"})
-        ing_strings = [span.text for span in ing_spans]
     
-        # Fetch directions
-        dir_spans = soup.findAll("span", {"class": "recipe-directions__list--item"})
-        dir_strings = [span.text for span in dir_spans]
-        
-        # Fetch title
-        title = soup.find("title").text
-        
-        return [ing_strings, dir_strings, title]
+    # Fetch ingredients
+    ing_spans = soup.findAll("span", {"class": "recipe-ingred_txt added"})
+    ing_strings = [span.text for span in ing_spans]
+
+    # Fetch directions
+    dir_spans = soup.findAll("span", {"class": "recipe-directions__list--item"})
+    dir_strings = [span.text for span in dir_spans]
+    
+    # Fetch title
+    title = soup.find("title").text
+    
+    return [ing_strings, dir_strings, title]
+
+def recipe_cache_key(link):
+    #  AllRecipes URLs come with all sorts of slugs / query strings (see set_url), but the recipe ID is what matters
+    match = re.search(r'/recipe/(\d+)', link)
+    if match:
+        return 'allrecipes:' + match.group(1)
+    parts = urllib.parse.urlsplit(link)
+    return urllib.parse.urlunsplit((parts.scheme, parts.netloc.lower(), parts.path.rstrip('/'), '', ''))
+
+class PageCacheMiss(LookupError):
+    pass
+
+class PageCache:
+    '''
+    On-disk cache of fetched pages, so re-processing recipes after a lexicon change doesn't re-download them.
+    Pages are keyed by recipe_cache_key(link), and stored content-addressed (pages/<sha256>.html), with index.json
+    keeping track of each key's page, ETag / Last-Modified, and when it was fetched / last used.
+        - ttl: pages older than this get revalidated with a conditional request (a 304 just refreshes the entry)
+        - max_bytes: once the pages take up more than this, the least recently used ones get evicted
+        - offline: never touch the network; anything cached gets returned no matter how old, anything else is a miss
+    stats has hit / miss / revalidation / eviction counters.
+    The keys are kept in an OrderedDict in least-recently-used order, with a count of how many keys point at each page
+    and the pages' total size, so a store only evicts (oldest first) when the total goes over max_bytes.
+    index.json gets rewritten every 100 changes and on close(), not on every store
+    '''
+    def __init__(self, directory, ttl=7 * 24 * 3600, max_bytes=512 * 1024 * 1024, offline=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'refetched': 0, 'evictions': 0}
+        self.lock = threading.Lock()
+        self.unsaved_changes = 0
+        os.makedirs(os.path.join(directory, 'pages'), exist_ok=True)
+        self.index_path = os.path.join(directory, 'index.json')
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                self.index = json.load(index_file)
+        self.recently_used = collections.OrderedDict((key, None) for key in sorted(self.index, key=lambda key: self.index[key]['accessed']))
+        self.references = {}    # digest --> how many keys point at that page
+        self.total_bytes = 0
+        for entry in self.index.values():
+            self.add_reference(entry)
+
+    def page_path(self, digest):
+        return os.path.join(self.directory, 'pages', digest + '.html')
+
+    def save_index(self):
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w') as index_file:
+            json.dump(self.index, index_file)
+        os.replace(temp_path, self.index_path)
+        self.unsaved_changes = 0
+
+    def changed(self):
+        #  access times only matter for eviction, and a lost store just means downloading that page again,
+        #  so the index doesn't get saved every time
+        self.unsaved_changes += 1
+        if self.unsaved_changes >= 100:
+            self.save_index()
+
+    def add_reference(self, entry):
+        count = self.references.get(entry['digest'], 0)
+        if count == 0:
+            self.total_bytes += entry['size']
+        self.references[entry['digest']] = count + 1
+
+    def drop_reference(self, entry):
+        #  the page file only goes once no key points at it anymore
+        count = self.references[entry['digest']] - 1
+        if count:
+            self.references[entry['digest']] = count
+            return
+        del self.references[entry['digest']]
+        self.total_bytes -= entry['size']
+        if os.path.exists(self.page_path(entry['digest'])):
+            os.remove(self.page_path(entry['digest']))
+
+    def lookup(self, link, allow_stale=False, count_hit=True):
+        #  the cached page if there's a usable one, otherwise None
+        with self.lock:
+            entry = self.index.get(recipe_cache_key(link))
+            if entry is None or not (allow_stale or self.offline or time.time() - entry['fetched'] < self.ttl):
+                return None
+            with open(self.page_path(entry['digest']), 'rb') as page_file:
+                page = page_file.read()
+            entry['accessed'] = time.time()
+            self.recently_used.move_to_end(recipe_cache_key(link))
+            if count_hit:
+                self.stats['hits'] += 1
+            self.changed()
+            return page
+
+    def store(self, link, page, etag=None, last_modified=None):
+        with self.lock:
+            digest = hashlib.sha256(page).hexdigest()
+            if not os.path.exists(self.page_path(digest)):
+                with open(self.page_path(digest), 'wb') as page_file:
+                    page_file.write(page)
+            now = time.time()
+            key = recipe_cache_key(link)
+            entry = {'digest': digest, 'size': len(page), 'etag': etag, 'last_modified': last_modified, 'fetched': now, 'accessed': now}
+            self.add_reference(entry)   # before dropping the old entry, in case it's the same page
+            if key in self.index:
+                self.drop_reference(self.index[key])
+            self.index[key] = entry
+            self.recently_used[key] = None
+            self.recently_used.move_to_end(key)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+            self.changed()
+
+    def evict(self):
+        #  least recently used first, until the pages fit in max_bytes again
+        while self.total_bytes > self.max_bytes and self.recently_used:
+            key, _ = self.recently_used.popitem(last=False)
+            self.drop_reference(self.index.pop(key))
+            self.stats['evictions'] += 1
+
+    def count(self, stat):
+        #  stats get updated from the crawler's threads too
+        with self.lock:
+            self.stats[stat] += 1
+
+    def validators(self, link):
+        #  headers for a conditional request revalidating link's (stale) entry; None if link isn't cached at all
+        with self.lock:
+            entry = self.index.get(recipe_cache_key(link))
+            if entry is None:
+                return None
+            headers = {}
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers
+
+    def revalidated(self, link):
+        #  after a 304: the entry counts as freshly fetched again; gives back the cached page
+        with self.lock:
+            entry = self.index.get(recipe_cache_key(link))
+            if entry is None:
+                return None
+            entry['fetched'] = time.time()
+            self.stats['revalidated'] += 1
+        return self.lookup(link, allow_stale=True, count_hit=False)
+
+    def check(self, link, network=None):
+        #  the cache's part in getting link, before any download: (page, None) if there's a usable cached page,
+        #  otherwise (None, validators for revalidating a stale entry, or None if link isn't cached). Counts the miss
+        #  (a stale entry only counts once it turns out to need a whole new download), and raises PageCacheMiss in
+        #  offline mode. network (RecipeCrawler.crawl_one's timing dict) gets its 'cache' set to 'hit' / 'miss'
+        page = self.lookup(link)
+        if network is not None:
+            network['cache'] = 'miss' if page is None else 'hit'
+        if page is not None:
+            return page, None
+        validators = self.validators(link)
+        if validators is None or self.offline:
+            self.count('misses')
+        if self.offline:
+            raise PageCacheMiss("not cached (offline mode): " + link)
+        return None, validators
+
+    def fetch(self, link):
+        page = self.lookup(link)
+        if page is not None:
+            return page
+        headers = self.validators(link)
+        if self.offline:
+            self.count('misses')
+            raise PageCacheMiss("not cached (offline mode): " + link)
+        import urllib.error
+        import urllib.request
+        request = urllib.request.Request(link, headers=headers or {})
+        try:
+            with urllib.request.urlopen(request) as url:
+                page = url.read()
+                etag, last_modified = url.headers.get('ETag'), url.headers.get('Last-Modified')
+        except urllib.error.HTTPError as error:
+            if error.code != 304 or headers is None:
+                raise
+            return self.revalidated(link)
+        self.count('misses' if headers is None else 'refetched')
+        self.store(link, page, etag, last_modified)
+        return page
+
+    def close(self):
+        with self.lock:
+            self.save_index()
+
+ALLRECIPES_URL = "https://www.allrecipes.com"
+
+def recipe_url(recipe_id, base_url=ALLRECIPES_URL):
+    return "{0}/recipe/{1}/".format(base_url.rstrip('/'), recipe_id)
+
+def source_kind(source):
+    #  what a batch source is: 'id' (an AllRecipes recipe ID), 'url', or 'path' (a saved page) for anything else
+    if isinstance(source, int) or str(source).isdigit():
+        return 'id'
+    if re.match(r'[A-Za-z][A-Za-z0-9+.-]*://', source):
+        return 'url'
+    return 'path'
+
+def recipe_id_range(start, stop, base_url=ALLRECIPES_URL):
+    for recipe_id in range(start, stop):
+        yield recipe_url(recipe_id, base_url)
+
+class HostConnectionPool:
+    '''
+    Keep-alive http.client connections, kept per (scheme, host, port) so that crawling a site reuses the same
+    handful of connections instead of opening a new one for every page like urlopen does.
+    Used from the crawler's worker threads, hence the lock
+    '''
+    def __init__(self, max_idle_per_host=8, timeout=15):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.connections_opened = 0
+
+    def acquire(self, scheme, host, port):
+        with self.lock:
+            idle = self.idle.get((scheme, host, port))
+            if idle:
+                return idle.pop()
+            self.connections_opened += 1
+        import http.client
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def release(self, scheme, host, port, connection, reusable=True):
+        if reusable:
+            with self.lock:
+                idle = self.idle.setdefault((scheme, host, port), [])
+                if len(idle) < self.max_idle_per_host:
+                    idle.append(connection)
+                    return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            for idle in self.idle.values():
+                for connection in idle:
+                    connection.close()
+            self.idle = {}
+
+class CrawlError(Exception):
+    pass
+
+class RecipeCrawler:
+    '''
+    Bulk version of fetch_page: fetches lots of recipe pages concurrently with asyncio, and hands each page off to
+    extract_recipe. Sources can be recipe IDs (turned into URLs on base_url, so a local server with saved pages works
+    just as well as AllRecipes) or full URLs.
+        - concurrency: how many pages are in flight at once
+        - requests_per_second: per-host rate limit, so we don't hammer the site
+        - retries / backoff: connection errors, 429s and 5xx get retried, waiting backoff * 2^attempt seconds
+        - cache: optional PageCache; fresh cached pages skip the network, and everything fetched gets stored
+        - extract: with extract=False, results have the raw 'page' instead of the extracted 'recipe', for when the
+          extraction happens somewhere else (e.g. the batch mode's worker processes)
+    The HTTP requests themselves are blocking http.client calls on pooled keep-alive connections, run on a thread pool
+    '''
+    def __init__(self, concurrency=8, requests_per_second=2.0, retries=3, backoff=0.5, timeout=15, base_url=ALLRECIPES_URL,
+                 user_agent="Mozilla/5.0 (recipe-transformer)", cache=None, extract=True):
+        self.concurrency = concurrency
+        self.cache = cache
+        self.extract = extract
+        self.requests_per_second = requests_per_second
+        self.retries = retries
+        self.backoff = backoff
+        self.base_url = base_url
+        self.user_agent = user_agent
+        self.pool = HostConnectionPool(max_idle_per_host=concurrency, timeout=timeout)
+        import concurrent.futures
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+        self.next_request_time = {}
+
+    def source_url(self, source):
+        if source_kind(source) == 'id':
+            return recipe_url(source, self.base_url)
+        return source
+
+    def http_get(self, url, redirects=5, headers=None):
+        #  runs on a worker thread; gives back (status, response, body, final url); headers get added to the request
+        import http.client
+        for _ in range(0, redirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            scheme, host = parts.scheme, parts.hostname
+            port = parts.port or (443 if scheme == 'https' else 80)
+            path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+            connection = self.pool.acquire(scheme, host, port)
+            try:
+                connection.request('GET', path, headers=dict(headers or {}, **{'User-Agent': self.user_agent, 'Connection': 'keep-alive'}))
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                raise
+            self.pool.release(scheme, host, port, connection, reusable=not response.will_close)
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                url = urllib.parse.urljoin(url, response.getheader('Location'))
+                continue
+            return response.status, response, body, url
+        raise CrawlError("too many redirects: " + url)
+
+    async def wait_for_host(self, url):
+        #  per-host rate limiting; every request reserves the next free slot on its host before going out
+        import asyncio
+        host = urllib.parse.urlsplit(url).hostname
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        slot = max(now, self.next_request_time.get(host, now))
+        self.next_request_time[host] = slot + 1.0 / self.requests_per_second
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def fetch(self, url, validators=None, network=None):
+        #  validators: If-None-Match / If-Modified-Since headers (see PageCache.validators) for revalidating a stale
+        #  cached page, which a 304 then gets served from. network (crawl_one's timing dict) gets the attempts counted
+        import asyncio
+        import http.client
+        loop = asyncio.get_event_loop()
+        for attempt in range(0, self.retries + 1):
+            await self.wait_for_host(url)
+            if network is not None:
+                network['attempts'] += 1
+            try:
+                status, response, body, final_url = await loop.run_in_executor(self.executor, self.http_get, url, 5, validators)
+            except (http.client.HTTPException, OSError, CrawlError) as error:
+                failure = CrawlError("{0}: {1}".format(url, error))
+            else:
+                if status == 304 and validators is not None:
+                    page = await loop.run_in_executor(self.executor, self.cache.revalidated, url)
+                    if page is not None:
+                        if network is not None:
+                            network['cache'] = 'revalidated'
+                        return page
+                    return await self.fetch(url, None, network)     # the entry went away meanwhile, so get the whole page after all
+                if status == 200:
+                    if self.cache is not None:
+                        if validators is not None:
+                            self.cache.count('refetched')
+                        await loop.run_in_executor(self.executor, self.cache.store, url, body, response.getheader('ETag'),
+                                                   response.getheader('Last-Modified'))
+                    return body
+                failure = CrawlError("{0}: HTTP {1}".format(url, status))
+                if status != 429 and status < 500:
+                    raise failure   # 404s and such aren't going to get better by retrying
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+        raise failure
+
+    async def crawl_one(self, source):
+        #  result['network'] is how getting the page went: HTTP attempts, seconds (waiting on the rate limit and the
+        #  retry backoff included), and whether the cache had it ('hit' / 'revalidated' / 'miss'; None without a cache)
+        import asyncio
+        url = self.source_url(source)
+        network = {'attempts': 0, 'seconds': 0.0, 'cache': None if self.cache is None else 'miss'}
+        result = {'source': source, 'url': url, 'recipe': None, 'error': None, 'network': network}
+        start = time.perf_counter()
+        try:
+            body = None
+            validators = None
+            if self.cache is not None:
+                body, validators = self.cache.check(url, network)    # stale pages get revalidated instead of refetched
+            if body is None:
+                body = await self.fetch(url, validators, network)
+            network['seconds'] = time.perf_counter() - start
+            if self.extract:
+                result['recipe'] = await asyncio.get_event_loop().run_in_executor(self.executor, extract_recipe, body)
+            else:
+                result['page'] = body
+        except Exception as error:
+            result['error'] = str(error)
+            if not network['seconds']:
+                network['seconds'] = time.perf_counter() - start
+        return result
+
+    async def crawl(self, sources, handle_result):
+        #  a fixed set of workers pulling from the sources, so a 100k-ID range never turns into 100k pending tasks
+        import asyncio
+        sources = iter(sources)
+
+        async def worker():
+            for source in sources:
+                handle_result(await self.crawl_one(source))
+        await asyncio.gather(*[worker() for _ in range(0, self.concurrency)])
+
+    def close(self):
+        self.executor.shutdown()
+        self.pool.close()
+
+def crawl_recipes(sources, handle_result=None, **crawler_options):
+    #  Synchronous entry point; each result is {'source', 'url', 'recipe': [ing_strings, dir_strings, title] or None, 'error',
+    #  'network'} (see RecipeCrawler.crawl_one)
+    #  and gets passed to handle_result as soon as it's done, or all of them get returned at the end if there's no handler
+    import asyncio
+    crawler = RecipeCrawler(**crawler_options)
+    results = []
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(crawler.crawl(sources, handle_result or results.append))
+    finally:
+        loop.close()
+        crawler.close()
+    return results
 
 def deparenthesize(tokenized_phrase):   # stuff in parentheses most often seems like descriptors, so just doing that beforehand
     parenthesized_indices = []
@@ -81,52 +583,102 @@ def deparenthesize(tokenized_phrase):   # stuff in parentheses most often seems
     parenthesized = [tokenized_phrase[i] for i in range(0, len(tokenized_phrase)) if i in parenthesized_indices]
     return [deparenthesized, parenthesized]
 
+class LexiconMatcher:
+    '''
+    Aho-Corasick automaton over a few labelled word lists, e.g. {'MEASUREMENT': ['cup', ...], 'TIME': ['minute', ...]}.
+    labels(token) gives back every label that has a word appearing anywhere inside the token (so 'saucepan' still
+    matches 'pan'), in one scan over the token's characters no matter how long the word lists get
+    '''
+    def __init__(self, lexicons):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        for label, words in lexicons.items():
+            for word in words:
+                state = 0
+                for char in word:
+                    if char not in self.goto[state]:
+                        self.goto.append({})
+                        self.fail.append(0)
+                        self.output.append(set())
+                        self.goto[state][char] = len(self.goto) - 1
+                    state = self.goto[state][char]
+                self.output[state].add(label)
+        # breadth-first, so that every state's fail link is done before its children need it
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, child in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                if state != 0 and char in self.goto[fallback]:
+                    self.fail[child] = self.goto[fallback][char]
+                self.output[child] |= self.output[self.fail[child]]
+                queue.append(child)
+        self.output = [frozenset(labels) for labels in self.output]
+
+    def labels(self, token):
+        found = set()
+        state = 0
+        for char in token:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.output[state]:
+                found |= self.output[state]
+        return found
+
+#  Keeping a running list of types of measurements; seems like a reasonable way to resolve it
+MEASUREMENT_WORDS = ['cup', 'dash', 'can', 'pack', 'pint', 'teaspoon', 'tablespoon', 'pound', 'ounce', 'pinch',
+                     'clove', 'stalk', 'slices', 'inch']
+MEASUREMENT_BANS = ['canola']
+TIME_UNIT_WORDS = ['second', 'minute', 'hour']
+PARTS_MATCHER = LexiconMatcher({'MEASUREMENT': MEASUREMENT_WORDS, 'TIME': TIME_UNIT_WORDS})
+
+#  banning some words that slip through the cracks
+TOOL_BANNED_WORDS = ['potato', 'pinch', 'scraping', 'pink', 'simmer']
+#  doing this the old way seemed to not be so great; so I think I'll just keep a running list of tool words instead
+TOOL_WORDS = ['pan', 'skillet', 'pot', 'sheet', 'grater', 'whisk', 'spoon', 'cutter', 'board', 'oven', 'bowl', 'bag',
+              'towel', 'pin', 'knife', 'masher', 'skewer', 'refrigerator', 'freezer', 'grill', 'ladle', 'plate']
+TOOL_MATCHER = LexiconMatcher({'tool': TOOL_WORDS, 'banned': TOOL_BANNED_WORDS})
+
+#  Corrections for the NLTK part-of-speech tagger; can just update these while testing on various recipes
+#  (changing any of them, or the lists below, invalidates the saved parses in an IngredientParseCache file)
+JJ_CORRECTIONS = ['small', 'medium', 'large']
+VBD_CORRECTIONS = ['ground']
+VB_CORRECTIONS = ['combine', 'coat', 'cook', 'stir', 'drain', 'toss', 'serve', 'place', 'brush', 'beat', 'bake',
+                  'mix', 'cut', 'baste', 'grill', 'thread', 'roast','stewing','stew','boil','grill', 'arrange', 'fry',
+                  'heat','saute','steam']
+NN_CORRECTIONS = ['garlic']  #  really not sure why this one's an issue...
+#  was thinking of puting some stuff like 'extra' / 'to taste' as numbers, but what about like... 'extra-virgin olive oil'
+#  something to consider, I guess
+CD_CORRECTIONS = []
+#  words that get tagged as nouns in ingredient lines but aren't ingredient names
+INGREDIENT_BANNED_WORDS = ['piec','fri','bake','boil','grill', 'thread', 'roast','stewing','stew','grill']
+VBP_WORDS = ['cumin', 'canola']  # edge case; to account for
+
 def parts_fix(tuples):
-    #  Keeping a running list of types of measurements; seems like a reasonable way to resolve it
-    measurements = ['cup', 'dash', 'can', 'pack', 'pint', 'teaspoon', 'tablespoon', 'pound', 'ounce', 'pinch', 
-                    'clove', 'stalk', 'slices', 'inch']
-    measurement_bans = ['canola']
-    time_units = ['second', 'minute', 'hour']
-
-    #  Corrections for the NLTK part-of-speech tagger; can just update this while testing on various recipes
-    JJ_corrections = ['small', 'medium', 'large']
-    VBD_corrections = ['ground']
-    VB_corrections = ['combine', 'coat', 'cook', 'stir', 'drain', 'toss', 'serve', 'place', 'brush', 'beat', 'bake',
-                      'mix', 'cut', 'baste', 'grill', 'thread', 'roast','stewing','stew','boil','grill', 'arrange', 'fry',
-                      'heat','saute','steam']
-    NN_corrections = ['garlic']  #  really not sure why this one's an issue...
-    #  was thinking of puting some stuff like 'extra' / 'to taste' as numbers, but what about like... 'extra-virgin olive oil'
-    #  something to consider, I guess
-    CD_corrections = []     
-    
     #  Some necessary preprocessing because the NLTK part-of-speech tagger is kinda meh sometimes; also to get measurement words
     parts = []
     for t in tuples:
-        is_measurement = False
-        for m in measurements:
-            if m in t[0]:
-                is_measurement = True
-                break
-        is_timeunit = False
-        for u in time_units:
-            if u in t[0]:
-                is_timeunit = True
-                break    
-        if t[0] in measurement_bans:
+        matched = PARTS_MATCHER.labels(t[0])
+        is_measurement = 'MEASUREMENT' in matched
+        is_timeunit = 'TIME' in matched
+        if t[0] in MEASUREMENT_BANS:
             is_measurement = False
         if is_measurement == True:
             parts.append([t[0], 'MEASUREMENT'])
         elif is_timeunit == True:
             parts.append([t[0], 'TIME'])
-        elif t[0] in NN_corrections:
+        elif t[0] in NN_CORRECTIONS:
             parts.append([t[0], 'NN'])
-        elif t[0] in JJ_corrections:
+        elif t[0] in JJ_CORRECTIONS:
             parts.append([t[0], 'JJ'])
-        elif t[0] in VBD_corrections:
+        elif t[0] in VBD_CORRECTIONS:
             parts.append([t[0], 'VBD'])
-        elif t[0] in CD_corrections:
+        elif t[0] in CD_CORRECTIONS:
             parts.append([t[0], 'CD'])
-        elif t[0] in VB_corrections:
+        elif t[0] in VB_CORRECTIONS:
             parts.append([t[0], 'VB'])
         elif t[0][-3:] == "ing":    #   check for missing gerunds
             parts.append([t[0], 'VBG'])
@@ -135,18 +687,279 @@ def parts_fix(tuples):
     
     return parts
     
+def intern_words(words):
+    #  the same few thousand words ('salt', 'cup', 'chopped', ...) come up in every recipe, so keep one copy of each;
+    #  anything that isn't a list / tuple of words (a transform sometimes sets a field to a plain string) is left alone
+    if not isinstance(words, (list, tuple)):
+        return words
+    return tuple(sys.intern(word) if type(word) is str else word for word in words)
+
+class FieldList(list):
+    #  the list a Record's tuple field turns into once it gets changed through a FieldView; source is that tuple
+    __slots__ = ('source',)
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+class FieldView(collections.abc.MutableSequence):
+    '''
+    What record[field] gives back while the field is still a tuple: reads go straight to the tuple, and only the first
+    change (record['name'][0] = 'tofu', .append, del ..., +=) swaps the record's tuple for a list, so just looking at
+    a record never makes it any bigger. It stands for the list the old dict records had: every view of the same tuple
+    sees the changes made through the others (iterating included), and one taken before the field got assigned
+    something else keeps the old words, like a reference to the old list would
+    '''
+    __slots__ = ('record', 'field', 'words')
+
+    def __init__(self, record, field):
+        self.record = record
+        self.field = field
+        self.words = getattr(record, field)
+
+    def resolve(self):
+        #  the tuple, or the list it's turned into since
+        words = self.words
+        if type(words) is tuple:
+            current = getattr(self.record, self.field)
+            if type(current) is FieldList and current.source is words:
+                self.words = words = current
+        return words
+
+    def writable(self):
+        words = self.resolve()
+        if type(words) is tuple:
+            if getattr(self.record, self.field) is words:
+                self.words = FieldList(words)
+                self.words.source = words
+                setattr(self.record, self.field, self.words)
+            else:
+                self.words = list(words)    # the field's been replaced since, so this is no longer the record's
+        return self.words
+
+    def __getitem__(self, index):
+        words = self.resolve()[index]
+        return list(words) if isinstance(index, slice) else words
+
+    def __setitem__(self, index, word):
+        self.writable()[index] = word
+
+    def __delitem__(self, index):
+        del self.writable()[index]
+
+    def insert(self, index, word):
+        self.writable().insert(index, word)
+
+    def append(self, word):
+        self.writable().append(word)
+
+    def extend(self, words):
+        self.writable().extend(words)
+
+    def sort(self, **options):
+        self.writable().sort(**options)
+
+    def __iadd__(self, words):
+        self.writable().extend(words)
+        return self
+
+    def __len__(self):
+        return len(self.resolve())
+
+    def __iter__(self):
+        #  by index, like a list's iterator, so that changes made while iterating show up the same way
+        i = 0
+        while True:
+            words = self.resolve()
+            if i >= len(words):
+                return
+            yield words[i]
+            i += 1
+
+    def __contains__(self, word):
+        return word in self.resolve()
+
+    def __add__(self, other):
+        return list(self.resolve()) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self.resolve())
+
+    def __eq__(self, other):
+        if isinstance(other, (FieldView, list, tuple)):
+            return list(self.resolve()) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self.resolve()))
+
+    def __reduce__(self):
+        return (list, (list(self.resolve()),))
+
+class Record(collections.abc.MutableMapping):
+    '''
+    Base for the parsed ingredient / instruction objects, which used to be plain dicts of lists. Each field is kept
+    as a tuple of interned strings in a slot, which takes a fraction of the memory of a dict plus a list per field.
+    It still works like the old dicts (record['name'], record['name'][0] = 'tofu', 'name' in record, ...): looking a
+    tuple field up through record[...] gives a FieldView, which only turns the field into a list once something
+    changes it, so code that changes the lists in place keeps working. Assigned values are kept as-is, just like a
+    dict would. Code that only reads should use record_words (or the attributes), which skip the view.
+    to_dict() gives back the plain dict of lists (for printing / JSON), without turning anything into lists
+    '''
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init__(self, *values, **fields):
+        for field, words in zip(self.FIELDS, values):
+            fields[field] = words
+        for field in self.FIELDS:
+            setattr(self, field, intern_words(fields.pop(field, ())))
+        if fields:
+            raise TypeError("unknown fields: " + ', '.join(sorted(fields)))
+
+    def __getitem__(self, field):
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        words = getattr(self, field)
+        if type(words) is tuple:
+            return FieldView(self, field)
+        return words
+
+    def __setitem__(self, field, words):
+        if type(words) is FieldView:
+            words = list(words)     # (e.g. record['name'] = other['name'])
+        if field not in self.FIELDS:
+            raise KeyError(field)
+        setattr(self, field, words)
+
+    def __delitem__(self, field):
+        raise TypeError("{0} fields can't be removed".format(type(self).__name__))
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __contains__(self, field):
+        return field in self.FIELDS
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            #  field by field, counting a tuple and a list with the same words as equal
+            for field in self.FIELDS:
+                mine, theirs = getattr(self, field), getattr(other, field)
+                if mine is not theirs and mine != theirs and not (isinstance(mine, (list, tuple)) and
+                                                                  isinstance(theirs, (list, tuple)) and
+                                                                  list(mine) == list(theirs)):
+                    return False
+            return True
+        if isinstance(other, Record):
+            return False
+        return isinstance(other, dict) and self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        #  pickling (for the batch worker processes) / deepcopy just pass the fields back to the constructor
+        return (type(self), tuple(getattr(self, field) for field in self.FIELDS))
+
+    def to_dict(self):
+        record = {}
+        for field in self.FIELDS:
+            words = getattr(self, field)
+            record[field] = list(words) if isinstance(words, (list, tuple)) else words
+        return record
+
+    def copy(self):
+        #  unlike dict.copy(), the copy doesn't share any lists with this record, only the (unchangeable) tuples
+        duplicate = object.__new__(type(self))
+        for field in self.FIELDS:
+            words = getattr(self, field)
+            setattr(duplicate, field, tuple(words) if isinstance(words, list) else words)
+        return duplicate
+
+    def freeze(self):
+        #  turns the fields that got changed back into tuples of interned words
+        for field in self.FIELDS:
+            words = getattr(self, field)
+            if isinstance(words, list):
+                setattr(self, field, intern_words(words))
+        return self
+
+    def derive(self, **changes):
+        #  a new record with the given fields changed, sharing all the others with this one (see copy_on_write)
+        duplicate = self.copy()
+        for field, words in changes.items():
+            duplicate[field] = words
+        return duplicate
+
+class Ingredient(Record):
+    __slots__ = FIELDS = ('name', 'quantity', 'measurement', 'descriptor', 'preparation')
+
+class Instruction(Record):
+    __slots__ = FIELDS = ('ingredients', 'parsed_tools', 'inferred_tools', 'parsed_methods', 'inferred_methods',
+                          'primary_method', 'other_method', 'cooking_time')
+
+def record_words(record, field):
+    #  a record's field without turning it into a list (see Record); plain dicts work too
+    return getattr(record, field) if isinstance(record, Record) else record[field]
+
+def json_default(obj):
+    #  for json.dump(s): Ingredient / Instruction objects get written out as the dicts they stand in for
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    if isinstance(obj, FieldView):
+        return list(obj)
+    raise TypeError("{0} is not JSON serializable".format(type(obj).__name__))
+
+def copy_on_write(records):
+    #  What the transforms work on instead of deep copies of the recipe: each derived record shares its fields' tuples
+    #  with the original, and only gets its own list for a field once that field is looked up through record[...], so
+    #  nothing a transform does to it can reach the caller's records (plain dicts still get deep-copied)
+    return [record.derive() if isinstance(record, Record) else copy.deepcopy(record) for record in records]
+
+def share_unchanged(records, originals):
+    #  the other half of copy_on_write: a transform's results get the caller's original record back wherever nothing
+    #  changed, so running several transforms on one recipe only keeps the records each of them actually changed
+    #  (and the records that did change get frozen again, see Record.freeze, since nothing changes them after this)
+    shared = [original if record == original else record for record, original in zip(records, originals)] + records[len(originals):]
+    return [record.freeze() if isinstance(record, Record) else record for record in shared]
+
+def tokenize_ingredient(description):
+    #  Stuff in parentheses gets auto-chosen as a descriptor, so it's split off before tagging
+    tokens = word_tokenize(description)
+    return deparenthesize(tokens)
+
 def parse_ingredient(description):
+    if ingredient_cache is not None:
+        cached = ingredient_cache.get(description)
+        if cached is not None:
+            return cached
+    text, parenthesized = tokenize_ingredient(description)
+    ing_data = parse_tagged_ingredient(pos_tag(text), parenthesized)
+    if ingredient_cache is not None:
+        ingredient_cache.put_many([(description, ing_data)])
+    return ing_data
+
+def parse_tagged_ingredient(parts_tuples, parenthesized):
+    #  Does the actual classification, given the tagged (deparenthesized) tokens; split out of parse_ingredient
+    #  so that the tagging can be done in bulk by parse_ingredients_batch
     ing_data = {'name': [], 'quantity': [], 'measurement': [], 'descriptor': [], 'preparation': []}
-    tokens = word_tokenize(description)
-    ingredient_banned_words = ['piec','fri','bake','boil','grill', 'thread', 'roast','stewing','stew','grill']
-    #  Stuff in parentheses gets auto-chosen as a descriptor
-    text = deparenthesize(tokens)[0]
-    ing_data['descriptor'] = deparenthesize(tokens)[1]
-    parts_tuples = pos_tag(text)
+    ing_data['descriptor'] = parenthesized
     parts = parts_fix(parts_tuples)
     
-    vbp_words = ['cumin', 'canola']  # edge case; to account for
-    
     # Classify relevant words based on their part of speech / assigned tag
     i = 0
     while(i < len(parts)):
@@ -167,17 +980,121 @@ def parse_ingredient(description):
                 ing_data['preparation'].append(parts[i][0])
         elif parts[i][1] == 'VBD' or parts[i][1] == 'VBN':
             ing_data['preparation'].append(parts[i][0])
-        elif 'JJ' in parts[i][1] or (parts[i][1] == 'VBP' and parts[i][0] in vbp_words):
+        elif 'JJ' in parts[i][1] or (parts[i][1] == 'VBP' and parts[i][0] in VBP_WORDS):
             ing_data['descriptor'].append(parts[i][0])
             if len(parts[i:]) > 1 and (parts[i][0] == 'low' or parts[i][0] == 'high') and (parts[i+1][1] == 'NN' or parts[i+1][1] == 'RB'):
                 ing_data['descriptor'].append(parts[i+1][0])
                 i = i + 1
         elif parts[i][1] == 'NN' or parts[i][1] == 'NNS' or parts[i][1] == 'NNP' or parts[i][1] == 'VBG':
             single_ingre = depluralize([parts[i][0]])[0]
-            if single_ingre not in ingredient_banned_words:
+            if single_ingre not in INGREDIENT_BANNED_WORDS:
                 ing_data['name'].append(single_ingre)
         i = i + 1
-    return ing_data
+    return Ingredient(**ing_data)
+
+def ingredient_lexicon_fingerprint():
+    #  hash of everything parse_tagged_ingredient's output depends on besides the tagger; bump the version for code changes
+    lexicons = [1, MEASUREMENT_WORDS, MEASUREMENT_BANS, TIME_UNIT_WORDS, JJ_CORRECTIONS, VBD_CORRECTIONS, VB_CORRECTIONS,
+                NN_CORRECTIONS, CD_CORRECTIONS, INGREDIENT_BANNED_WORDS, VBP_WORDS]
+    return hashlib.sha256(json.dumps(lexicons).encode()).hexdigest()
+
+def normalize_ingredient_line(description):
+    #  the tagger cares about case, so only the whitespace gets normalized
+    return ' '.join(description.split())
+
+class IngredientParseCache:
+    '''
+    Memoizes ingredient parses, since lines like '1 teaspoon salt' or 'salt and pepper to taste' show up in most recipes.
+    Keyed by normalize_ingredient_line(line); keeps the maxsize most recently used parses in memory, and optionally
+    every parse in a SQLite file at path, so they survive across runs (and get shared between batch worker processes).
+    The file remembers ingredient_lexicon_fingerprint(), and gets emptied when opened with different lexicons.
+    Parses are handed out as copies, since the transforms change the ingredient objects they're given.
+    stats has hit / miss / eviction counters ('disk_hits' are the hits that came from the file)
+    '''
+    def __init__(self, maxsize=20000, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = collections.OrderedDict()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        self.lock = threading.Lock()
+        self.connection = None
+        self.connection_pid = None
+
+    def hit_rate(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / lookups if lookups else 0.0
+
+    def database(self):
+        #  opened on first use, and again in every (forked) worker process, since SQLite connections can't be shared
+        if self.path is None:
+            return None
+        if self.connection is None or self.connection_pid != os.getpid():
+            import sqlite3
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)   # only used under self.lock
+            self.connection_pid = os.getpid()
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS parses (line TEXT PRIMARY KEY, parsed TEXT)')
+            fingerprint = ingredient_lexicon_fingerprint()
+            row = self.connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+            if row is None or row[0] != fingerprint:
+                with self.connection:
+                    self.connection.execute('DELETE FROM parses')
+                    self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+        return self.connection
+
+    def remember(self, key, ing_data):
+        self.entries[key] = ing_data
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def get(self, description):
+        #  a copy of the cached parse, or None
+        key = normalize_ingredient_line(description)
+        with self.lock:
+            ing_data = self.entries.get(key)
+            if ing_data is not None:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+            elif self.database() is not None:
+                row = self.connection.execute('SELECT parsed FROM parses WHERE line = ?', (key,)).fetchone()
+                if row is not None:
+                    ing_data = Ingredient(**json.loads(row[0]))
+                    self.remember(key, ing_data)
+                    self.stats['hits'] += 1
+                    self.stats['disk_hits'] += 1
+            if ing_data is None:
+                self.stats['misses'] += 1
+                return None
+            return ing_data.copy()
+
+    def put_many(self, parsed):
+        #  parsed: [(line, ing_data), ...]; all written to the file in one transaction
+        with self.lock:
+            rows = []
+            for description, ing_data in parsed:
+                key = normalize_ingredient_line(description)
+                self.remember(key, ing_data.copy())
+                rows.append((key, json.dumps(ing_data.to_dict())))
+            if rows and self.database() is not None:
+                with self.connection:
+                    self.connection.executemany('INSERT OR REPLACE INTO parses VALUES (?, ?)', rows)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+#  the cache parse_ingredient / parse_ingredients_batch use (None turns it off); set RECIPE_PARSE_CACHE to a file
+#  to keep the parses between runs
+ingredient_cache = IngredientParseCache(path=os.environ.get('RECIPE_PARSE_CACHE') or None)
 
 def misspelling(string1, string2):  # allowing 2-letter difference, for leniency
     mistakes = abs(len(string1) - len(string2))
@@ -186,29 +1103,136 @@ def misspelling(string1, string2):  # allowing 2-letter difference, for leniency
             mistakes = mistakes + 1
     return mistakes <= 1
 
+class IngredientMentionIndex:
+    '''
+    Index of a recipe's ingredient names, for spotting them in the directions.
+    A token matches an ingredient in exactly the cases misspelling() allows: same word, one letter off, or one
+    letter extra/missing at the end. Every one of those cases is a dict lookup here, so looking up a token costs
+    about len(token) lookups, instead of a misspelling() call against every ingredient.
+    Multi-word names (e.g. 'olive oil', 'sour cream') can be passed in as phrases; find_phrases matches them
+    word by word against consecutive tokens, with the same leniency on each word
+    '''
+    def __init__(self, all_ingredients, phrases=None):
+        self.names = set(all_ingredients)
+        self.one_off = {}       # name with one letter blanked out --> names
+        self.one_short = {}     # name minus its last letter --> names
+        for name in self.names:
+            for i in range(0, len(name)):
+                self.one_off.setdefault(name[:i] + '\0' + name[i+1:], set()).add(name)
+            if name:
+                self.one_short.setdefault(name[:-1], set()).add(name)
+        self.phrase_starts = {}     # first word --> phrases (as tuples of words) starting with it
+        for phrase in (phrases or []):
+            phrase = tuple(phrase)
+            if len(phrase) > 1:
+                self.phrase_starts.setdefault(phrase[0], set()).add(phrase)
+        self.phrase_words = set(word for phrases in self.phrase_starts.values() for phrase in phrases for word in phrase)
+        self.phrase_index = IngredientMentionIndex(self.phrase_words) if self.phrase_starts else None
+
+    def matches(self, token):
+        found = set()
+        if token in self.names:
+            found.add(token)
+        if token[:-1] in self.names and token:      # token has an extra letter at the end
+            found.add(token[:-1])
+        found |= self.one_short.get(token, set())     # token is missing the last letter
+        for i in range(0, len(token)):
+            found |= self.one_off.get(token[:i] + '\0' + token[i+1:], set())
+        return found
+
+    def find_phrases(self, tokens):
+        found = []
+        if self.phrase_index is None:
+            return found
+        token_matches = [self.phrase_index.matches(token) for token in tokens]
+        for i in range(0, len(tokens)):
+            for first_word in token_matches[i]:
+                for phrase in self.phrase_starts.get(first_word, ()):
+                    if i + len(phrase) <= len(tokens) and all(phrase[j] in token_matches[i+j] for j in range(1, len(phrase))):
+                        found.append(' '.join(phrase))
+        return found
+
+def suffix_map(forms, suffix):    # form --> form without the suffix, whenever that shorter form is also around
+    return {form: form[:-len(suffix)] for form in forms if form.endswith(suffix) and form[:-len(suffix)] in forms}
+
+def tool_canonical_map(tools):
+    #  maps every surface form in tools to its canonical tool ('spoons' --> 'spoon', 'grilling' --> 'grill'),
+    #  following the same rules as remove_plurals and then remove_tool_as_verb; built with a couple of set lookups
+    #  per form, so canonicalizing a list is linear instead of comparing every pair of tools
+    forms = set(tools)
+    plurals = suffix_map(forms, 's')
+    singular_forms = set(plurals.get(form, form) for form in forms)
+    verbs = suffix_map(singular_forms, 'ing')
+    canonical = {}
+    for form in forms:
+        singular = plurals.get(form, form)
+        canonical[form] = verbs.get(singular, singular)
+    return canonical
+
 def remove_plurals(tools):      # if we have 'spoon' and 'spoons', keep 'spoon' only
-    for i in range(0, len(tools)):
-        for j in range(i, len(tools)):
-            if tools[i] == tools[j] + 's':
-                tools[i] = tools[j]
-            elif tools[j] == tools[i] + 's':
-                tools[j] = tools[i]
+    plurals = suffix_map(set(tools), 's')
+    tools[:] = [plurals.get(tool, tool) for tool in tools]
 
 def remove_tool_as_verb(tools):      # if we have 'grill' and 'grilling', keep 'grill' only
-    for i in range(0, len(tools)):
-        for j in range(i, len(tools)):
-            if tools[i] == tools[j] + 'ing':
-                tools[i] = tools[j]
-            elif tools[j] == tools[i] + 'ing':
-                tools[j] = tools[i]
+    verbs = suffix_map(set(tools), 'ing')
+    tools[:] = [verbs.get(tool, tool) for tool in tools]
+
+class ToolStatistics:
+    '''
+    Tool counts across a whole corpus of recipes, with plurals / gerunds folded into their canonical tool.
+    The canonical forms depend on every form seen in the corpus (so 'pans' from one recipe folds into 'pan' from
+    another), so the raw counts are kept and only canonicalized when asked for
+    '''
+    def __init__(self):
+        self.surface_counts = {}
+
+    def add(self, tools):
+        for tool in tools:
+            self.surface_counts[tool] = self.surface_counts.get(tool, 0) + 1
+
+    def canonical_counts(self):
+        canonical = tool_canonical_map(self.surface_counts)
+        counts = {}
+        for form, count in self.surface_counts.items():
+            counts[canonical[form]] = counts.get(canonical[form], 0) + count
+        return counts
 
 def full_ingredients_list(ingredients):
     all_ingredients = []
     for ingredient in ingredients:
 
-        all_ingredients = all_ingredients + ingredient['name']
+        all_ingredients = all_ingredients + list(record_words(ingredient, 'name'))
     return all_ingredients
 
+def full_ingredient_phrases(ingredients):
+    #  multi-word ingredient names, for IngredientMentionIndex; names like 'olive oil' or 'sour cream' usually come out
+    #  of parse_ingredient with the first word as a descriptor, so the last descriptor word + the name counts too
+    phrases = []
+    for ingredient in ingredients:
+        name, descriptor = tuple(record_words(ingredient, 'name')), tuple(record_words(ingredient, 'descriptor'))
+        if len(name) > 1:
+            phrases.append(name)
+        if name and descriptor and descriptor[-1].isalpha():
+            phrases.append(descriptor[-1:] + name)
+    return phrases
+
+def tokenize_instructions(dir_strings, tag_batcher=None):
+    #  Every analyzer below (ingredients, tools, methods, cooking time) needs the tokens of each direction, so each
+    #  direction gets tokenized once here, and all of them get tagged in one pos_tag_sents pass.
+    #  The 'lower_tokens' view is for the analyzers that used to tokenize instruction.lower(); it gets tokenized from
+    #  the lowercased direction rather than lowercased afterwards, since the sentence splitting word_tokenize does
+    #  first goes by case (e.g. "350 degrees F. Mix" vs. "350 degrees f. mix")
+    instruction_docs = []
+    all_tokens = [word_tokenize(dir_string) for dir_string in dir_strings]
+    all_lower_tokens = [word_tokenize(dir_string.lower()) for dir_string in dir_strings]
+    all_tagged = pos_tag_sents(all_lower_tokens, tag_batcher)
+    for dir_string, tokens, lower_tokens, tagged in zip(dir_strings, all_tokens, all_lower_tokens, all_tagged):
+        instruction_docs.append({'text': dir_string, 'tokens': tokens, 'lower_tokens': lower_tokens, 'tagged': tagged})
+    return instruction_docs
+
+def tokenize_instruction(dir_string):
+    return tokenize_instructions([dir_string])[0]
+
 def infer_tools(instruction):
     lowercase = instruction.lower()
     tokens = word_tokenize(lowercase)
@@ -230,44 +1254,32 @@ def infer_tools_helper(tokens):
 
   
 def parse_tools(instruction):
-    #  banning some words that slip through the cracks
-    banned_words = ['potato', 'pinch', 'scraping', 'pink', 'simmer']
-    
-    #  doing this the old way seemed to not be so great; so I think I'll just keep a running list of tool words instead
-    tool_words = ['pan', 'skillet', 'pot', 'sheet', 'grater', 'whisk', 'spoon', 'cutter', 'board', 'oven', 'bowl', 'bag',
-                  'towel', 'pin', 'knife', 'masher', 'skewer', 'refrigerator', 'freezer', 'grill', 'ladle', 'plate']
-    
     lowercase = instruction.lower()
     #  since we're just searching for words, we shouldn't need part-of-word information, just tokens
     tokens = word_tokenize(lowercase)
+    return parse_tools_helper(tokens)
 
-    #  keep all words with tool words in them (including subsets; e.g. 'saucepan')
-    potential_tools = []
-    for token in tokens:
-        for tool_word in tool_words:
-            if tool_word in token:
-                potential_tools.append(token)
-                break
+def parse_tools_helper(tokens):
+    #  keep all words with tool words in them (including subsets; e.g. 'saucepan'), unless a banned word is in there too
     found_tools = []
-    for potential_tool in potential_tools:
-        is_tool = True
-        for banned_word in banned_words:
-            if banned_word in potential_tool:
-                is_tool = False
-                break
-        if is_tool:
-            found_tools.append(potential_tool)
+    for token in tokens:
+        matched = TOOL_MATCHER.labels(token)
+        if 'tool' in matched and 'banned' not in matched:
+            found_tools.append(token)
     return found_tools
 
 def parse_methods(instruction, ingredients):
+    lowercase = instruction.lower()
+    tokens = word_tokenize(lowercase)
+    parts_tuples = pos_tag(tokens)
+    return parse_methods_helper(parts_tuples, ingredients)
+
+def parse_methods_helper(parts_tuples, ingredients):
     # keeping a list of banned words
     banned_words = ['be', 'is', 'set', 'heat']
     list_of_methods = ['combine', 'coat', 'cook', 'stir', 'drain', 'toss', 'serve', 'place', 'brush', 'beat', 'bake',
                       'mix', 'cut', 'baste', 'grill', 'thread', 'roast','stewing','stew','boil','grill', 'arrange', 'fry',
                       'saute','steam', 'add', 'mix', 'simmer', 'pour']
-    lowercase = instruction.lower()
-    tokens = word_tokenize(lowercase)
-    parts_tuples = pos_tag(tokens)
     parts = parts_fix(parts_tuples)
     found_methods = []
     for part in parts:
@@ -279,85 +1291,177 @@ def parse_methods(instruction, ingredients):
 
     return found_methods
 
-def infer_methods(method_word,tools):   
-    #print(tool_names)
-    combined_list = method_word+tools
-    inferred_methods = []
-    #These rules need to be updated to incorperate more cases 
-    rules = {('cook','skillet','oil'):'fry',('grill'):'grill',('pot','water'):'boil',
-    ('drain','pot'):'boil'}
-    for key_words in rules.keys():
-        common_words = [word for word in combined_list if word in key_words]
-        #match the rule, append the val from the dict
-        if len(common_words) == len(key_words):
-            inferred_methods.append(rules[key_words])
-
-    return inferred_methods
-
-def find_ingredients_objects(ing_strings):
-    ingredients = []
-    for ing_string in ing_strings:
-        ingredients.append(parse_ingredient(ing_string))
-    return ingredients
-
-def full_tools_list(dir_strings):
+#  The method inference rules live in method_rules.json next to this file, as a list of
+#  {"words": [...], "method": ...} entries; a rule fires once every one of its words has shown up in the methods/tools.
+#  These rules need to be updated to incorperate more cases 
+METHOD_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'method_rules.json')
+
+def load_method_rules(path=METHOD_RULES_PATH):
+    with open(path) as rules_file:
+        return [(tuple(rule['words']), rule['method']) for rule in json.load(rules_file)]
+
+class MethodRuleEngine:
+    '''
+    Rules of the form (words, method), with an index from each word to the rules it shows up in;
+    looking at a word only touches the rules that word can help fire, and each rule just keeps a count of how many of
+    the words so far were one of its words, so the number of rules doesn't matter much (see benchmark_rule_engine).
+    Counted the way infer_methods always has: every occurrence counts (so ['cook', 'cook', 'skillet'] fires a
+    3-word rule too), and a rule fires when its count is exactly the number of its words, checked at the end of each
+    update (one more matching word and it doesn't fire anymore)
+    '''
+    def __init__(self, rules):
+        self.rules = [(tuple(words), method) for words, method in rules]
+        self.word_index = {}
+        for rule_id, (words, method) in enumerate(self.rules):
+            for word in set(words):
+                self.word_index.setdefault(word, []).append(rule_id)
+
+    def new_state(self):
+        return {'counts': [0] * len(self.rules)}
+
+    def update(self, state, words):
+        #  feeds words into state; gives back the (words, method) rules that fire after them, of the ones they touched
+        counts = state['counts']
+        touched = set()
+        for word in words:
+            for rule_id in self.word_index.get(word, ()):
+                counts[rule_id] += 1
+                touched.add(rule_id)
+        return [self.rules[rule_id] for rule_id in sorted(touched) if counts[rule_id] == len(self.rules[rule_id][0])]
+
+    def infer(self, words):
+        return [method for rule_words, method in self.update(self.new_state(), words)]
+
+_method_rule_engine = None
+
+def method_rule_engine():
+    global _method_rule_engine
+    if _method_rule_engine is None:
+        _method_rule_engine = MethodRuleEngine(load_method_rules())
+    return _method_rule_engine
+
+def infer_methods(method_word,tools):
+    return method_rule_engine().infer(method_word+tools)
+
+class IncrementalMethodInferrer:
+    '''
+    infer_methods, but fed one step at a time: the rule engine keeps its counts across the steps seen so far,
+    so a new step only costs its own words instead of re-running the rules over the whole history.
+    update() gives back the methods that get inferred for the first time at this step, which is the same thing
+    assemble_instruction_objects used to get by re-running infer_methods on everything and filtering out
+    the methods it had already inferred
+    '''
+    def __init__(self, engine=None):
+        self.engine = method_rule_engine() if engine is None else engine
+        self.state = self.engine.new_state()
+        self.inferred = set()
+
+    def update(self, words):
+        new_methods = set()
+        for rule_words, method in self.engine.update(self.state, words):
+            if method not in self.inferred:
+                new_methods.add(method)
+        self.inferred |= new_methods
+        return list(new_methods)
+
+def parse_ingredients_batch(ing_string_lists, tag_batcher=None):
+    #  Takes a list of recipes' ingredient lines, e.g. [ing_strings_1, ing_strings_2, ...]
+    #  Tagging each line on its own means paying the tagger's per-call overhead for every short line,
+    #  so every line of every recipe gets tokenized first and then tagged in a single pos_tag_sents call
+    #  Lines that are already in ingredient_cache skip all of that; only the misses get tokenized and tagged
+    if ingredient_cache is None:
+        tokenized = [[tokenize_ingredient(ing_string) for ing_string in ing_strings] for ing_strings in ing_string_lists]
+        all_texts = [text for recipe in tokenized for text, parenthesized in recipe]
+        tagged = iter(pos_tag_sents(all_texts, tag_batcher))
+        return [[parse_tagged_ingredient(next(tagged), parenthesized) for text, parenthesized in recipe] for recipe in tokenized]
+    results = [[ingredient_cache.get(ing_string) for ing_string in ing_strings] for ing_strings in ing_string_lists]
+    misses = {}     # normalized line --> [(recipe index, line index), ...], so a repeated line only gets parsed once
+    for i, ing_strings in enumerate(ing_string_lists):
+        for j, ing_string in enumerate(ing_strings):
+            if results[i][j] is None:
+                misses.setdefault(normalize_ingredient_line(ing_string), []).append((i, j))
+    if misses:
+        lines = list(misses)
+        tokenized = [tokenize_ingredient(line) for line in lines]
+        tagged = pos_tag_sents([text for text, parenthesized in tokenized], tag_batcher)
+        parsed = [parse_tagged_ingredient(tags, parenthesized) for tags, (text, parenthesized) in zip(tagged, tokenized)]
+        ingredient_cache.put_many(list(zip(lines, parsed)))
+        for line, ing_data in zip(lines, parsed):
+            for i, j in misses[line]:
+                results[i][j] = ing_data.copy()
+    return results
+
+def find_ingredients_objects(ing_strings, tag_batcher=None):
+    return parse_ingredients_batch([ing_strings], tag_batcher)[0]
+
+def full_tools_list(dir_strings, instruction_docs=None):
+    #  instruction_docs (from tokenize_instructions) can be passed in to skip re-tokenizing the directions
+    if instruction_docs is None:
+        instruction_docs = tokenize_instructions(dir_strings)
     all_tools = {'parsed_tools': [], 'inferred_tools': []}
     parsed_tools = []
     inferred_tools = []
-    for dir_string in dir_strings:
-        parsed_tools = parsed_tools + parse_tools(dir_string)
-        inferred_tools = inferred_tools + infer_tools(dir_string)
-    remove_plurals(parsed_tools)
-    remove_tool_as_verb(parsed_tools)
-    remove_plurals(inferred_tools)
-    remove_tool_as_verb(inferred_tools)
-    all_tools['parsed_tools'] = list(set(parsed_tools))
-    all_tools['inferred_tools'] = list(set(inferred_tools))
+    for doc in instruction_docs:
+        parsed_tools = parsed_tools + parse_tools_helper(doc['lower_tokens'])
+        inferred_tools = inferred_tools + infer_tools_helper(doc['lower_tokens'])
+    all_tools['parsed_tools'] = dedupe_tools(parsed_tools)
+    all_tools['inferred_tools'] = dedupe_tools(inferred_tools)
     return all_tools
 
-def full_methods_list(dir_strings, all_ingredients):
+def dedupe_tools(tools):
+    canonical = tool_canonical_map(tools)
+    return list(set(canonical.values()))
+
+def full_methods_list(dir_strings, all_ingredients, instruction_docs=None):
+    if instruction_docs is None:
+        instruction_docs = tokenize_instructions(dir_strings)
     all_methods = {'parsed_methods': [], 'inferred_methods': []}
     parsed_methods = []
-    for dir_string in dir_strings:
-        parsed_methods = parsed_methods + parse_methods(dir_string, all_ingredients)
+    for doc in instruction_docs:
+        parsed_methods = parsed_methods + parse_methods_helper(doc['tagged'], all_ingredients)
     all_methods['parsed_methods'] = list(set(parsed_methods))
-    all_tools = full_tools_list(dir_strings)
+    all_tools = full_tools_list(dir_strings, instruction_docs)
     all_methods['inferred_methods'] = list(set(infer_methods(all_methods['parsed_methods'], all_tools['parsed_tools'] + all_tools['inferred_tools'])))
     return all_methods
 
-def assemble_instruction_objects(dir_strings, all_ingredients):
+def assemble_instruction_objects(dir_strings, all_ingredients, instruction_docs=None, mention_index=None):
+    if instruction_docs is None:
+        instruction_docs = tokenize_instructions(dir_strings)
+    if mention_index is None:
+        mention_index = IngredientMentionIndex(all_ingredients)
     instruction_objects = []
-    tools_list = []
-    methods_list = []
-    inferred_methods  = []
-    for dir_string in dir_strings:
+    method_inferrer = IncrementalMethodInferrer()
+    for doc in instruction_docs:
         instruction_object = {'ingredients': [], 'parsed_tools': [], 'inferred_tools': [], 'parsed_methods': [], 'inferred_methods': [],
         'primary_method':[],'other_method':[],'cooking_time':[]}        
-        instruction_object['ingredients'] = list(set(find_instruction_ingredients(dir_string, all_ingredients)))
-        instruction_object['parsed_tools'] = list(set(parse_tools(dir_string)))
-        instruction_object['inferred_tools'] = list(set(infer_tools(dir_string)))
-        tools_list = tools_list + instruction_object['parsed_tools'] + instruction_object['inferred_tools']
-        instruction_object['parsed_methods'] = list(set(parse_methods(dir_string, all_ingredients)))
-        methods_list = methods_list + instruction_object['parsed_methods']
-        potentially_inferred = list(set(infer_methods(methods_list, tools_list)))
-        instruction_object['inferred_methods'] = [method for method in potentially_inferred if method not in inferred_methods]
+        instruction_object['ingredients'] = list(set(find_instruction_ingredients_helper(doc['tokens'], all_ingredients, mention_index)))
+        instruction_object['parsed_tools'] = list(set(parse_tools_helper(doc['lower_tokens'])))
+        instruction_object['inferred_tools'] = list(set(infer_tools_helper(doc['lower_tokens'])))
+        instruction_object['parsed_methods'] = list(set(parse_methods_helper(doc['tagged'], all_ingredients)))
+        instruction_object['inferred_methods'] = method_inferrer.update(instruction_object['parsed_methods'] + instruction_object['parsed_tools']
+                                                                        + instruction_object['inferred_tools'])
         classified_method = find_primary_cooking_method(instruction_object['inferred_methods']+instruction_object['parsed_methods'] )
         instruction_object['primary_method'] = classified_method['primary_method']
         instruction_object['other_method'] = classified_method['other_method']
-        instruction_object['cooking_time'] = [fetch_cooking_time(dir_string)]
-
-        inferred_methods = inferred_methods + instruction_object['inferred_methods']
-        instruction_objects.append(instruction_object)
+        instruction_object['cooking_time'] = [fetch_cooking_time_helper(doc['tokens'])]
+        instruction_objects.append(Instruction(**instruction_object))
     return instruction_objects
     
 def find_instruction_ingredients(instruction, all_ingredients):
-    ingredients_list = []
     tokens = word_tokenize(instruction)
-    for ingredient in all_ingredients:
-        for token in tokens:
-            if token == ingredient or misspelling(token, ingredient):
+    return find_instruction_ingredients_helper(tokens, all_ingredients)
+
+def find_instruction_ingredients_helper(tokens, all_ingredients, mention_index=None):
+    #  every ingredient gets credited to the first token that matches it (exactly, or close enough per misspelling())
+    if mention_index is None:
+        mention_index = IngredientMentionIndex(all_ingredients)
+    ingredients_list = []
+    matched = set()
+    for token in tokens:
+        for ingredient in mention_index.matches(token):
+            if ingredient not in matched:
+                matched.add(ingredient)
                 ingredients_list.append(token)
-                break
     return list(set(ingredients_list))
 
 def find_primary_cooking_method(all_methods):
@@ -375,6 +1479,84 @@ def find_primary_cooking_method(all_methods):
     method['other_method'] = list(set(other_cooking))
     return method
 
+class RecipeAnalysis:
+    '''
+    Everything we parse out of a recipe's directions, built in a single pass.
+    The per-step instruction objects get built first (same as assemble_instruction_objects), and then the recipe-level
+    summaries are put together from the per-step results instead of re-parsing every direction for them;
+    all_tools / all_methods / all_methods_class are the same as what full_tools_list, full_methods_list and
+    find_primary_cooking_method give.
+    If ingredient_phrases (from full_ingredient_phrases) are given, ingredient_mentions has the multi-word
+    ingredients mentioned in each step (e.g. ['olive oil']), which the single-token ingredient matching can't see;
+    without them it's None, and the directions don't get gone over for phrases at all
+    '''
+    def __init__(self, dir_strings, all_ingredients, instruction_docs=None, ingredient_phrases=None):
+        if instruction_docs is None:
+            instruction_docs = tokenize_instructions(dir_strings)
+        self.dir_strings = dir_strings
+        self.all_ingredients = all_ingredients
+        self.instruction_docs = instruction_docs
+        self.mention_index = IngredientMentionIndex(all_ingredients, ingredient_phrases)
+        self.instruction_objects = assemble_instruction_objects(dir_strings, all_ingredients, instruction_docs, self.mention_index)
+        self.ingredient_mentions = None
+        if ingredient_phrases:
+            self.ingredient_mentions = [sorted(set(self.mention_index.find_phrases(doc['tokens']))) for doc in instruction_docs]
+
+        parsed_tools = []
+        inferred_tools = []
+        parsed_methods = []
+        for instruction_object in self.instruction_objects:
+            parsed_tools = parsed_tools + list(instruction_object.parsed_tools)
+            inferred_tools = inferred_tools + list(instruction_object.inferred_tools)
+            parsed_methods = parsed_methods + list(instruction_object.parsed_methods)
+        self.all_tools = {'parsed_tools': dedupe_tools(parsed_tools), 'inferred_tools': dedupe_tools(inferred_tools)}
+        self.all_methods = {'parsed_methods': list(set(parsed_methods)), 'inferred_methods': []}
+        self.all_methods['inferred_methods'] = list(set(infer_methods(self.all_methods['parsed_methods'],
+                                                                      self.all_tools['parsed_tools'] + self.all_tools['inferred_tools'])))
+        self.all_methods_class = find_primary_cooking_method(self.all_methods['parsed_methods'] + self.all_methods['inferred_methods'])
+
+#  The transforms below all look words up by their lowercase, depluralized form; working that out is the same for
+#  every transform and every recipe, so it's done once per distinct word and kept
+_word_forms = {}
+
+def normalize_word(word):
+    #  (lowercase, depluralized lowercase) forms of a word
+    forms = _word_forms.get(word)
+    if forms is None:
+        if len(_word_forms) >= 100000:     # a big corpus shouldn't make this grow forever
+            _word_forms.clear()
+        lower = word.lower()
+        forms = _word_forms[word] = (lower, depluralize(lower))
+    return forms
+
+class SubstitutionTable:
+    '''
+    A transform's word lists, compiled once instead of rebuilt (and scanned through) on every call.
+    rules are (label, words, form) in priority order, where form says which of the word's normalize_word forms has to
+    be in words: 'base' (the depluralized one, which most of the checks use), 'lower' or 'either'.
+    classify(word) gives the label of the first rule the word matches (None if there isn't one); that gets worked out
+    the first time a word comes up and remembered, so every later lookup is a single dict lookup
+    '''
+    def __init__(self, rules):
+        self.rules = [(label, frozenset(words), form) for label, words, form in rules]
+        self.labels = {}
+
+    def classify(self, word):
+        try:
+            return self.labels[word]
+        except KeyError:
+            pass
+        lower, base = normalize_word(word)
+        label = None
+        for rule_label, words, form in self.rules:
+            if (form != 'lower' and base in words) or (form != 'base' and lower in words):
+                label = rule_label
+                break
+        if len(self.labels) >= 100000:
+            self.labels.clear()
+        self.labels[word] = label
+        return label
+
 '''
 CUSTOM TRANSFORM:
 Regular recipe ---> South Asian food!!! Gotta do it for the culture (':
@@ -394,22 +1576,87 @@ Changes to the cooking?
 ---If cooking is involved, then generally you should sear the vegetables before doing anything else with them
 ---Not sure if this should be included as a preparation in the instructions, or not, though......
 '''
-def southasian_transform(ingredient_objects, instruction_objects, title = "placeholder"):
-    banned = ['cow', 'beef', 'steak', 'filet', 'mignon', 'brisket', 'pork']   #  गाय हमारी माता हे !!!! don't eat cows; also pork
-    to_modify = ['hotdog', 'ribs']
-    ingredients = copy.deepcopy(ingredient_objects)
+SOUTHASIAN_BANNED = ['cow', 'beef', 'steak', 'filet', 'mignon', 'brisket', 'pork']   #  गाय हमारी माता हे !!!! don't eat cows; also pork
+SOUTHASIAN_TO_MODIFY = ['hotdog', 'ribs']
+SOUTHASIAN_OIL_TYPES = ['sunflower', 'canola', 'olive', 'avocado', 'palm', 'bran', 'safflower', 'seed']
+SOUTHASIAN_SALAD_VEGGIES = ['cabbage', 'mushroom', 'tomato', 'onion', 'pepper', 'lettuce', 'broccoli', 'spinach', 'carrots', 'zucchini', 'eggplant', 'cucumber']
+SOUTHASIAN_VEGGIES = ['cabbage', 'mushroom', 'lettuce', 'broccoli', 'spinach', 'carrot', 'zucchini', 'eggplant', 'cucumber']
+#  The instruction checks are substring checks on words that can change halfway through (e.g. 'barbecue' -->
+#  'indian barbecue'), so this one doesn't get a SubstitutionTable; it still only normalizes each word once though
+
+class SouthAsianTotals:
+    '''
+    What southasian_transform needs to know about the whole recipe before it adds anything: whether it's savory or
+    sweet (and how much salt / sugar it has), whether it's cooked, and which of the vegetable core it already has.
+    add() takes the ingredients one at a time, as they are before the transform changes them (so RecipeWords can
+    work this out in its pass over the recipe)
+    '''
+    def __init__(self, title="placeholder"):
+        self.title = title
+        self.is_savory = False
+        self.savory_amt = 0  # if it has both sugar and salt, we'll determine if it's savory by seeing which it has more of
+        self.is_sweet = False  #  maybe not the best way to determine it but... idk.
+        self.sweet_amt = 0
+        self.is_cooked = False
+        self.has_onions = False
+        self.has_tomatoes = False
+        self.has_greenchilies = False
+        self.savory_measurement = "teaspoons"    #  setting as a default, just in case
+        self.sweet_measurement = "teaspoons"
+
+    def add(self, ingredient):
+        #  (the transform's own changes to the name / descriptor that the later checks would see, without making them)
+        name = record_words(ingredient, 'name')
+        descriptor = record_words(ingredient, 'descriptor')
+        quantity = record_words(ingredient, 'quantity')
+        measurement = record_words(ingredient, 'measurement')
+        if any(banned_word in name for banned_word in SOUTHASIAN_BANNED):
+            name = ['lamb']
+        if any(mod_word in name for mod_word in SOUTHASIAN_TO_MODIFY):
+            descriptor = ['lamb']
+        if 'oil' in name and 'salad' not in self.title:
+            name = ['oil']
+            descriptor = ['mustard']
+            self.is_cooked = True
+        if 'salt' in name or 'pepper' in name:
+            self.is_savory = True
+            self.savory_amt = self.savory_amt + convert_to_number(quantity)
+            if len(measurement) > 0:
+                self.savory_measurement = measurement[0]
+        if 'sugar' in name:
+            descriptor = ['brown']
+            self.is_sweet = True
+            self.sweet_amt = self.sweet_amt + convert_to_number(quantity)
+            if len(measurement) > 0:
+                self.sweet_measurement = measurement[0]
+        if 'tomato' in name or 'tomatoes' in name:
+            self.has_tomatoes = True
+        if 'onion' in name or 'onions' in name:
+            self.has_onions = True
+        if ('chili' in name or 'chilies' in name) and 'green' in descriptor:
+            self.has_greenchilies = True
+
+    def savory(self):
+        return self.is_savory and (not self.is_sweet or (self.savory_amt >= self.sweet_amt))
+
+def southasian_transform(ingredient_objects, instruction_objects, title = "placeholder", words=None):
+    #  words: the recipe's RecipeWords, if transform_all already went over it
+    banned = SOUTHASIAN_BANNED
+    to_modify = SOUTHASIAN_TO_MODIFY
+    forms = normalize_word if words is None else words.word_forms
+    totals = None if words is None else words.southasian
+    if totals is None:
+        totals = SouthAsianTotals(title)
+        for ingredient in ingredient_objects:
+            totals.add(ingredient)
+    ingredients = copy_on_write(ingredient_objects)
     
-    is_savory = False
-    savory_amt = 0  # if it has both sugar and salt, we'll determine if it's savory by seeing which it has more of
-    is_sweet = False  #  maybe not the best way to determine it but... idk.
-    sweet_amt = 0
-    is_cooked = False
-    has_onions = False
-    has_tomatoes = False
-    has_greenchilies = False
+    is_savory = totals.savory()
+    is_cooked = totals.is_cooked
+    has_onions = totals.has_onions
+    has_tomatoes = totals.has_tomatoes
+    has_greenchilies = totals.has_greenchilies
     sa_added = False
-    savory_measurement = "teaspoons"    #  setting as a default, just in case
-    sweet_measurement = "teaspoons"
     
     for ingredient in ingredients:
         
@@ -424,12 +1671,6 @@ def southasian_transform(ingredient_objects, instruction_objects, title = "place
         if 'oil' in ingredient['name'] and 'salad' not in title:   # people be putting olive oil in their salads, huh...
             ingredient['name'] = ['oil']
             ingredient['descriptor'] = ['mustard']
-            is_cooked = True
-        if 'salt' in ingredient['name'] or 'pepper' in ingredient['name']:
-            is_savory = True
-            savory_amt = savory_amt + convert_to_number(ingredient['quantity'])
-            if len(ingredient['measurement']) > 0:
-                savory_measurement = ingredient['measurement'][0]
         if 'sugar' in ingredient['name']:
             ingredient['descriptor'] = ['brown']
             banned_sugar = ['refined', 'powdered']
@@ -440,24 +1681,17 @@ def southasian_transform(ingredient_objects, instruction_objects, title = "place
             if len(to_delete) > 0:
                 for index in to_delete:
                     del ingredient['preparation'][index]
-            is_sweet = True
-            sweet_amt = sweet_amt + convert_to_number(ingredient['quantity'])
-            if len(ingredient['measurement']) > 0:
-                sweet_measurement = ingredient['measurement'][0]
         if 'tomato' in ingredient['name'] or 'tomatoes' in ingredient['name']:
-            has_tomatoes = True
             ingredient['quantity'] = [str(convert_to_number(ingredient['quantity']) * 1.5)]
         if 'onion' in ingredient['name'] or 'onions' in ingredient['name']:
-            has_onions = True
             ingredient['quantity'] = [str(convert_to_number(ingredient['quantity']) * 1.5)]
         if ('chili' in ingredient['name'] or 'chilies' in ingredient['name']) and 'green' in ingredient['descriptor']:
-            has_greenchilies = True
             ingredient['quantity'] = [str(convert_to_number(ingredient['quantity']) * 1.5)]
         if 'lettuce' in ingredient['name']:
             ingredient['name'] = 'cabbage'
         # sauce / seasoning changes
         for i,name in enumerate(ingredient['name'], 0):
-            name = name.lower()
+            name = forms(name)[0]
             if 'ponzu' == name:
                 ingredient['name'][i] = 'chili'
             elif 'hoisin' == name:
@@ -470,10 +1704,10 @@ def southasian_transform(ingredient_objects, instruction_objects, title = "place
                 ingredient['name'][i] = 'indian'
     # Determine whether or not savory, for ingredient additions
     
-    if is_savory and (not is_sweet or (savory_amt >= sweet_amt)):   # savory case
+    if is_savory:   # savory case
         if is_cooked:
-            spice_amounts = str(savory_amt / 2)
-            base_string = spice_amounts + ' ' + savory_measurement + ' '
+            spice_amounts = str(totals.savory_amt / 2)
+            base_string = spice_amounts + ' ' + totals.savory_measurement + ' '
             south_indian_spices = ['ginger paste', 'garlic paste', 'cumin powder', 'turmeric powder', 'red chili powder', 'coriander powder'] ## NOTE THAT SHOULD SEARCH FOR THESE IN THE RECIPE FIRST, SO NO DOUBLE-INGRED.
             for spice in south_indian_spices:
                 ingredients.append(parse_ingredient(base_string + spice))
@@ -491,13 +1725,13 @@ def southasian_transform(ingredient_objects, instruction_objects, title = "place
             ingredients.append(parse_ingredient('2 diced green chilies'))
 
     else:  #  sweet case
-        sweet_amounts = str(sweet_amt / 2)
-        base_string = sweet_amounts + ' ' + sweet_measurement + ' '
+        sweet_amounts = str(totals.sweet_amt / 2)
+        base_string = sweet_amounts + ' ' + totals.sweet_measurement + ' '
         south_indian_sweets = ['crushed pistachios', 'saffron']
         for sweet in south_indian_sweets:
             ingredients.append(parse_ingredient(base_string + sweet))
     
-    instructions = copy.deepcopy(instruction_objects)
+    instructions = copy_on_write(instruction_objects)
     
     first_vessel_instruction = "temp"
     
@@ -519,56 +1753,54 @@ def southasian_transform(ingredient_objects, instruction_objects, title = "place
                 if mod_word in ingredient_list[i]:
                     ingredient_list[i] = 'lamb ' + ingredient_list[i]
                     break
-            oil_types = ['sunflower', 'canola', 'olive', 'avocado', 'palm', 'bran', 'safflower', 'seed']
-            if ingredient_list[i].lower() in oil_types and i < len(ingredient_list) and ingredient_list[i+1].lower() == 'oil':
+            if forms(ingredient_list[i])[0] in SOUTHASIAN_OIL_TYPES and i < len(ingredient_list) and forms(ingredient_list[i+1])[0] == 'oil':
                 ingredient_list[i] = 'mustard'
-            if 'lettuce' in depluralize(ingredient_list[i].lower()):
+            if 'lettuce' in forms(ingredient_list[i])[1]:
                 ingredient_list[i] = 'cabbage'
-            if 'ponzu' in depluralize(ingredient_list[i].lower()):
+            if 'ponzu' in forms(ingredient_list[i])[1]:
                 ingredient_list[i] = 'chili'
-            if 'hoisin' in depluralize(ingredient_list[i].lower()):
+            if 'hoisin' in forms(ingredient_list[i])[1]:
                 ingredient_list[i] = 'tamarind'
-            if 'soy' in depluralize(ingredient_list[i].lower()) and i < len(ingredient_list) and ingredient_list[i+1].lower() == 'sauce':
+            if 'soy' in forms(ingredient_list[i])[1] and i < len(ingredient_list) and forms(ingredient_list[i+1])[0] == 'sauce':
                 ingredient_list[i] = 'sriracha'
-            if 'barbecue' in depluralize(ingredient_list[i].lower()):
+            if 'barbecue' in forms(ingredient_list[i])[1]:
                 ingredient_list[i] = 'indian barbecue'
-            if 'cajun' in depluralize(ingredient_list[i].lower()):
+            if 'cajun' in forms(ingredient_list[i])[1]:
                 ingredient_list[i] = 'indian'
-            if is_savory and (not is_sweet or (savory_amt >= sweet_amt)):
+            if is_savory:
                 if is_cooked:
-                    if depluralize(ingredient_list[i].lower()) == 'salt' and sa_added == False:
+                    if forms(ingredient_list[i])[1] == 'salt' and sa_added == False:
                         instruction['ingredients'] = ingredient_list + ['ginger paste', 'garlic paste', 'cumin powder', 'turmeric powder',
                                        'red chili powder', 'coriander powder']
                         ingredient_list = ingredient_list + ['ginger paste', 'garlic paste', 'cumin powder', 'turmeric powder',
                                        'red chili powder', 'coriander powder']
                         sa_added = True
                 else:
-                    veggies_list = ['cabbage', 'mushroom', 'tomato', 'onion', 'pepper', 'lettuce', 'broccoli', 'spinach', 'carrots', 'zucchini', 'eggplant', 'cucumber']
-                    if depluralize(ingredient_list[i].lower()) in veggies_list and sa_added == False:
+                    if forms(ingredient_list[i])[1] in SOUTHASIAN_SALAD_VEGGIES and sa_added == False:
                         instruction['ingredients'] = ingredient_list + ['cabbage', 'coriander leaves', 'mint leaves', 'cumin seeds']
                         ingredient_list = ingredient_list + ['cabbage', 'coriander leaves', 'mint leaves', 'cumin seeds']
                         sa_added = True
-                veggies_list = ['cabbage', 'mushroom', 'lettuce', 'broccoli', 'spinach', 'carrot', 'zucchini', 'eggplant', 'cucumber']
-                if not has_tomatoes and depluralize(ingredient_list[i].lower()) in veggies_list:
+                veggies_list = SOUTHASIAN_VEGGIES
+                if not has_tomatoes and forms(ingredient_list[i])[1] in veggies_list:
                     instruction['ingredients'] = ingredient_list + ['tomatoes']
                     ingredient_list = ingredient_list + ['tomatoes']
                     has_tomatoes = True
-                if not has_onions and depluralize(ingredient_list[i].lower()) in veggies_list:
+                if not has_onions and forms(ingredient_list[i])[1] in veggies_list:
                     instruction['ingredients'] = ingredient_list + ['onions']
                     ingredient_list = ingredient_list + ['onions']
                     has_onions = True
-                if not has_greenchilies and depluralize(ingredient_list[i].lower()) in veggies_list:
+                if not has_greenchilies and forms(ingredient_list[i])[1] in veggies_list:
                     instruction['ingredients'] = ingredient_list + ['green chilies']
                     ingredient_list = ingredient_list + ['green chilies']
                     has_greenchilies = True
             else:
-                if depluralize(ingredient_list[i].lower()) == 'sugar' and sa_added == False:
+                if forms(ingredient_list[i])[1] == 'sugar' and sa_added == False:
                     ingredient_list[i] = 'brown sugar'
                     instruction['ingredients'] = ingredient_list + ['pistachios', 'saffron']
                     ingredient_list = ingredient_list + ['pistachios', 'saffron']
                     sa_added = True
 
-    return instructions, ingredients
+    return share_unchanged(instructions, instruction_objects), share_unchanged(ingredients, ingredient_objects)
 
 def convert_to_number(quantity):  # converts quantity field of ingredient object to an actual number
     total_amount = 0
@@ -585,45 +1817,66 @@ def convert_to_number(quantity):  # converts quantity field of ingredient object
         return 0
     return total_amount
 
-def non_vege_to_vege(ingredient_objects, instruction_objects):
+MEAT_WORDS = ['bear', 'beef', 'heart', 'liver', 'tongue', 'buffalo', 'bison', 'calf', 'caribou', \
+              'steak', 'poultry', 'lamb'\
+              'goat', 'ham', 'horse', 'kangaroo', 'lamb', 'moose', 'mutton', 'pork', 'bacon', 'rabbit',\
+              'snake', 'squirrel', 'tripe', 'turtle', 'veal', 'venison', 'chicken', 'hen', 'duck', 'emu',\
+              'gizzard', 'goose', 'ostrich', 'partridge', 'pheasant', 'quail', 'turkey', 'baloney', 'sausage', 'sausages',\
+              'spam', 'meatloaf']
+
+FISH_WORDS = ['fish', 'salmon', 'trout', 'bass', 'catfish', 'shrimp', 'cod', 'pollock', 'tilapia', 'clam', 'clams'\
+              'crab', 'oyster', 'oysters', 'flounder', 'lobster', 'yellowtail', 'sturgeon', 'octopus', 'squid', 'caviar'\
+              'mackerel', 'anchovy', 'anchovies', 'scallop', 'scallops', 'tuna', 'eel', 'crawfish', 'crayfish']
+
+ANIMAL_FAT_WORDS = ['fat', 'lard']
+
+VEGE_BANNED_WORDS = ['chuck', 'boneless', 'boneles', 'bonel', 'bone', 'breast', 'skinless', 'loin']
+
+# For things like heart, liver, tongue, stomach, intestines
+# only replace that particular buzz word, and ignore all the other parts of the name we
+# are looking at.
+ORGAN_WORDS = ['heart', 'liver', 'tongue', 'stomach', 'intestine']
+
+# Lentils: fish eggs
+
+# Seitan: chicken, beef
+#           - Including other types of birds as well
+
+# Specific replacement for seitan
+SEITAN_REPLACES = ['beef', 'chicken', 'calf', 'goose', 'ostrich', 'partridge', 'pheasant', 'quail', 'turkey', 'hen', 'duck', 'emu']
+# Tempeh: fish, pork
+# default: tofu
+
+#  Labels are what the word gets replaced with, apart from 'organ' / 'egg' / 'fat' / 'banned', which need a bit more
+#  handling; the replacements only apply to meat / fish words, hence the intersections
+VEGE_INSTRUCTION_TABLE = SubstitutionTable([
+    ('seitan', [word for word in SEITAN_REPLACES if word in MEAT_WORDS + FISH_WORDS], 'base'),
+    ('tempeh', FISH_WORDS + ['pork'], 'base'),
+    ('organ', [word for word in ORGAN_WORDS if word in MEAT_WORDS + FISH_WORDS], 'base'),
+    ('tofu', MEAT_WORDS + FISH_WORDS, 'base'),
+    ('egg', ['egg'], 'base'),
+    ('fat', ANIMAL_FAT_WORDS, 'base'),
+    ('banned', VEGE_BANNED_WORDS, 'either')])
+#  the ingredient names also count a word as meat / fish if it's in the lists as-is (e.g. 'sausages')
+VEGE_NAME_TABLE = SubstitutionTable([
+    ('seitan', [word for word in SEITAN_REPLACES if word in MEAT_WORDS + FISH_WORDS], 'base'),
+    ('tempeh', FISH_WORDS, 'base'),
+    ('tempeh', ['pork'], 'either'),
+    ('organ', [word for word in ORGAN_WORDS if word in MEAT_WORDS + FISH_WORDS], 'base'),
+    ('tofu', MEAT_WORDS + FISH_WORDS, 'either'),
+    ('egg', ['egg'], 'base'),
+    ('fat', ANIMAL_FAT_WORDS, 'base'),
+    ('banned', VEGE_BANNED_WORDS, 'lower')])
+VEGE_DESCRIPTOR_TABLE = SubstitutionTable([
+    ('meat', MEAT_WORDS + FISH_WORDS, 'base'),
+    ('banned', VEGE_BANNED_WORDS, 'lower')])
+
+def non_vege_to_vege(ingredient_objects, instruction_objects, words=None):
+    classify = SubstitutionTable.classify if words is None else words.classify     # words: see RecipeWords
     #    ingredients_objects = find_ingredients_objects(ing_strings)
     #   all_ingredients = full_ingredients_list(ingredients_objects)
-    meats = ['bear', 'beef', 'heart', 'liver', 'tongue', 'buffalo', 'bison', 'calf', 'caribou', \
-            'steak', 'poultry', 'lamb'\
-            'goat', 'ham', 'horse', 'kangaroo', 'lamb', 'moose', 'mutton', 'pork', 'bacon', 'rabbit',\
-            'snake', 'squirrel', 'tripe', 'turtle', 'veal', 'venison', 'chicken', 'hen', 'duck', 'emu',\
-            'gizzard', 'goose', 'ostrich', 'partridge', 'pheasant', 'quail', 'turkey', 'baloney', 'sausage', 'sausages',\
-            'spam', 'meatloaf']
-
-    fish = ['fish', 'salmon', 'trout', 'bass', 'catfish', 'shrimp', 'cod', 'pollock', 'tilapia', 'clam', 'clams'\
-            'crab', 'oyster', 'oysters', 'flounder', 'lobster', 'yellowtail', 'sturgeon', 'octopus', 'squid', 'caviar'\
-            'mackerel', 'anchovy', 'anchovies', 'scallop', 'scallops', 'tuna', 'eel', 'crawfish', 'crayfish']
-
-    fats = ['fat', 'lard']
-
-    banned = ['chuck', 'boneless', 'boneles', 'bonel', 'bone', 'breast', 'skinless', 'loin']
-
-    # For things like heart, liver, tongue, stomach, intestines
-    # only replace that particular buzz word, and ignore all the other parts of the name we
-    # are looking at.
-    spec_organs_or_misc = ['heart', 'liver', 'tongue', 'stomach', 'intestine']
-
-    # Lentils: fish eggs
-
-    # Seitan: chicken, beef
-    #           - Including other types of birds as well
-
-    # Specific replacement for seitan
-    spec_replacements = ['beef', 'chicken', 'calf', 'goose', 'ostrich', 'partridge', 'pheasant', 'quail', 'turkey', 'hen', 'duck', 'emu']
-    # Tempeh: fish, pork
-    # default: tofu
-
-    vegeList = ['tofu', 'tempeh', 'seitan', 'lentils']
-    vege = 'tofu'
-    
     transformed_instruction = []
-    new_ingredient_objects = []
-    instruction_object_copy = copy.deepcopy(instruction_objects)
+    instruction_object_copy = copy_on_write(instruction_objects)
     #loop over all intructions
     for instruction in instruction_object_copy:
         prev_ingredient = ''
@@ -631,50 +1884,44 @@ def non_vege_to_vege(ingredient_objects, instruction_objects):
         c_ingredients = instruction['ingredients']
         if c_ingredients:
             for c_ingre in c_ingredients:
+                kind = classify(VEGE_INSTRUCTION_TABLE, c_ingre)
                 c_ingre = c_ingre.lower()
                 # print('c_ingre = [{0}]'.format(c_ingre))
-                if depluralize(c_ingre) in meats or depluralize(c_ingre) in fish:
-                    if depluralize(c_ingre) in spec_replacements:
-                        vege_ingre.append('seitan')
-                    elif depluralize(c_ingre) in fish or depluralize(c_ingre) == 'pork' or c_ingre == 'pork':
-                        vege_ingre.append('tempeh')
-                    elif depluralize(c_ingre) in spec_organs_or_misc:
-                        # get rid of first part of organ name (i.e., pig intestine, cow tongue, etc)
-                        vege_ingre.pop()
-                        vege_ingre.append('tofu')
-                    else:
-                        vege_ingre.append('tofu')
-                elif depluralize(c_ingre) == 'egg':
-                    if prev_ingredient == 'fish' or prev_ingredient in fish:
+                if kind == 'organ':
+                    # get rid of first part of organ name (i.e., pig intestine, cow tongue, etc)
+                    vege_ingre.pop()
+                    vege_ingre.append('tofu')
+                elif kind == 'egg':
+                    if prev_ingredient == 'fish' or prev_ingredient in FISH_WORDS:
                         vege_ingre.pop()
                         vege_ingre.append('lentils')
-                elif depluralize(c_ingre) in fats:
+                elif kind == 'fat':
                     vege_ingre.append('butter')
-                elif c_ingre not in banned and depluralize(c_ingre) not in banned:
+                elif kind is None:
                     vege_ingre.append(c_ingre)
+                elif kind != 'banned':
+                    vege_ingre.append(kind)
 
                 prev_ingredient = c_ingre
         instruction['ingredients'] = vege_ingre
         transformed_instruction.append(instruction)
     #transfer the ingredients list
-    for c_ingre in ingredient_objects:
+    ingredients = copy_on_write(ingredient_objects)
+    for c_ingre in ingredients:
         n = c_ingre['name']
         desc = c_ingre['descriptor']
         prev_ingredient = ''
         for i,string in enumerate(n, 0):
+            kind = classify(VEGE_NAME_TABLE, string)
             string = string.lower()
             # print('Receiving string: {0}'.format(string))
-            if depluralize(string) in meats or depluralize(string) in fish or (string in meats or string in fish):
+            if kind in ('seitan', 'tempeh', 'organ', 'tofu'):
                 # replace with relevant vegetable
-                if depluralize(string) in spec_replacements:
-                    c_ingre['name'][i] = 'seitan'
-                elif depluralize(string) in fish or depluralize(string) == 'pork' or string =='pork':
-                    c_ingre['name'][i] = 'tempeh'
-                elif depluralize(string) in spec_organs_or_misc:
+                if kind == 'organ':
                     c_ingre['name'][i] = 'tofu'
                     c_ingre['name'][i-1] = ''
                 else:
-                    c_ingre['name'][i] = 'tofu'
+                    c_ingre['name'][i] = kind
 
                 if 'sweet' in c_ingre['descriptor'] and 'salty' in c_ingre['descriptor']:
                     c_ingre['descriptor'] = ['sweet', 'salty']
@@ -683,8 +1930,8 @@ def non_vege_to_vege(ingredient_objects, instruction_objects):
                 elif 'salty' in c_ingre['descriptor']:
                     c_ingre['descriptor'] = ['salty']
 
-            elif depluralize(string) == 'egg':
-                if prev_ingredient == 'fish' or prev_ingredient in fish:
+            elif kind == 'egg':
+                if prev_ingredient == 'fish' or prev_ingredient in FISH_WORDS:
                     c_ingre['name'][i] = 'lentils'
                     if 'sweet' in c_ingre['descriptor'] and 'salty' in c_ingre['descriptor']:
                         c_ingre['descriptor'] = ['sweet', 'salty']
@@ -694,29 +1941,38 @@ def non_vege_to_vege(ingredient_objects, instruction_objects):
                         c_ingre['descriptor'] = ['salty']
 
                     c_ingre['name'][i-1] = ''
-            elif depluralize(string) in fats:
+            elif kind == 'fat':
                 vege_ingre.append('butter')
                 c_ingre['name'][i] = 'butter'
-            elif string in banned or string in banned:
+            elif kind == 'banned':
                 c_ingre['name'][i] = ''
 
             prev_ingredient = string
 
         for i,string in enumerate(desc, 0):
-            if depluralize(string.lower()) in meats or depluralize(string.lower()) in fish:
+            kind = classify(VEGE_DESCRIPTOR_TABLE, string)
+            if kind == 'meat':
                 # change descriptor, so basically just make it vegetable
                 c_ingre['descriptor'][i] = 'vegetable'
-            elif string.lower() in banned:
+            elif kind == 'banned':
                 c_ingre['descriptor'].pop(i)
 
         c_ingre['name'] = [x for x in c_ingre['name'] if x != '']
 
 
-    return transformed_instruction,ingredient_objects
+    return share_unchanged(transformed_instruction, instruction_objects), share_unchanged(ingredients, ingredient_objects)
 
 # This one is pretty funny: https://www.allrecipes.com/recipe/14280/fresh-broccoli-salad/
 
-def vege_to_non_vege(ingredient_objects, instruction_objects):
+#  labels are the replacements
+MEAT_SUBSTITUTES_TABLE = SubstitutionTable([
+    ('beef', ['tofu'], 'base'),
+    ('pork', ['tempeh'], 'base'),
+    ('bacon', ['lettuce', 'spinach'], 'base'),
+    ('chicken', ['broccoli', 'eggplant', 'mushroom'], 'base')])
+
+def vege_to_non_vege(ingredient_objects, instruction_objects, words=None):
+    classify = SubstitutionTable.classify if words is None else words.classify     # words: see RecipeWords
     #    ingredients_objects = find_ingredients_objects(ing_strings)
     #   all_ingredients = full_ingredients_list(ingredients_objects)
     # Replace tofu with beef
@@ -727,7 +1983,7 @@ def vege_to_non_vege(ingredient_objects, instruction_objects):
     #     ing_data = {'name': [], 'quantity': [], 'measurement': [], 'descriptor': [], 'preparation': []}
 
     transformed_instruction = []
-    instruction_object_copy = copy.deepcopy(instruction_objects)
+    instruction_object_copy = copy_on_write(instruction_objects)
     #loop over all intructions
     num_bacon = 0
     for instruction in instruction_object_copy:
@@ -737,21 +1993,12 @@ def vege_to_non_vege(ingredient_objects, instruction_objects):
         c_ingredients = instruction['ingredients']
         if c_ingredients:
             for c_ingre in c_ingredients:
-                c_ingre = c_ingre.lower()
-                if depluralize(c_ingre) == 'tofu':
-                    meat_ingre.append('beef')
-                    full_ingre.append('beef')
-                elif depluralize(c_ingre) == 'tempeh':
-                    meat_ingre.append('pork')
-                    full_ingre.append('pork')
-                elif depluralize(c_ingre) == 'lettuce' or depluralize(c_ingre) == 'spinach':
-                    meat_ingre.append('bacon')
-                    full_ingre.append('bacon')
-                elif depluralize(c_ingre) == 'broccoli' or depluralize(c_ingre) == 'eggplant' or depluralize(c_ingre) == 'mushroom':
-                    meat_ingre.append('chicken')
-                    full_ingre.append('chicken')
+                meat = classify(MEAT_SUBSTITUTES_TABLE, c_ingre)
+                if meat is not None:
+                    meat_ingre.append(meat)
+                    full_ingre.append(meat)
                 else:
-                    full_ingre.append(c_ingre)
+                    full_ingre.append(c_ingre.lower())
 
             if not meat_ingre:
                 full_ingre.append('bacon')
@@ -760,31 +2007,22 @@ def vege_to_non_vege(ingredient_objects, instruction_objects):
         instruction['ingredients'] = full_ingre
         transformed_instruction.append(instruction)
     #transfer the ingredients list
-    ingredient_objects.append({'name': ['bacon'], 'quantity': ['{0}'.format(num_bacon*2)], 'measurement': ['strips'], 'descriptor': ['crispy'], 'preparation': ['crumbled']})
-    for c_ingre in ingredient_objects:
+    ingredients = copy_on_write(ingredient_objects)
+    ingredients.append(Ingredient(name=['bacon'], quantity=['{0}'.format(num_bacon*2)], measurement=['strips'], descriptor=['crispy'], preparation=['crumbled']))
+    for c_ingre in ingredients:
         n = c_ingre['name']
         desc = c_ingre['descriptor']
         for i,string in enumerate(n, 0):
-            string = string.lower()
-
-            if depluralize(string) == 'tofu':
-                c_ingre['name'][i] = 'beef'
-                c_ingre['descriptor'] = []
-            elif depluralize(string) == 'tempeh':
-                c_ingre['name'][i] = 'pork'
-                c_ingre['descriptor'] = []
-            elif depluralize(string) == 'lettuce' or depluralize(string) == 'spinach':
-                c_ingre['name'][i] = 'bacon'
-                c_ingre['descriptor'] = []
-            elif depluralize(string) == 'broccoli' or depluralize(string) == 'eggplant' or depluralize(string) == 'mushroom':
-                c_ingre['name'][i] = 'chicken'
+            meat = classify(MEAT_SUBSTITUTES_TABLE, string)
+            if meat is not None:
+                c_ingre['name'][i] = meat
                 c_ingre['descriptor'] = []
 
     # if we never replace things, go ahead and add bacon bits to it
     # because bacon goes well with 'everything'
 
 
-    return transformed_instruction,ingredient_objects
+    return share_unchanged(transformed_instruction, instruction_objects), share_unchanged(ingredients, ingredient_objects)
 
 
 
@@ -812,26 +2050,31 @@ replace with 'Italian Sausage'
 	-
 '''     
 
-def italian_transform(ingredient_objects, instruction_objects):
+FOREIGN_SPICES = ['cajun', 'creole', 'cumin', 'cayenne', 'curry', 'saffron', 'cilantro', 'taco']
+ITALIAN_SPICES = ['basil', 'bayleaves', 'sage', 'rosemary', 'marjoram', 'garlic', 'oregano', 'parsley', 'thyme']
 
-	foreign_spices = ['cajun', 'creole', 'cumin', 'cayenne', 'curry', 'saffron', 'cilantro', 'taco']
-	ital_spices = ['basil', 'bayleaves', 'sage', 'rosemary', 'marjoram', 'garlic', 'oregano', 'parsley', 'thyme']
+FOREIGN_SAUCES = ['ponzu', 'hoisin', 'soy', 'sweet and sour', 'teriyaki', 'sriracha', 'barbecue']
+ITALIAN_SAUCES = ['pesto', 'alfredo', 'marinara', 'vodka', 'tomato', 'neapolitan']
 
-	foreign_sauces = ['ponzu', 'hoisin', 'soy', 'sweet and sour', 'teriyaki', 'sriracha', 'barbecue']
-	ital_sauces = ['pesto', 'alfredo', 'marinara', 'vodka', 'tomato', 'neapolitan']
+FOREIGN_PROTEINS = ['bear', 'buffalo', 'bison', 'caribou', 'lamb', 'goat', 'horse', 'kangaroo', 'moose', 'mutton', 'rabbit',
+                    'snake', 'squirrel', 'tripe', 'turtle', 'emu', 'gizzard', 'ostrich', 'partridge', 'pheasant', 'quail', 'spam',
+                    'bass', 'catfish', 'cod', 'pollock', 'clam', 'clams', 'flounder', 'lobster', 'yellowtail', 'sturgeon', 'mackerel',
+                    'eel', 'crawfish', 'crayfish']
+ITALIAN_OILS = ['fat', 'lard', 'oil']
 
-	italian_proteins = ['chicken', 'beef', 'sausage', 'shrimp', 'pork', 'steak', 'bacon', 'ham', 'turkey', 'fish', 'salmon', 'trout', 
-						'catfish', 'shrimp', 'pollock', 'clam', 'clams', 'crab', 'oyster', 'oysters', 'lobster', 'octopus', 'squid', 
-						'caviar', 'mackerel', 'anchovy', 'anchovies', 'scallop', 'scallops', 'tuna', 'eel', 'crawfish', 'crayfish']
-	
-	foreign_proteins = ['bear', 'buffalo', 'bison', 'caribou', 'lamb', 'goat', 'horse', 'kangaroo', 'moose', 'mutton', 'rabbit',
-				       'snake', 'squirrel', 'tripe', 'turtle', 'emu', 'gizzard', 'ostrich', 'partridge', 'pheasant', 'quail', 'spam',
-				       'bass', 'catfish', 'cod', 'pollock', 'clam', 'clams', 'flounder', 'lobster', 'yellowtail', 'sturgeon', 'mackerel',
-				       'eel', 'crawfish', 'crayfish']
-	oils = ['fat', 'lard', 'oil']
+ITALIAN_TABLE = SubstitutionTable([
+    ('protein', FOREIGN_PROTEINS, 'base'),
+    ('oil', ITALIAN_OILS, 'base'),
+    ('rice', ['rice'], 'base'),
+    ('spice', FOREIGN_SPICES, 'base'),
+    ('sauce', FOREIGN_SAUCES, 'base')])
+
+def italian_transform(ingredient_objects, instruction_objects, words=None):
+	import random
+	classify = SubstitutionTable.classify if words is None else words.classify     # words: see RecipeWords
 
 	transformed_instruction = []
-	instruction_object_copy = copy.deepcopy(instruction_objects)
+	instruction_object_copy = copy_on_write(instruction_objects)
     
 	ital_spice = []
 	ital_sauce = []
@@ -845,23 +2088,24 @@ def italian_transform(ingredient_objects, instruction_objects):
 		c_ingredients = instruction['ingredients']
 		if c_ingredients:
 			for c_ingre in c_ingredients:
+				kind = classify(ITALIAN_TABLE, c_ingre)
 				c_ingre = c_ingre.lower()
 
-				if depluralize(c_ingre) in foreign_proteins:
+				if kind == 'protein':
 					ital_ingre.append('sausage')
-				elif depluralize(c_ingre) in oils:
+				elif kind == 'oil':
 					ital_ingre.append('olive oil')
-				elif depluralize(c_ingre) == 'rice':
+				elif kind == 'rice':
 					ital_ingre.append('risotto')
 
 				#eliminating foreign spices and sauces
-				elif depluralize(c_ingre) in foreign_spices:
-					random_spice = random.choice(ital_spices)
+				elif kind == 'spice':
+					random_spice = random.choice(ITALIAN_SPICES)
 					ital_ingre.append(random_spice)
 					#to add same random spice later to ingredients
 					ital_spice.append(random_spice)
-				elif depluralize(c_ingre) in foreign_sauces:
-					random_sauce = random.choice(ital_sauces)
+				elif kind == 'sauce':
+					random_sauce = random.choice(ITALIAN_SAUCES)
 					ital_ingre.append(random_sauce)
 					#to add same random sauce later to ingredients
 					ital_sauce.append(random_sauce)
@@ -872,29 +2116,31 @@ def italian_transform(ingredient_objects, instruction_objects):
 
 
     #transfer the ingredients list
-	for c_ingre in ingredient_objects:
+	ingredients = copy_on_write(ingredient_objects)
+	for c_ingre in ingredients:
 		n = c_ingre['name']
 		desc = c_ingre['descriptor']
 		prev_ingredient = ''
 		for i,string in enumerate(n, 0):
+			kind = classify(ITALIAN_TABLE, string)
 			string = string.lower()
 
-			if depluralize(string) in foreign_proteins:
+			if kind == 'protein':
 				c_ingre['name'] = ['sausage']
 				c_ingre['descriptor'] = ['italian']
-			elif depluralize(string) in oils:
+			elif kind == 'oil':
 				c_ingre['name'] = ['oil']
 				c_ingre['descriptor'] = ['olive']
-			elif depluralize(string) in foreign_spices:
+			elif kind == 'spice':
 				c_ingre['name'] = [ital_spice.pop()]
-			elif depluralize(string) in foreign_sauces:
+			elif kind == 'sauce':
 				c_ingre['name'] = [ital_sauce.pop()]
 				c_ingre['descriptor'] = ['sauce']
 
 
 			prev_ingredient = string
 
-	return transformed_instruction, ingredient_objects
+	return share_unchanged(transformed_instruction, instruction_objects), share_unchanged(ingredients, ingredient_objects)
 
 def depluralize(ingredient):
     if ingredient == 'cheeses':
@@ -908,7 +2154,25 @@ def depluralize(ingredient):
     else:
         return ingredient
 
-def non_heal_to_heal(ingredient_objects, instruction_objects):
+HEALTHY_NAME_TABLE = SubstitutionTable([
+    ('cream', ['cream'], 'base'),
+    ('cheese', ['cheese', 'chees'], 'base'),
+    ('peanut', ['peanut'], 'base'),
+    ('flour', ['flour'], 'base'),
+    ('lettuce', ['lettuce'], 'base'),
+    ('halve', ['sugar', 'salt'], 'base'),
+    ('chocolate', ['chocolate'], 'base'),
+    ('fat', ['butter', 'oil'], 'base')])
+#  labels are the replacements ('yogurt' only once there's sour cream)
+HEALTHY_INSTRUCTION_TABLE = SubstitutionTable([
+    ('quinoa', ['rice'], 'base'),
+    ('mustard', ['mayo', 'mayonnaise'], 'base'),
+    ('cacao', ['chocolate'], 'base'),
+    ('almond', ['crouton', 'peanut'], 'base'),
+    ('spinach', ['lettuce'], 'base'),
+    ('yogurt', ['cream'], 'base')])
+
+def non_heal_to_heal(ingredient_objects, instruction_objects, words=None):
     """
     Substitutes to consider:
         Rice -> Quinoa                  (150% more fiber and protein for same serving)
@@ -930,37 +2194,39 @@ def non_heal_to_heal(ingredient_objects, instruction_objects):
         instruction_object = {'ingredients': [], 'parsed_tools': [], 'inferred_tools': [], 'parsed_methods': [], 'inferred_methods': [],
         'primary_method':[],'other_method':[]}
     """
+    classify = SubstitutionTable.classify if words is None else words.classify     # words: see RecipeWords
     transformed_instruction = []
 
     found_sour_cream = False
     #transfer the ingredients list
-    for c_ingre in ingredient_objects:
+    ingredients = copy_on_write(ingredient_objects)
+    for c_ingre in ingredients:
         n = c_ingre['name']
         desc = c_ingre['descriptor']
         for i,string in enumerate(n, 0):
-            string = string.lower()
-            if depluralize(string) == 'cream' and 'sour' in desc:
+            kind = classify(HEALTHY_NAME_TABLE, string)
+            if kind == 'cream' and 'sour' in desc:
                 c_ingre['name'][i] = 'yogurt'
                 map(lambda x:x if x != 'sour' else 'greek',c_ingre['descriptor'])
-            elif depluralize(string) == 'cheese' or depluralize(string) == 'chees':
+            elif kind == 'cheese':
                 c_ingre['descriptor'].append('low-fat')
-            elif depluralize(string) == 'peanut':
+            elif kind == 'peanut':
                 c_ingre['name'][i] = 'almond'
                 # in general should be healthier, so can replace peanuts with almonds in general
-            elif depluralize(string) == 'flour':
+            elif kind == 'flour':
                 c_ingre['name'] = ['coconut', 'flour']
-            elif depluralize(string) == 'lettuce':
+            elif kind == 'lettuce':
                 c_ingre['name'] = ['spinach']
-            elif depluralize(string) in ['sugar', 'salt']:
+            elif kind == 'halve':
                 val = convert_to_number(c_ingre['quantity'])
                 val = val / 2
                 # just half the level of salt and level of sugar
                 c_ingre['quantity'] = ['{0}'.format(val)]
-            elif depluralize(string) == 'chocolate':
+            elif kind == 'chocolate':
                 val = convert_to_number(c_ingre['quantity'])
                 val = (val * 3)/4
                 c_ingre['name'][i] = 'cacao'
-            elif (depluralize(string) == 'butter' or depluralize(string) == 'oil')\
+            elif kind == 'fat'\
             and not ('almond' in c_ingre['name'] or 'peanut' in c_ingre['name'])\
             and not ('almond' in c_ingre['descriptor'] or 'peanut' in c_ingre['descriptor']):
                 # Change fat type and decrease it by 25%
@@ -976,28 +2242,18 @@ def non_heal_to_heal(ingredient_objects, instruction_objects):
             map(lambda x:x if x != 'chocolate' else 'cacao', c_ingre['descriptor'])
 
 
-    instruction_object_copy = copy.deepcopy(instruction_objects)
+    instruction_object_copy = copy_on_write(instruction_objects)
     #loop over all intructions
     for instruction in instruction_object_copy:
         healthy_ingredients = []
         c_ingredients = instruction['ingredients']
         if c_ingredients:
             for c_ingre in c_ingredients:
-                c_ingre = c_ingre.lower()
-                if depluralize(c_ingre) == 'rice':
-                    healthy_ingredients.append('quinoa')
-                elif depluralize(c_ingre) == 'mayo' or depluralize(c_ingre) == 'mayonnaise':
-                    healthy_ingredients.append('mustard')
-                elif depluralize(c_ingre) == 'chocolate':
-                    healthy_ingredients.append('cacao')
-                elif depluralize(c_ingre) == 'crouton' or depluralize(c_ingre) == 'peanut':
-                    healthy_ingredients.append('almond')
-                elif depluralize(c_ingre) == 'lettuce':
-                    healthy_ingredients.append('spinach')
-                elif found_sour_cream and depluralize(c_ingre) == 'cream':
-                    healthy_ingredients.append('yogurt')                    
+                healthier = classify(HEALTHY_INSTRUCTION_TABLE, c_ingre)
+                if healthier is not None and (healthier != 'yogurt' or found_sour_cream):
+                    healthy_ingredients.append(healthier)
                 else:
-                    healthy_ingredients.append(c_ingre)
+                    healthy_ingredients.append(c_ingre.lower())
 
                 #elif depluralize(c_ingre) == 'sour':
                 #    healthy_ingredients.append('greek')
@@ -1010,43 +2266,64 @@ def non_heal_to_heal(ingredient_objects, instruction_objects):
         instruction['ingredients'] = healthy_ingredients
         transformed_instruction.append(instruction)
 
-    return transformed_instruction,ingredient_objects
-
-def heal_to_non_heal(ingredient_objects, instruction_objects):
+    return share_unchanged(transformed_instruction, instruction_objects), share_unchanged(ingredients, ingredient_objects)
+
+UNHEALTHY_NAME_TABLE = SubstitutionTable([
+    ('yogurt', ['yogurt', 'yoghurt'], 'base'),
+    ('cheese', ['cheese'], 'base'),
+    ('almond', ['almond'], 'base'),
+    ('rice', ['rice', 'quinoa'], 'base'),
+    ('flour', ['flour'], 'base'),
+    ('greens', ['spinach', 'aragula', 'cabbage'], 'base'),
+    ('double', ['sugar', 'salt'], 'base'),
+    ('fat', ['butter', 'oil'], 'base')])
+#  labels are the replacements ('cream' only once there's sour cream)
+UNHEALTHY_INSTRUCTION_TABLE = SubstitutionTable([
+    ('rice', ['quinoa'], 'base'),
+    ('mayonnaise', ['mustard'], 'base'),
+    ('chocolate', ['cacao'], 'base'),
+    ('crouton', ['almond'], 'base'),
+    ('lettuce', ['spinach', 'aragula', 'cabbage'], 'base'),
+    ('lard', ['oil', 'butter'], 'base'),
+    ('cream', ['yogurt', 'yoghurt'], 'base')])
+
+def heal_to_non_heal(ingredient_objects, instruction_objects, words=None):
+    classify = SubstitutionTable.classify if words is None else words.classify     # words: see RecipeWords
     transformed_instruction = []
 
     found_sour_cream = False
     #transfer the ingredients list
-    for c_ingre in ingredient_objects:
+    ingredients = copy_on_write(ingredient_objects)
+    for c_ingre in ingredients:
         n = c_ingre['name']
         desc = c_ingre['descriptor']
         for i,string in enumerate(n, 0):
-            string = string.lower()
-            if depluralize(string) == 'yogurt' or depluralize(string) == 'yoghurt':
+            kind = classify(UNHEALTHY_NAME_TABLE, string)
+            if kind == 'yogurt':
                 c_ingre['name'] = ['cream']
                 c_ingre['descriptor'] = ['sour']
-            elif depluralize(string) == 'cheese':
+            elif kind == 'cheese':
                 map(lambda x:x if x != 'low-fat' else 'full-fat',c_ingre['descriptor'])
                 if not 'full-fat' in c_ingre['descriptor']:
                     c_ingre['descriptor'].append('full-fat')
-            elif depluralize(string) == 'almond':
+            elif kind == 'almond':
                 c_ingre['name'][i] = 'peanut'
                 # in general should be healthier, so can replace peanuts with almonds in general
-            elif depluralize(string) == 'rice' or depluralize(string) == 'quinoa':
+            elif kind == 'rice':
                 c_ingre['name'][i] = 'rice'
                 c_ingre['descriptor'] = ['processed']
-            elif depluralize(string) == 'flour':
+            elif kind == 'flour':
                 c_ingre['name'] = ['flour']
                 c_ingre['descriptor'] = ['white']
-            elif depluralize(string) == 'spinach' or depluralize(string) == 'aragula' or depluralize(string) == 'cabbage':
+            elif kind == 'greens':
                 c_ingre['name'] = ['lettuce']
                 c_ingre['descriptor'] = ['romaine']
-            elif depluralize(string) in ['sugar', 'salt']:
+            elif kind == 'double':
                 val = convert_to_number(c_ingre['quantity'])
                 val = val * 2
                 # just half the level of salt and level of sugar
                 c_ingre['quantity'] = ['{0}'.format(val)]
-            elif (depluralize(string) == 'butter' or depluralize(string) == 'oil')\
+            elif kind == 'fat'\
             and not ('almond' in c_ingre['name'] or 'peanut' in c_ingre['name'])\
             and not ('almond' in c_ingre['descriptor'] or 'peanut' in c_ingre['descriptor']):
                 # Change fat type and increase it by 25%
@@ -1058,81 +2335,75 @@ def heal_to_non_heal(ingredient_objects, instruction_objects):
             elif 'almond' in c_ingre['descriptor']:
                 map(lambda x:x if x != 'almond' else 'peanut', c_ingre['descriptor'])
 
-    instruction_object_copy = copy.deepcopy(instruction_objects)
+    instruction_object_copy = copy_on_write(instruction_objects)
     #loop over all intructions
     for instruction in instruction_object_copy:
         not_healthy_ingredients = []
         c_ingredients = instruction['ingredients']
         if c_ingredients:
             for c_ingre in c_ingredients:
-                c_ingre = c_ingre.lower()
-                if depluralize(c_ingre) == 'quinoa':
-                    not_healthy_ingredients.append('rice')
-                elif depluralize(c_ingre) == 'mustard':
-                    not_healthy_ingredients.append('mayonnaise')
-                elif depluralize(c_ingre) == 'cacao':
-                    not_healthy_ingredients.append('chocolate')
-                elif depluralize(c_ingre) == 'almond':
-                    not_healthy_ingredients.append('crouton')
-                elif depluralize(c_ingre) == 'spinach' or depluralize(string) == 'aragula' or depluralize(string) == 'cabbage':
-                    not_healthy_ingredients.append('lettuce')
-                elif depluralize(c_ingre) == 'oil' or depluralize(c_ingre) == 'butter':
-                    not_healthy_ingredients.append('lard')
-                elif found_sour_cream and (depluralize(c_ingre) == 'yogurt' or depluralize(c_ingre) == 'yoghurt'):
-                    not_healthy_ingredients.append('cream')                    
+                unhealthier = classify(UNHEALTHY_INSTRUCTION_TABLE, c_ingre)
+                if unhealthier is not None and (unhealthier != 'cream' or found_sour_cream):
+                    not_healthy_ingredients.append(unhealthier)
                 else:
-                    not_healthy_ingredients.append(c_ingre)
+                    not_healthy_ingredients.append(c_ingre.lower())
 
         instruction['ingredients'] = not_healthy_ingredients
         transformed_instruction.append(instruction)
 
-    return transformed_instruction,ingredient_objects 
+    return share_unchanged(transformed_instruction, instruction_objects), share_unchanged(ingredients, ingredient_objects) 
 
-def generate_ingredient_string(ing):
-    special_case = False
-    ing_fields = [ing['measurement'], ing['descriptor'], ing['preparation'], ing['name']]
-    if ing['measurement'] == ['to', 'taste']:
-        special_case = True
-    temp = []
-    for field in ing_fields:
-        temp.append("".join([" "+i if not i.startswith("'") and i not in string.punctuation else i for i in field]).strip())
-    ing_string = "".join([" "+i if not i.startswith("'") and i not in string.punctuation else i for i in temp]).strip()
-    if special_case:
-        print(ing_string + ", to taste")
-    else:
-        if check_if_real(ing):
-            print(str(ing['quantity'][0]) + " " + ing_string)
+#  every token the old `i not in string.punctuation` checks treated as punctuation: that was a substring test, so
+#  besides single characters it also caught '' and runs like '()' or '.,' ... kept the same, but as one set lookup
+PUNCTUATION = frozenset(string.punctuation[i:j] for i in range(0, len(string.punctuation) + 1)
+                        for j in range(i, len(string.punctuation) + 1))
 
+def join_tokens(tokens):
+    #  spaces between tokens, except before punctuation and contractions ("'s")
+    return "".join([" "+i if not i.startswith("'") and i not in PUNCTUATION else i for i in tokens]).strip()
+
+def generate_ingredient_string(ing):
+    #  the ingredient as a line of text, e.g. "1 cup chopped onion"; None for ones too blank to show (see check_if_real)
+    measurement = record_words(ing, 'measurement')
+    ing_string = join_tokens([join_tokens(record_words(ing, field)) for field in ('measurement', 'descriptor', 'preparation', 'name')])
+    if list(measurement) == ['to', 'taste']:
+        return ing_string + ", to taste"
+    if check_if_real(ing):
+        return str(record_words(ing, 'quantity')[0]) + " " + ing_string
+    return None
 
 def check_if_real(ing):
     # 4/5 threshold
     num_blank = 0
     fields = ['descriptor', 'measurement', 'name', 'preparation', 'quantity']
     for field in fields:
-        if ing[field] == []:
+        if list(record_words(ing, field)) == []:
             num_blank = num_blank + 1
     if num_blank < 4:
         return True
     else:
         return False
 
-def print_original_info(title, ing_strings, dir_strings):
+def original_title(title):
+    #  the page title up to "Recipe" ("Cajun Chicken Pasta Recipe - Allrecipes.com" --> "Cajun Chicken Pasta"); titles
+    #  without it (e.g. from dumps) are kept whole
     title_tokens = word_tokenize(title)
-    cutoff_index = -1
+    cutoff_index = len(title_tokens)
     for i in range(0, len(title_tokens)):
         if title_tokens[i] == "Recipe":
             cutoff_index = i
             break
-    real_title = title_tokens[:cutoff_index]
-    print("Recipe title: " + " ".join(real_title))
-    print("Ingredients:")
-    print(ing_strings)
-    print("Instructions:")
-    print(dir_strings)
+    return " ".join(title_tokens[:cutoff_index])
+
+def print_original_info(title, ing_strings, dir_strings):
+    sys.stdout.write(TextRenderer().original_info(title, ing_strings, dir_strings).getvalue())
 
 def fetch_cooking_time(dir_string):
-    time_units = ['seconds','minutes','hours']
     words = word_tokenize(dir_string)
+    return fetch_cooking_time_helper(words)
+
+def fetch_cooking_time_helper(words):
+    time_units = ['seconds','minutes','hours']
     for time_unit in time_units:
         if time_unit in words:
             scale = words[words.index(time_unit)-1]
@@ -1142,83 +2413,1065 @@ def fetch_cooking_time(dir_string):
             else:
                 return str(scale)+' '+ time_unit
 
-def generate_output_steps(instructions_objects):
-    instruction_list = []
-    for i in range(len(instructions_objects)):
-        instruction_step = {"ingredients":[],"tools":[],"primary_methods":[],"other_methods":[],
-    "cooking_time":[]}
-        instruction_step['step'] = i+1
-        # if not instructions_objects[i]['ingredients']:
-        instruction_step['ingredients']+= instructions_objects[i]['ingredients']
-        instruction_step['ingredients'] = list(set(instruction_step['ingredients']))
-        
-        all_tools = list(set(instructions_objects[i]["parsed_tools"] + instructions_objects[i]["inferred_tools"])) 
-        # print ("tools",all_tools)
-        # if not all_tools:
-        instruction_step['tools'] += all_tools
-        # if not instructions_objects[i]['primary_method']:
-        instruction_step['primary_methods'] += instructions_objects[i]['primary_method']
-        # if not instructions_objects[i]['other_method']:
-        instruction_step['other_methods'] += instructions_objects[i]['other_method']
-        instruction_step['cooking_time'] += instructions_objects[i]['cooking_time']
-        instruction_step['ingredients'] = instruction_step['ingredients'][::-1]
-        instruction_list.append(instruction_step)
-
-    #merge if the ingredients in none
-    valid_steps = [ins['step']-1 for ins in instruction_list if ins['ingredients']]
-    empty_steps = [ins['step']-1 for ins in instruction_list if not ins['ingredients']]
-    merge_list = {}
-    for empty_step in empty_steps:
-        difference = [abs(empty_step - valid_step)for valid_step in valid_steps]
-        merge_target = valid_steps[difference.index(min(difference))]
-        merge_list[merge_target] = empty_step
-    new_instruction_list = copy.deepcopy(instruction_list)
-    merged_output = []
-    for i in range(len(instruction_list)):
-        if i in empty_steps:
-            continue
-        if i not in merge_list:
-            merged_output.append(new_instruction_list[i])
-        else:
-            from_index = merge_list[i]
-            target_index = i
-            base_step = new_instruction_list[target_index]
-            base_step['step'] = i+1
-            base_step['primary_methods'] += new_instruction_list[from_index]['primary_methods']
-            base_step['other_methods'] += new_instruction_list[from_index]['other_methods']
-            base_step['tools'] += new_instruction_list[from_index]['tools']
-
-            base_step['primary_methods'] = list(set(base_step['primary_methods']))
-            base_step['other_methods'] = list(set(base_step['other_methods']))
-            base_step['tools'] = list(set(base_step['tools']))
-
-            if base_step not in merged_output:
-                merged_output.append(base_step)
+def merge_output_steps(instructions_objects):
+    #  The steps generate_output_steps shows, as dicts of ingredients / tools / primary_methods / other_methods /
+    #  cooking_time / step. A step that doesn't mention any ingredient gets merged into the nearest step that does
+    #  (the earlier one on a tie), which takes over its tools and methods; with no such step at all, nothing gets
+    #  merged. Found with a bisect over the steps that have ingredients, and every step is its own dict, so nothing
+    #  gets compared or copied wholesale. Doesn't print anything or change instructions_objects
+    steps = []
+    for instruction in instructions_objects:
+        steps.append({'ingredients': list(set(record_words(instruction, 'ingredients')))[::-1],
+                      'tools': list(set(tuple(record_words(instruction, 'parsed_tools')) + tuple(record_words(instruction, 'inferred_tools')))),
+                      'primary_methods': list(record_words(instruction, 'primary_method')),
+                      'other_methods': list(record_words(instruction, 'other_method')),
+                      'cooking_time': list(record_words(instruction, 'cooking_time'))})
+    valid_steps = [i for i, step in enumerate(steps) if step['ingredients']]
+    if valid_steps:
+        merged_into = {i: [] for i in valid_steps}     # valid step --> the empty steps merged into it
+        for i, step in enumerate(steps):
+            if step['ingredients']:
+                continue
+            position = bisect.bisect_left(valid_steps, i)
+            if position == len(valid_steps) or (position > 0 and i - valid_steps[position - 1] <= valid_steps[position] - i):
+                position -= 1
+            merged_into[valid_steps[position]].append(step)
+        merged_output = []
+        for i in valid_steps:
+            base_step = steps[i]
+            if merged_into[i]:
+                for empty_step in merged_into[i]:
+                    base_step['primary_methods'] += empty_step['primary_methods']
+                    base_step['other_methods'] += empty_step['other_methods']
+                    base_step['tools'] += empty_step['tools']
+                base_step['primary_methods'] = list(set(base_step['primary_methods']))
+                base_step['other_methods'] = list(set(base_step['other_methods']))
+                base_step['tools'] = list(set(base_step['tools']))
+            merged_output.append(base_step)
+    else:
+        merged_output = steps
     for i in range(len(merged_output)):
         merged_output[i]['step'] = i+1
-    for merged_step in merged_output:
-        print ("step: ",merged_step['step'])
-        print ("ingredients: ",' '.join(merged_step['ingredients']))
-        if merged_step['tools']:
-            print ("tools: ", ' '.join(merged_step['tools']))
-        else:
-            print ("tools: None")
+    return merged_output
+
+def output_step_lines(merged_steps):
+    #  the text for merge_output_steps' steps, line by line
+    lines = []
+    for merged_step in merged_steps:
+        lines.append("step:  {0}".format(merged_step['step']))
+        lines.append("ingredients:  " + ' '.join(merged_step['ingredients']))
+        lines.append("tools:  " + ' '.join(merged_step['tools']) if merged_step['tools'] else "tools: None")
         if merged_step['primary_methods']:
-            print ("primary cooking method: ", ' '.join(merged_step['primary_methods']))
+            lines.append("primary cooking method:  " + ' '.join(merged_step['primary_methods']))
         else:
-            print ("primary cooking method: None")
+            lines.append("primary cooking method: None")
         if merged_step['other_methods']:
-            print ("other cooking method: ", ' '.join(merged_step['other_methods']))
+            lines.append("other cooking method:  " + ' '.join(merged_step['other_methods']))
         else:
-            print("other cooking method: None")
-        if merged_step['cooking_time'][0]:
-            print ("cooking time: ", ' '.join(merged_step['cooking_time']) + '\n')
+            lines.append("other cooking method: None")
+        if merged_step['cooking_time'] and merged_step['cooking_time'][0]:
+            lines.append("cooking time:  " + ' '.join(merged_step['cooking_time']) + '\n')
         else:
-            print ("cooking time: None" + '\n')
+            lines.append("cooking time: None" + '\n')
+    return lines
 
-if __name__ == '__main__':
+def generate_output_steps(instructions_objects):
+    #  prints the merged steps; gives them back too
+    merged_steps = merge_output_steps(instructions_objects)
+    for line in output_step_lines(merged_steps):
+        print(line)
+    return merged_steps
+
+class TextRenderer:
+    '''
+    Puts recipes into words: original_info, ingredients (generate_ingredient_string lines), steps
+    (merge_output_steps' steps), line, and recipe (a whole analyze_recipe record, transforms included). Each call
+    builds its piece in one go and then either adds it to the buffer (getvalue) or, given an output file, writes it
+    there, so bulk runs don't go through print line by line. Every call gives back the renderer, for chaining.
+    The text is what the interactive menu prints; see JsonRenderer and MarkdownRenderer for the other formats
+    '''
+    def __init__(self, output=None):
+        self.output = output
+        self.parts = []
+
+    def write(self, text):
+        if self.output is None:
+            self.parts.append(text)
+        else:
+            self.output.write(text)
+        return self
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+    def line(self, text=''):
+        return self.write(text + '\n')
+
+    def original_info(self, title, ing_strings, dir_strings):
+        return self.write("Recipe title: {0}\nIngredients:\n{1}\nInstructions:\n{2}\n".format(
+            original_title(title), ing_strings, dir_strings))
+
+    def ingredients(self, ingredient_objects):
+        lines = [generate_ingredient_string(ingredient) for ingredient in ingredient_objects]
+        return self.write(''.join(line + '\n' for line in lines if line is not None))
+
+    def steps(self, merged_steps):
+        return self.write(''.join(line + '\n' for line in output_step_lines(merged_steps)))
+
+    def recipe(self, record):
+        if 'error' in record:
+            return self.line("{0}: error: {1}".format(record.get('source', record.get('offset')), record['error']))
+        self.original_info(record['title'] or '', record['ingredient_strings'], record['direction_strings'])
+        self.line("Ingredients:").ingredients(record['ingredients'])
+        self.line("Steps:").steps(record['steps'])
+        for name, variant in sorted(record['transforms'].items()):
+            self.line("{0} transform:".format(name))
+            if 'error' in variant:
+                self.line("error: " + variant['error'])
+                continue
+            self.line("New Ingredients:").ingredients(variant['ingredients'])
+            if 'steps' in variant:
+                self.line("New Instructions:").steps(variant['steps'])
+        return self.line()
+
+class MarkdownRenderer(TextRenderer):
+    #  Same as TextRenderer, in Markdown (headings, lists)
+    def original_info(self, title, ing_strings, dir_strings):
+        return self.write("# {0}\n\n## Ingredients\n\n{1}\n## Directions\n\n{2}\n".format(
+            original_title(title), ''.join('- {0}\n'.format(line) for line in ing_strings),
+            ''.join('{0}. {1}\n'.format(i + 1, line) for i, line in enumerate(dir_strings))))
+
+    def ingredients(self, ingredient_objects):
+        lines = [generate_ingredient_string(ingredient) for ingredient in ingredient_objects]
+        return self.write(''.join('- {0}\n'.format(line) for line in lines if line is not None) + '\n')
+
+    def steps(self, merged_steps):
+        parts = []
+        for step in merged_steps:
+            parts.append("{0}. **Ingredients:** {1}\n".format(step['step'], ', '.join(step['ingredients']) or 'None'))
+            parts.append("   **Tools:** {0}\n".format(', '.join(step['tools']) or 'None'))
+            parts.append("   **Primary cooking method:** {0}\n".format(', '.join(step['primary_methods']) or 'None'))
+            parts.append("   **Other cooking methods:** {0}\n".format(', '.join(step['other_methods']) or 'None'))
+            cooking_time = ' '.join(step['cooking_time']) if step['cooking_time'] and step['cooking_time'][0] else 'None'
+            parts.append("   **Cooking time:** {0}\n".format(cooking_time))
+        return self.write(''.join(parts) + '\n')
+
+    def recipe(self, record):
+        if 'error' in record:
+            return self.line("> **{0}**: {1}\n".format(record.get('source', record.get('offset')), record['error']))
+        self.original_info(record['title'] or '', record['ingredient_strings'], record['direction_strings'])
+        self.line("## Parsed ingredients\n").ingredients(record['ingredients'])
+        self.line("## Steps\n").steps(record['steps'])
+        for name, variant in sorted(record['transforms'].items()):
+            self.line("## {0} transform\n".format(name.capitalize()))
+            if 'error' in variant:
+                self.line("> error: {0}\n".format(variant['error']))
+                continue
+            self.line("### Ingredients\n").ingredients(variant['ingredients'])
+            if 'steps' in variant:
+                self.line("### Steps\n").steps(variant['steps'])
+        return self
+
+class JsonRenderer(TextRenderer):
+    #  Same as TextRenderer, as JSON lines: one JSON document per call (a whole record, for recipe)
+    def json_line(self, value):
+        return self.write(json.dumps(value, default=json_default) + '\n')
+
+    def line(self, text=''):
+        return self.json_line({'text': text})
+
+    def original_info(self, title, ing_strings, dir_strings):
+        return self.json_line({'title': original_title(title), 'ingredients': ing_strings, 'directions': dir_strings})
+
+    def ingredients(self, ingredient_objects):
+        lines = [generate_ingredient_string(ingredient) for ingredient in ingredient_objects]
+        return self.json_line([line for line in lines if line is not None])
+
+    def steps(self, merged_steps):
+        return self.json_line(merged_steps)
+
+    def recipe(self, record):
+        return self.json_line(record)
+
+RENDERERS = {'json': JsonRenderer, 'text': TextRenderer, 'markdown': MarkdownRenderer}
+
+TRANSFORMS = {'vegetarian': non_vege_to_vege, 'non-vegetarian': vege_to_non_vege, 'healthy': non_heal_to_heal,
+              'unhealthy': heal_to_non_heal, 'south-asian': southasian_transform, 'italian': italian_transform}
+
+#  the SubstitutionTables each of the TRANSFORMS looks words up in
+TRANSFORM_TABLES = {'vegetarian': (VEGE_INSTRUCTION_TABLE, VEGE_NAME_TABLE, VEGE_DESCRIPTOR_TABLE),
+                    'non-vegetarian': (MEAT_SUBSTITUTES_TABLE,), 'healthy': (HEALTHY_INSTRUCTION_TABLE, HEALTHY_NAME_TABLE),
+                    'unhealthy': (UNHEALTHY_INSTRUCTION_TABLE, UNHEALTHY_NAME_TABLE), 'south-asian': (), 'italian': (ITALIAN_TABLE,)}
+
+#  For the transforms that only ever change words their tables recognize, and treat every instruction / ingredient
+#  on its own: their TRANSFORM_TABLES as (instructions' ingredients, ingredient names, descriptors) tables, with None
+#  for the descriptors of the ones that don't look at them
+WORD_ONLY_TRANSFORMS = {name: (TRANSFORM_TABLES[name] + (None,))[:3] for name in ('vegetarian', 'healthy', 'unhealthy')}
+
+#  what going over a record that isn't shaped like the parser's output (missing fields, a field that isn't a list of
+#  strings, a quantity that isn't a number) can raise
+MALFORMED_RECORD_ERRORS = (KeyError, IndexError, TypeError, AttributeError, ValueError, ZeroDivisionError)
+
+class RecipeWords:
+    '''
+    Everything the TRANSFORMS (names) work out about one recipe's words before changing any of them, done in one pass
+    over its ingredients and instructions, so that transform_all's variants all share it (each transform takes it as
+    words=...; without it they work the same things out for themselves):
+        - forms: word --> its normalize_word forms, for every ingredient name / descriptor and instruction ingredient
+        - labels: word --> {table: label} for the TRANSFORM_TABLES of those transforms
+        - changed: for the WORD_ONLY_TRANSFORMS, (instruction indices, ingredient indices) of the records they'd change
+        - vegetarian_fat: whether some ingredient name is a fat, which makes non_vege_to_vege touch the instructions
+        - southasian: the SouthAsianTotals (None if working them out failed; the transform then fails on its own)
+    '''
+    def __init__(self, ingredient_objects, instruction_objects, names=None, title="placeholder"):
+        names = list(names if names is not None else TRANSFORMS)
+        self.tables = [table for name in names for table in TRANSFORM_TABLES.get(name, ())]
+        self.forms = {}
+        self.labels = {}
+        word_only = [name for name in names if name in WORD_ONLY_TRANSFORMS]
+        self.changed = {name: ([], []) for name in word_only}
+        self.vegetarian_fat = False
+        self.southasian = SouthAsianTotals(title) if 'south-asian' in names else None
+        for i, instruction in enumerate(instruction_objects):
+            ingredients = record_words(instruction, 'ingredients')
+            self.learn(ingredients)
+            for name in word_only:
+                if not self.unchanged(ingredients, WORD_ONLY_TRANSFORMS[name][0], True):
+                    self.changed[name][0].append(i)
+        for i, ingredient in enumerate(ingredient_objects):
+            ingredient_names, descriptors = record_words(ingredient, 'name'), record_words(ingredient, 'descriptor')
+            self.learn(ingredient_names)
+            self.learn(descriptors)
+            for name in word_only:
+                instruction_table, name_table, descriptor_table = WORD_ONLY_TRANSFORMS[name]
+                if (not self.unchanged(ingredient_names, name_table)
+                        or '' in ingredient_names       # non_vege_to_vege drops empty words
+                        or (descriptor_table is not None and not self.unchanged(descriptors, descriptor_table))):
+                    self.changed[name][1].append(i)
+            if 'vegetarian' in self.changed and isinstance(ingredient_names, (list, tuple)):
+                self.vegetarian_fat = self.vegetarian_fat or any(isinstance(word, str) and self.classify(VEGE_NAME_TABLE, word) == 'fat'
+                                                                 for word in ingredient_names)
+            if self.southasian is not None:
+                try:
+                    self.southasian.add(ingredient)
+                except MALFORMED_RECORD_ERRORS:
+                    self.southasian = None
+
+    def learn(self, words):
+        if not isinstance(words, (list, tuple)):
+            return
+        for word in words:
+            if isinstance(word, str) and word not in self.forms:
+                self.forms[word] = normalize_word(word)
+                self.labels[word] = {table: table.classify(word) for table in self.tables}
+
+    def word_forms(self, word):
+        #  same as normalize_word; words the transforms made up along the way just get normalized then
+        forms = self.forms.get(word)
+        return forms if forms is not None else normalize_word(word)
+
+    def classify(self, table, word):
+        #  same as table.classify(word)
+        try:
+            return self.labels[word][table]
+        except KeyError:
+            return table.classify(word)
+
+    def unchanged(self, words, table, lowercased=False):
+        #  whether a transform using table leaves these words alone (lowercased: it lowercases the words it keeps);
+        #  anything that isn't a list of strings counts as changed, so the transform itself gets to deal with it
+        if not isinstance(words, (list, tuple)):
+            return False
+        for word in words:
+            if not isinstance(word, str) or self.classify(table, word) is not None:
+                return False
+            if lowercased and self.forms[word][0] != word:
+                return False
+        return True
+
+def transform_changed_records(name, ingredient_objects, instruction_objects, words):
+    #  Runs one of the WORD_ONLY_TRANSFORMS on just the records it's going to change (according to words, the recipe's
+    #  RecipeWords), and puts its results back in between the untouched ones (which are shared with the input, same as
+    #  share_unchanged would do)
+    if name == 'vegetarian' and words.vegetarian_fat:
+        #  non_vege_to_vege adds 'butter' to the last instruction for fats it finds in the ingredients
+        return TRANSFORMS[name](ingredient_objects, instruction_objects, words=words)
+    changed_instructions, changed_ingredients = words.changed[name]
+    new_instructions, new_ingredients = TRANSFORMS[name]([ingredient_objects[i] for i in changed_ingredients],
+                                                         [instruction_objects[i] for i in changed_instructions], words=words)
+    instructions = list(instruction_objects)
+    for i, instruction in zip(changed_instructions, new_instructions):
+        instructions[i] = instruction
+    ingredients = list(ingredient_objects)
+    for i, ingredient in zip(changed_ingredients, new_ingredients):
+        ingredients[i] = ingredient
+    return instructions, ingredients
+
+def transform_all(ingredient_objects, instruction_objects, names=None, title="placeholder", seed=None, errors=None):
+    '''
+    Several TRANSFORMS (all of them by default) of one parsed recipe at once; gives back {name: (instructions, ingredients)},
+    the same as calling each transform on its own (with random.seed(seed) right before italian_transform, if a seed
+    is given). The recipe gets gone over once for all of them (see RecipeWords): every word normalized and classified
+    by every table they use, and south-asian's totals added up. The WORD_ONLY_TRANSFORMS can tell from that alone
+    which records they'd leave alone, so those only copy and walk the records they change (transform_changed_records).
+    If errors (a dict) is given, a transform that fails gets its exception put there instead of stopping the rest
+    '''
+    import random
+    names = list(names if names is not None else TRANSFORMS)
+    if not names:
+        return {}
+    try:
+        words = RecipeWords(ingredient_objects, instruction_objects, names, title)
+    except MALFORMED_RECORD_ERRORS:
+        words = None    # records the pass can't make sense of; the transforms each get to fail on them on their own
+    variants = {}
+    for name in names:
+        try:
+            if name in WORD_ONLY_TRANSFORMS and words is not None:
+                variants[name] = transform_changed_records(name, ingredient_objects, instruction_objects, words)
+            elif name == 'south-asian':
+                variants[name] = TRANSFORMS[name](ingredient_objects, instruction_objects, title, words=words)
+            else:
+                if name == 'italian' and seed is not None:
+                    random.seed(seed)
+                variants[name] = TRANSFORMS[name](ingredient_objects, instruction_objects, words=words)
+        except Exception as error:
+            if errors is None:
+                raise
+            errors[name] = error
+    return variants
+
+def analyze_recipe(ing_strings, dir_strings, title, transforms=(), tag_batcher=None):
+    #  Everything the interactive menu can show for one recipe, as a JSON-friendly dict, plus the named TRANSFORMS
+    #  (tag_batcher: see pos_tag_sents)
+    ingredients_objects = find_ingredients_objects(ing_strings, tag_batcher)
+    analysis = RecipeAnalysis(dir_strings, full_ingredients_list(ingredients_objects), tokenize_instructions(dir_strings, tag_batcher),
+                              full_ingredient_phrases(ingredients_objects))
+    #  ingredient_mentions: the multi-word ingredients ('olive oil', 'sour cream') each direction mentions
+    record = {'title': title, 'ingredient_strings': ing_strings, 'direction_strings': dir_strings,
+              'ingredients': ingredients_objects, 'instructions': analysis.instruction_objects,
+              'ingredient_mentions': analysis.ingredient_mentions or [[] for dir_string in dir_strings],
+              'tools': analysis.all_tools, 'methods': analysis.all_methods, 'main_methods': analysis.all_methods_class,
+              'steps': merge_output_steps(analysis.instruction_objects), 'transforms': {}}
+    errors = {}
+    variants = transform_all(ingredients_objects, analysis.instruction_objects, transforms, title, errors=errors)
+    for name in transforms:
+        if name in errors:
+            record['transforms'][name] = {'error': '{0}: {1}'.format(type(errors[name]).__name__, errors[name])}
+        else:
+            new_instructions, new_ingredients = variants[name]
+            record['transforms'][name] = {'ingredients': new_ingredients, 'instructions': new_instructions}
+            try:
+                record['transforms'][name]['steps'] = merge_output_steps(new_instructions)
+            except Exception as error:
+                record['transforms'][name]['steps_error'] = '{0}: {1}'.format(type(error).__name__, error)
+    return record
+
+def process_page(page, transforms):
+    #  batch worker: extract + analyze one downloaded page
+    ing_strings, dir_strings, title = extract_recipe(page)
+    return analyze_recipe(ing_strings, dir_strings, title, transforms)
+
+def process_saved_page(path, transforms):
+    #  batch worker: same, for a saved .html file
+    with open(path, 'rb') as page_file:
+        return process_page(page_file.read(), transforms)
+
+class BatchWriter:
+    '''
+    Writes batch results as they come in (from the process pool's callback thread, hence the lock), as JSON lines or
+    in one of the other RENDERERS' formats (output_format).
+    With ordered=True, results that finish early are held back until everything before them has been written
+    '''
+    def __init__(self, output, ordered=False, output_format='json'):
+        self.output = output
+        self.renderer = RENDERERS[output_format](output)
+        self.ordered = ordered
+        self.lock = threading.Lock()
+        self.held = {}
+        self.next_index = 0
+        self.written = 0
+        self.failed = 0
+
+    def write(self, index, record):
+        with self.lock:
+            if 'error' in record:
+                self.failed += 1
+            if not self.ordered:
+                self.write_line(record)
+                return
+            self.held[index] = record
+            while self.next_index in self.held:
+                self.write_line(self.held.pop(self.next_index))
+                self.next_index += 1
+
+    def write_line(self, record):
+        self.renderer.recipe(record)
+        self.output.flush()
+        self.written += 1
+
+    def write_future(self, index, source, network=None):
+        #  network: the crawler's timing for downloading the page (see RecipeCrawler.crawl_one), for the trace
+        def done(future):
+            try:
+                record = future.result()
+            except Exception as error:
+                record = {'error': '{0}: {1}'.format(type(error).__name__, error)}
+            record['index'] = index
+            record['source'] = source
+            if instrumentation is not None and 'trace' in record:
+                if network is not None:
+                    instrumentation.add_network(record['trace'], network)
+                instrumentation.add_trace(record['trace'])     # from a worker process, so not counted here yet
+            self.write(index, record)
+        return done
+
+def run_batch(sources, transforms=(), output=sys.stdout, processes=None, ordered=False, cache=None, crawler_options=None, warm='fork',
+              output_format='json'):
+    '''
+    Non-interactive mode: sources are recipe IDs, URLs (anything with a scheme://) or, otherwise, saved .html paths
+    (see source_kind). Pages get downloaded here (concurrently,
+    through crawl_recipes and the optional PageCache), while extraction, parsing and the transforms run on a pool of
+    worker processes (with the NLTK models loaded according to warm, see make_worker_pool); every recipe becomes one
+    JSON line (or whatever output_format says, see RENDERERS) on output as soon as it's done
+    '''
+    writer = BatchWriter(output, ordered, output_format)
+    remote = {}     # source --> indices, for matching crawl results back up
+    with make_worker_pool(processes, warm, instrument=instrumentation is not None) as pool:
+        for index, source in enumerate(sources):
+            if source_kind(source) == 'path':
+                pool.submit(process_saved_page, source, transforms).add_done_callback(writer.write_future(index, source))
+            else:
+                remote.setdefault(source, []).append(index)
+
+        def handle_result(result):
+            for index in remote[result['source']]:
+                if result['error']:
+                    writer.write(index, {'index': index, 'source': result['source'], 'error': result['error']})
+                else:
+                    pool.submit(process_page, result['page'], transforms).add_done_callback(
+                        writer.write_future(index, result['source'], result.get('network')))
+        if remote and cache is not None and cache.offline:
+            #  nothing to download, so no need for the crawler (or the network modules it brings along)
+            base_url = (crawler_options or {}).get('base_url', ALLRECIPES_URL)
+            for source in remote:
+                url = recipe_url(source, base_url) if source_kind(source) == 'id' else source
+                network = {'attempts': 0, 'seconds': 0.0, 'cache': 'miss'}
+                result = {'source': source, 'url': url, 'page': None, 'error': None, 'network': network}
+                start = time.perf_counter()
+                try:
+                    result['page'] = cache.check(url, network)[0]
+                except PageCacheMiss as error:
+                    result['error'] = str(error)
+                network['seconds'] = time.perf_counter() - start
+                handle_result(result)
+        elif remote:
+            crawl_recipes(list(remote), handle_result, cache=cache, extract=False, **(crawler_options or {}))
+    return writer
+
+def read_recipe_dump(path, offset=0):
+    '''
+    Reads an offline recipe dump lazily: one JSON object per line, {"title": ..., "ingredients": [...], "directions": [...]},
+    plain or gzipped (told apart by the first bytes, not the file name). Yields (offset, end offset, recipe) one line at a
+    time, where the offsets are byte positions in the (uncompressed) dump, so that reading can pick up again at any
+    end offset. Lines that aren't valid JSON come out as {'error': ...}. Seeking into a gzipped dump has to decompress
+    everything before offset, but still only holds one line in memory
+    '''
+    import gzip
+    with open(path, 'rb') as raw:
+        gzipped = raw.read(2) == b'\x1f\x8b'
+    dump = gzip.open(path, 'rb') if gzipped else open(path, 'rb')
+    with dump:
+        if offset:
+            dump.seek(offset)
+        for line in dump:
+            start = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                recipe = json.loads(line.decode('utf-8'))
+            except ValueError as error:
+                recipe = {'error': 'bad line: {0}'.format(error)}
+            yield start, offset, recipe
+
+def analyze_dump_recipes(recipes, transforms=()):
+    #  second stage: (offset, end offset, recipe) --> (end offset, JSON line record), one recipe at a time
+    for start, end, recipe in recipes:
+        if 'error' in recipe:
+            record = dict(recipe)
+        else:
+            try:
+                record = analyze_recipe(recipe['ingredients'], recipe['directions'], recipe.get('title'), transforms)
+            except Exception as error:
+                record = {'error': '{0}: {1}'.format(type(error).__name__, error)}
+        record['offset'] = start
+        yield end, record
+
+def load_dump_checkpoint(checkpoint, path):
+    #  where a previous run_dump got to (None: start from scratch)
+    if checkpoint is None or not os.path.exists(checkpoint):
+        return None
+    with open(checkpoint) as checkpoint_file:
+        state = json.load(checkpoint_file)
+    if state['input'] != os.path.abspath(path):
+        raise ValueError("checkpoint {0} is for {1}, not {2}".format(checkpoint, state['input'], path))
+    return state
+
+def save_dump_checkpoint(checkpoint, state):
+    #  written next to the checkpoint and then renamed over it, so a crash can't leave half a checkpoint behind
+    temp = checkpoint + '.tmp'
+    with open(temp, 'w') as checkpoint_file:
+        json.dump(state, checkpoint_file)
+    os.replace(temp, checkpoint)
+
+def run_dump(path, output, transforms=(), checkpoint=None, checkpoint_every=100, output_format='json'):
+    '''
+    Offline counterpart of run_batch for recipe dumps (see read_recipe_dump): reads, analyzes and writes one recipe at a
+    time, so memory stays the same however big the dump is. output is a file name (results get appended to it in
+    output_format, see RENDERERS; as JSON lines they're the same records as run_batch's, with the dump offset instead
+    of index / source). With a checkpoint file, the input offset and output size get saved every checkpoint_every
+    recipes; running again with the same checkpoint cuts the output back to the last saved size and carries on from that offset, so a crashed run neither loses
+    nor repeats recipes (and once a run has finished, running it again does nothing). Returns the BatchWriter (its
+    written / failed counts include the earlier runs)
+    '''
+    state = load_dump_checkpoint(checkpoint, path)
+    if state is None:
+        state = {'input': os.path.abspath(path), 'offset': 0, 'output_size': 0, 'written': 0, 'failed': 0, 'done': False}
+        output_file = open(output, 'w', encoding='utf-8')
+    else:
+        output_file = open(output, 'a', encoding='utf-8')
+        output_file.truncate(state['output_size'])
+    writer = BatchWriter(output_file, output_format=output_format)
+    writer.written, writer.failed = state['written'], state['failed']
+    with output_file:
+        if state['done']:
+            return writer
+
+        def save(done=False):
+            #  the writer flushes after every line, so the file size is everything written so far
+            state.update(output_size=os.fstat(output_file.fileno()).st_size, written=writer.written,
+                         failed=writer.failed, done=done)
+            save_dump_checkpoint(checkpoint, state)
+        since_checkpoint = 0
+        for end, record in analyze_dump_recipes(read_recipe_dump(path, state['offset']), transforms):
+            writer.write(None, record)
+            state['offset'] = end
+            since_checkpoint += 1
+            if checkpoint is not None and since_checkpoint >= checkpoint_every:
+                save()
+                since_checkpoint = 0
+        if checkpoint is not None:
+            save(done=True)
+    return writer
+
+class TagBatcher:
+    '''
+    Micro-batching for the HTTP service's POS tagging. Requests get handled on worker threads, and their pos_tag_sents
+    calls end up here (the service passes its batcher down through analyze_recipe): sentences from calls that come in within max_wait seconds of each other
+    (or until max_batch sentences are waiting) get tagged together in one tag_sentences call, on a thread of its own
+    so the event loop keeps answering requests meanwhile. in_flight (optional) says how many requests are being
+    handled; once all of them are waiting here, nothing else can join the batch, so it goes right away instead of
+    waiting out max_wait (a lone request never waits). tag_sents must not be called from the event loop's thread.
+    stats: batches run, pos_tag_sents calls and sentences that went into them
+    '''
+    def __init__(self, loop, max_wait=0.005, max_batch=256, in_flight=None):
+        import concurrent.futures
+        self.loop = loop
+        self.in_flight = in_flight
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.pending = []       # [(sentences, future), ...] waiting for the next batch
+        self.pending_sentences = 0
+        self.timer = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.stats = {'batches': 0, 'calls': 0, 'sentences': 0}
+
+    def tag_sents(self, sentences):
+        #  from a worker thread: blocks until the batch these sentences went into has been tagged
+        import asyncio
+        if not sentences:
+            return []
+        return asyncio.run_coroutine_threadsafe(self.tag(sentences), self.loop).result()
+
+    async def tag(self, sentences):
+        future = self.loop.create_future()
+        self.pending.append((sentences, future))
+        self.pending_sentences += len(sentences)
+        if self.pending_sentences >= self.max_batch or (self.in_flight is not None and len(self.pending) >= self.in_flight()):
+            self.flush()
+        elif self.timer is None:
+            self.timer = self.loop.call_later(self.max_wait, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending, self.pending_sentences = self.pending, [], 0
+        if not batch:
+            return
+        all_sentences = [tokens for sentences, future in batch for tokens in sentences]
+        self.stats['batches'] += 1
+        self.stats['calls'] += len(batch)
+        self.stats['sentences'] += len(all_sentences)
+        tagging = self.loop.run_in_executor(self.executor, tag_sentences, all_sentences)
+        tagging.add_done_callback(lambda tagging: self.deliver(batch, tagging))
+
+    def deliver(self, batch, tagging):
+        error = tagging.exception()
+        tagged = iter(tagging.result() if error is None else [])
+        for sentences, future in batch:
+            if future.cancelled():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result([next(tagged) for _ in sentences])
+
+    def close(self):
+        self.executor.shutdown()
+
+def percentile(values, fraction):
+    #  nearest-rank percentile, e.g. percentile(latencies, 0.99); None for no values
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(math.ceil(fraction * len(ordered))) - 1))]
+
+def latency_summary(latencies):
+    #  {'count', 'p50_ms', 'p99_ms'} for latencies in seconds
+    return {'count': len(latencies),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None}
+
+async def read_http_message(reader, max_body=16 * 1024 * 1024):
+    #  (start line, {lowercase header: value}, body) of the next HTTP/1.1 request or response on reader; None at EOF
+    import asyncio
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    lines = head.decode('latin-1').split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > max_body:
+        raise ValueError("body too large: {0} bytes".format(length))
+    body = await reader.readexactly(length) if length else b''
+    return lines[0], headers, body
+
+class RecipeService:
+    '''
+    Long-running HTTP mode (see serve), so other services don't pay for process startup and loading the NLTK models on
+    every recipe. JSON in, JSON out, on keep-alive connections:
+        POST /parse       {"title", "ingredients": [...], "directions": [...]} --> the analyze_recipe record
+        POST /transform   same, plus "transforms": [...] (default: all TRANSFORMS) --> with those transforms too
+                          (both take "format": "text" / "markdown" too, for the record rendered as text, see RENDERERS)
+        GET  /stats       requests and p50 / p99 latency per endpoint (over the last latency_window requests), and
+                          the TagBatcher's stats
+        GET  /metrics     the Instrumentation's aggregates in Prometheus text format, if it's on
+        GET  /health
+    Requests get handled on a pool of threads, and their tagging gets micro-batched by a TagBatcher (max_wait,
+    max_batch). Latencies are measured from the request being read to the response being ready
+    '''
+    def __init__(self, max_wait=0.005, max_batch=256, threads=8, latency_window=10000):
+        import concurrent.futures
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self.latency_window = latency_window
+        self.latencies = {}     # path --> deque of seconds
+        self.errors = 0
+        self.in_flight = 0      # requests being handled right now
+        self.connections = {}   # connection task --> its writer
+        self.batcher = None
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8337):
+        #  starts listening (port 0: any free port, see self.port); the caller runs the loop
+        import asyncio
+        self.batcher = TagBatcher(asyncio.get_event_loop(), self.max_wait, self.max_batch, lambda: self.in_flight)
+        self.server = await asyncio.start_server(self.connection_made, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    def connection_made(self, reader, writer):
+        #  connections get tracked, so that shutdown can close the idle keep-alive ones
+        import asyncio
+        task = asyncio.ensure_future(self.handle_connection(reader, writer))
+        self.connections[task] = writer
+        task.add_done_callback(self.connections.pop)
+
+    async def shutdown(self):
+        #  stops listening, closes every connection and waits for their handlers to finish
+        import asyncio
+        if self.server is not None:
+            self.server.close()
+        for writer in list(self.connections.values()):
+            writer.close()
+        if self.connections:
+            await asyncio.wait(list(self.connections))
+        self.executor.shutdown()
+        if self.batcher is not None:
+            self.batcher.close()
+
+    async def handle_connection(self, reader, writer):
+        import asyncio
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                try:
+                    message = await read_http_message(reader)
+                except ValueError as error:     # bad or too big Content-Length
+                    self.write_response(writer, 400, {'error': 'bad request: {0}'.format(error)}, close=True)
+                    await writer.drain()
+                    break
+                if message is None:
+                    break
+                start_line, headers, body = message
+                parts = start_line.split()
+                method, path = (parts[0], parts[1].split('?')[0]) if len(parts) >= 2 else ('', '')
+                start = time.perf_counter()
+                self.in_flight += 1
+                try:
+                    status, payload = await loop.run_in_executor(self.executor, self.handle, method, path, body)
+                finally:
+                    self.in_flight -= 1
+                if status != 404:       # so junk paths can't pile up in self.latencies
+                    self.latencies.setdefault(path, collections.deque(maxlen=self.latency_window)).append(time.perf_counter() - start)
+                close = headers.get('connection', '').lower() == 'close'
+                self.write_response(writer, status, payload, close)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def write_response(self, writer, status, payload, close=False):
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+        if isinstance(payload, str):    # /metrics, rendered recipes
+            body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body, content_type = json.dumps(payload, default=json_default).encode('utf-8'), 'application/json'
+        writer.write('HTTP/1.1 {0} {1}\r\nContent-Type: {2}\r\nContent-Length: {3}\r\nConnection: {4}\r\n\r\n'.format(
+            status, reasons[status], content_type, len(body), 'close' if close else 'keep-alive').encode('latin-1') + body)
+
+    def handle(self, method, path, body):
+        #  on a worker thread: (status, JSON-friendly payload)
+        if path == '/health':
+            return 200, {'status': 'ok'}
+        if path == '/stats':
+            return 200, self.stats()
+        if path == '/metrics':
+            if instrumentation is None:
+                return 404, {'error': 'instrumentation is off (start the service with --metrics)'}
+            return 200, instrumentation.to_prometheus()
+        if path not in ('/parse', '/transform'):
+            return 404, {'error': 'no such endpoint: ' + path}
+        if method != 'POST':
+            return 405, {'error': path + ' takes POST'}
+        try:
+            request = json.loads(body.decode('utf-8'))
+            ing_strings, dir_strings = request['ingredients'], request['directions']
+            transforms = request.get('transforms', sorted(TRANSFORMS)) if path == '/transform' else ()
+            if not isinstance(ing_strings, list) or not isinstance(dir_strings, list):
+                raise ValueError("ingredients and directions have to be lists of strings")
+            unknown = [name for name in transforms if name not in TRANSFORMS]
+            if unknown:
+                raise ValueError("unknown transforms: {0}".format(', '.join(unknown)))
+            renderer = RENDERERS[request.get('format', 'json')]
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            self.errors += 1
+            return 400, {'error': 'bad request: {0}: {1}'.format(type(error).__name__, error)}
+        try:
+            record = analyze_recipe(ing_strings, dir_strings, request.get('title'), transforms, self.batcher)
+            return 200, record if renderer is JsonRenderer else renderer().recipe(record).getvalue()
+        except Exception as error:
+            self.errors += 1
+            return 500, {'error': '{0}: {1}'.format(type(error).__name__, error)}
+
+    def stats(self):
+        return {'endpoints': {path: latency_summary(list(latencies)) for path, latencies in self.latencies.items()},
+                'errors': self.errors, 'tagging': dict(self.batcher.stats, max_wait_ms=self.max_wait * 1000)}
+
+def serve(host='127.0.0.1', port=8337, max_wait=0.005, max_batch=256, threads=8):
+    #  Synchronous entry point for the service: loads the NLTK models, then serves until interrupted
+    import asyncio
+    load_time = preload_models()
+    service = RecipeService(max_wait, max_batch, threads)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(service.start(host, port))
+        print("models loaded in {0:.1f}s; listening on http://{1}:{2}".format(load_time, host, service.port), file=sys.stderr)
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(service.shutdown())
+        loop.close()
+        print(json.dumps(service.stats()), file=sys.stderr)
+
+async def run_load_test(host, port, path, payloads, requests, clients):
+    #  clients keep-alive connections sending requests (cycling through payloads) until requests have been sent
+    import asyncio
+    latencies = []
+    failures = []
+    numbers = iter(range(requests))
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for number in numbers:
+                body = json.dumps(payloads[number % len(payloads)]).encode('utf-8')
+                start = time.perf_counter()
+                writer.write('POST {0} HTTP/1.1\r\nHost: {1}\r\nContent-Type: application/json\r\nContent-Length: {2}\r\n\r\n'.format(
+                    path, host, len(body)).encode('latin-1') + body)
+                await writer.drain()
+                message = await read_http_message(reader)
+                if message is None:
+                    failures.append('connection closed')
+                    break
+                latencies.append(time.perf_counter() - start)
+                if message[0].split()[1] != '200':
+                    failures.append(message[0])
+        finally:
+            writer.close()
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(0, clients)])
+    return latencies, failures, time.perf_counter() - start
+
+def load_test(url, payloads, requests=200, clients=16):
+    '''
+    Local load generator for the service: sends requests POSTs of the payloads (recipe dicts, e.g. from
+    read_recipe_dump) to url from clients concurrent connections; gives back
+    {'requests', 'failures', 'seconds', 'requests_per_second', 'p50_ms', 'p99_ms'} (client-side latencies)
+    '''
+    import asyncio
+    parts = urllib.parse.urlsplit(url)
+    loop = asyncio.new_event_loop()
+    try:
+        latencies, failures, seconds = loop.run_until_complete(
+            run_load_test(parts.hostname, parts.port or 80, parts.path or '/transform', payloads, requests, clients))
+    finally:
+        loop.close()
+    summary = latency_summary(latencies)
+    return {'requests': summary['count'], 'failures': len(failures), 'seconds': round(seconds, 3),
+            'requests_per_second': round(summary['count'] / seconds, 1) if seconds else None,
+            'p50_ms': summary['p50_ms'], 'p99_ms': summary['p99_ms']}
+
+#  What enable_instrumentation wraps. Stages get timed (times are inclusive, so analyze_recipe's time includes
+#  find_ingredients_objects' and so on); counters give back [(counter, amount), ...] from a call's args and result.
+#  Names with a dot are methods
+INSTRUMENTED_STAGES = ['fetch_page', 'RecipeCrawler.http_get', 'extract_recipe', 'process_page', 'process_saved_page',
+                       'analyze_recipe', 'find_ingredients_objects', 'parse_ingredient', 'parse_ingredients_batch',
+                       'tokenize_instructions', 'parse_tools', 'infer_tools', 'parse_methods', 'assemble_instruction_objects',
+                       'find_instruction_ingredients_helper', 'infer_methods', 'transform_all', 'merge_output_steps',
+                       'generate_output_steps',
+                       'non_vege_to_vege', 'vege_to_non_vege', 'non_heal_to_heal', 'heal_to_non_heal',
+                       'southasian_transform', 'italian_transform']
+INSTRUMENTED_COUNTERS = {
+    'pos_tag_sents': lambda args, result: [('tokens_tagged', sum(len(tokens) for tokens in args[0]))],
+    'pos_tag': lambda args, result: [('tokens_tagged', len(args[0]))],
+    'parse_tagged_ingredient': lambda args, result: [('ingredient_lines_parsed', 1)],
+    'misspelling': lambda args, result: [('misspelling_comparisons', 1)],
+    'IngredientMentionIndex.matches': lambda args, result: [('ingredient_mention_lookups', 1)],
+    'MethodRuleEngine.update': lambda args, result: [('rule_words_checked', len(args[2])), ('rules_fired', len(result))],
+    'IngredientParseCache.get': lambda args, result: [('ingredient_cache_hits' if result is not None else 'ingredient_cache_misses', 1)],
+    'PageCache.lookup': lambda args, result: [('page_cache_hits' if result is not None else 'page_cache_misses', 1)],
+}
+#  the stages that make up a whole recipe: when one of them is the outermost instrumented call, its trace gets put
+#  into the record it returns (as 'trace')
+RECIPE_STAGES = ('process_page', 'process_saved_page', 'analyze_recipe')
+
+class Instrumentation:
+    '''
+    Per-stage timers and counters for the whole pipeline (see enable_instrumentation). Every outermost instrumented
+    call on a thread (usually one recipe: process_page / analyze_recipe) gets a trace:
+        {'root': stage, 'title': ..., 'seconds': ..., 'stages': {stage: {'calls', 'seconds'}}, 'counters': {...}}
+    (plus the 'network' stage and timing for pages the batch mode downloaded, see add_network).
+    Finished traces get added to the aggregates (a histogram per stage of the time each trace spent in it, a histogram
+    of whole traces per root stage, and counter totals), and the last keep_traces of them are kept for to_json.
+    Traces that come back from worker processes get added with add_trace
+    '''
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, keep_traces=1000):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.traces = collections.deque(maxlen=keep_traces)
+        self.stage_histograms = {}      # stage --> [count per bucket (+ one for +Inf), sum, count]
+        self.trace_histograms = {}      # root stage --> same
+        self.counters = collections.Counter()
+
+    def timed(self, stage, function):
+        import functools
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            trace = getattr(self.local, 'trace', None)
+            outermost = trace is None
+            if outermost:
+                trace = self.local.trace = {'root': stage, 'stages': {}, 'counters': collections.Counter()}
+            start = time.perf_counter()
+            result = None
+            try:
+                result = function(*args, **kwargs)
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                timing = trace['stages'].setdefault(stage, [0, 0.0])
+                timing[0] += 1
+                timing[1] += elapsed
+                if outermost:
+                    #  (traces of calls that failed still count)
+                    self.local.trace = None
+                    finished = self.finish_trace(trace, elapsed)
+                    if stage in RECIPE_STAGES and isinstance(result, dict):
+                        finished['title'] = result.get('title')
+                        result['trace'] = finished
+                    self.add_trace(finished)
+        return wrapper
+
+    def counted(self, counts, function):
+        import functools
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            trace = getattr(self.local, 'trace', None)
+            if trace is not None:
+                for counter, amount in counts(args, result):
+                    trace['counters'][counter] += amount
+            else:
+                with self.lock:
+                    for counter, amount in counts(args, result):
+                        self.counters[counter] += amount
+            return result
+        return wrapper
+
+    def finish_trace(self, trace, elapsed):
+        return {'root': trace['root'], 'seconds': elapsed,
+                'stages': {stage: {'calls': calls, 'seconds': seconds} for stage, (calls, seconds) in trace['stages'].items()},
+                'counters': dict(trace['counters'])}
+
+    def add_network(self, trace, network):
+        #  folds the page download (RecipeCrawler.crawl_one's network timing) into a recipe's trace from a worker, so
+        #  that the trace covers the whole recipe, network and parsing
+        trace['stages']['network'] = {'calls': network['attempts'], 'seconds': network['seconds']}
+        trace['seconds'] += network['seconds']
+        trace['counters']['http_requests'] = trace['counters'].get('http_requests', 0) + network['attempts']
+        trace['network'] = dict(network)
+
+    def observe(self, histograms, name, seconds):
+        histogram = histograms.setdefault(name, [0] * (len(self.BUCKETS) + 1) + [0.0, 0])
+        histogram[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+    def add_trace(self, trace):
+        with self.lock:
+            self.traces.append(trace)
+            self.observe(self.trace_histograms, trace['root'], trace['seconds'])
+            for stage, timing in trace['stages'].items():
+                self.observe(self.stage_histograms, stage, timing['seconds'])
+            self.counters.update(trace['counters'])
+
+    def to_json(self):
+        def export(histograms):
+            return {name: {'count': histogram[-1], 'sum': histogram[-2],
+                           'buckets': dict(zip([str(bound) for bound in self.BUCKETS] + ['+Inf'],
+                                               itertools.accumulate(histogram[:-2])))}
+                    for name, histogram in sorted(histograms.items())}
+        with self.lock:
+            return {'stages': export(self.stage_histograms), 'traces': export(self.trace_histograms),
+                    'counters': dict(self.counters), 'recent_traces': list(self.traces)}
+
+    def to_prometheus(self):
+        #  Prometheus text exposition format
+        def export(lines, metric, label, histograms):
+            lines.append('# TYPE {0} histogram'.format(metric))
+            for name, histogram in sorted(histograms.items()):
+                for bound, count in zip([str(bound) for bound in self.BUCKETS] + ['+Inf'], itertools.accumulate(histogram[:-2])):
+                    lines.append('{0}_bucket{{{1}="{2}",le="{3}"}} {4}'.format(metric, label, name, bound, count))
+                lines.append('{0}_sum{{{1}="{2}"}} {3}'.format(metric, label, name, repr(histogram[-2])))
+                lines.append('{0}_count{{{1}="{2}"}} {3}'.format(metric, label, name, histogram[-1]))
+        lines = []
+        with self.lock:
+            export(lines, 'recipe_stage_seconds', 'stage', self.stage_histograms)
+            export(lines, 'recipe_trace_seconds', 'root', self.trace_histograms)
+            lines.append('# TYPE recipe_events_total counter')
+            for counter, amount in sorted(self.counters.items()):
+                lines.append('recipe_events_total{{event="{0}"}} {1}'.format(counter, amount))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        #  .prom files get the Prometheus text format, anything else JSON
+        with open(path, 'w') as metrics_file:
+            if path.endswith('.prom'):
+                metrics_file.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), metrics_file)
+
+#  None while instrumentation is off; then nothing is wrapped, so it costs nothing at all
+instrumentation = None
+_uninstrumented = {}    # name --> original function / method
+
+def enable_instrumentation(keep_traces=1000):
+    '''
+    Swaps the INSTRUMENTED_STAGES / INSTRUMENTED_COUNTERS functions (module functions, methods, and the entries in
+    TRANSFORMS) for wrapped ones that report to a new Instrumentation, which is returned (and kept in instrumentation).
+    Only affects this process; run_batch asks make_worker_pool to turn it on in its workers too
+    '''
+    global instrumentation
+    if instrumentation is not None:
+        return instrumentation
+    instrumentation = Instrumentation(keep_traces)
+    wrappers = [(name, instrumentation.timed(name, lookup_instrumented(name))) for name in INSTRUMENTED_STAGES]
+    wrappers += [(name, instrumentation.counted(counts, lookup_instrumented(name))) for name, counts in INSTRUMENTED_COUNTERS.items()]
+    for name, wrapper in wrappers:
+        _uninstrumented[name] = lookup_instrumented(name)
+        replace_instrumented(name, wrapper)
+    return instrumentation
+
+def disable_instrumentation():
+    #  puts the original functions back; gives back the Instrumentation that was collecting, if any
+    global instrumentation
+    collected, instrumentation = instrumentation, None
+    for name, function in _uninstrumented.items():
+        replace_instrumented(name, function)
+    _uninstrumented.clear()
+    return collected
+
+def lookup_instrumented(name):
+    if '.' in name:
+        class_name, method = name.split('.')
+        return getattr(globals()[class_name], method)
+    return globals()[name]
+
+def replace_instrumented(name, function):
+    if '.' in name:
+        class_name, method = name.split('.')
+        setattr(globals()[class_name], method, function)
+        return
+    for transform_name, transform in TRANSFORMS.items():
+        if transform is globals()[name]:
+            TRANSFORMS[transform_name] = function
+    globals()[name] = function
+
+def interactive_main():
     url = input("Enter a URL from AllRecipes.com, to transform: ")
-    all_strings = fetch_page(url)
+    #  set RECIPE_CACHE_DIR to keep downloaded pages around between runs
+    page_cache = PageCache(os.environ['RECIPE_CACHE_DIR']) if os.environ.get('RECIPE_CACHE_DIR') else None
+    all_strings = fetch_page(url, page_cache)
+    if page_cache is not None:
+        page_cache.close()
     ing_strings = all_strings[0]
     dir_strings = all_strings[1]
     #dir_strings  = sentence_tokenizer(dir_strings)
@@ -1226,10 +3479,11 @@ if __name__ == '__main__':
     title = all_strings[2]
     ingredients_objects = find_ingredients_objects(ing_strings)
     all_ingredients = full_ingredients_list(ingredients_objects)
-    all_tools = full_tools_list(dir_strings)
-    all_methods = full_methods_list(dir_strings, all_ingredients)
-    all_methods_class= find_primary_cooking_method(all_methods['parsed_methods']+all_methods['inferred_methods'])
-    instructions_objects = assemble_instruction_objects(dir_strings, all_ingredients)
+    analysis = RecipeAnalysis(dir_strings, all_ingredients)
+    all_tools = analysis.all_tools
+    all_methods = analysis.all_methods
+    all_methods_class = analysis.all_methods_class
+    instructions_objects = analysis.instruction_objects
     #genrate_output_steps(instructions_objects)
     print("You can do several actions; press...")
     print("[1] To view the title, original ingredients, and original instructions of the recipe.")
@@ -1242,76 +3496,138 @@ if __name__ == '__main__':
     print("[8] To view our [custom; South Asian] transform of this recipe.")
     print("[9] To view our [custom; Italian] transform of this recipe.")
     instruction = input("Enter a number corresponding to the instruction you would like: ")
+    #  everything gets rendered into one buffer, and written out at the end
+    renderer = TextRenderer()
     if instruction == "1":
-        print_original_info(title, ing_strings, dir_strings)
+        renderer.original_info(title, ing_strings, dir_strings)
     elif instruction == "2":
-        print("Parsed ingredient representations:")
-        print(ingredients_objects)
-        print("Generated ingredient outputs:")
-        for ingredient in ingredients_objects:
-            print(generate_ingredient_string(ingredient))
-        print("Parsed instruction representations:")
-        print(instructions_objects)
-        print("Generated instruction outputs:")
-        generate_output_steps(instructions_objects)
+        renderer.line("Parsed ingredient representations:").line(str(ingredients_objects))
+        renderer.line("Generated ingredient outputs:").ingredients(ingredients_objects)
+        renderer.line("Parsed instruction representations:").line(str(instructions_objects))
+        renderer.line("Generated instruction outputs:").steps(merge_output_steps(instructions_objects))
     elif instruction == "3":
-        print("List of tools:")
-        print(all_tools)
-        print("List of methods:")
-        print(all_methods)
-        print("Inferred main methods:")
-        print(all_methods_class)
-    elif instruction == "4":
-        print("Non-vegetarian to vegetarian transform:" + '\n')
-        vege_instructions, vege_ingredients = non_vege_to_vege(ingredients_objects, instructions_objects)
-        print("New Ingredients:" + '\n')
-        for vege_ingredient in vege_ingredients:
-            generate_ingredient_string(vege_ingredient)
-        print('\n')
-        print("New Instructions:" + '\n')
-        generate_output_steps(vege_instructions)
-    elif instruction == "5":
-        print("Vegetarian to non-vegetarian transform:")
-        nonveg_instructions, nonveg_ingredients = vege_to_non_vege(ingredients_objects, instructions_objects)
-        print("New Ingredients:" + '\n')
-        for nonveg_ingredient in nonveg_ingredients:
-            generate_ingredient_string(nonveg_ingredient)
-        print('\n')
-        print("New Instructions:" + '\n')
-        generate_output_steps(nonveg_instructions)
-    elif instruction == "6":
-        print("Non-healthy to healthy transform:")
-        healthy_instructions, healthy_ingredients = non_heal_to_heal(ingredients_objects, instructions_objects)
-        print("New Ingredients:" + '\n')
-        for healthy_ingredient in healthy_ingredients:
-            generate_ingredient_string(healthy_ingredient)
-        print('\n')
-        print("New Instructions:" + '\n')
-        generate_output_steps(healthy_instructions)
-    elif instruction == "7":
-        print("Healthy to non-healthy transform:")
-        nonhealthy_instructions, nonhealthy_ingredients = heal_to_non_heal(ingredients_objects, instructions_objects)
-        print("New Ingredients:" + '\n')
-        for nonhealthy_ingredient in nonhealthy_ingredients:
-            generate_ingredient_string(nonhealthy_ingredient)
-        print('\n')
-        print("New Instructions:" + '\n')
-        generate_output_steps(nonhealthy_instructions)
-    elif instruction == "8":
-        print("South Asian transform:")
-        sa_instructions, sa_ingredients = southasian_transform(ingredients_objects, instructions_objects)
-        print("New Ingredients:" + '\n')
-        for sa_ingredient in sa_ingredients:
-            generate_ingredient_string(sa_ingredient)
-        print('\n')
-        print("New Instructions:" + '\n')
-        generate_output_steps(sa_instructions)
-    elif instruction == "9":
-        print("Italian transform:")
-        ita_instructions, ita_ingredients = italian_transform(ingredients_objects, instructions_objects)
-        print("New Ingredients:" + '\n')
-        for ita_ingredient in ita_ingredients:
-            generate_ingredient_string(ita_ingredient)
-        print('\n')
-        print("New Instructions:" + '\n')
-        generate_output_steps(ita_instructions)
\ No newline at end of file
+        renderer.line("List of tools:").line(str(all_tools))
+        renderer.line("List of methods:").line(str(all_methods))
+        renderer.line("Inferred main methods:").line(str(all_methods_class))
+    elif instruction in MENU_TRANSFORMS:
+        heading, name = MENU_TRANSFORMS[instruction]
+        new_instructions, new_ingredients = TRANSFORMS[name](ingredients_objects, instructions_objects)
+        renderer.line(heading)
+        renderer.line("New Ingredients:" + '\n').ingredients(new_ingredients)
+        renderer.line('\n')
+        renderer.line("New Instructions:" + '\n').steps(merge_output_steps(new_instructions))
+    sys.stdout.write(renderer.getvalue())
+
+#  menu number --> (heading, TRANSFORMS name)
+MENU_TRANSFORMS = {'4': ("Non-vegetarian to vegetarian transform:" + '\n', 'vegetarian'),
+                   '5': ("Vegetarian to non-vegetarian transform:", 'non-vegetarian'),
+                   '6': ("Non-healthy to healthy transform:", 'healthy'),
+                   '7': ("Healthy to non-healthy transform:", 'unhealthy'),
+                   '8': ("South Asian transform:", 'south-asian'),
+                   '9': ("Italian transform:", 'italian')}
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="AllRecipes recipe parser / transformer. Runs the interactive menu "
+                                                 "unless --batch is given.")
+    parser.add_argument('--batch', metavar='FILE', nargs='?', const='-',
+                        help="read recipe URLs, recipe IDs or saved .html paths (one per line) from FILE, or stdin if "
+                             "no FILE / '-', and write one JSON line per recipe")
+    parser.add_argument('--dump', metavar='FILE',
+                        help="analyze an offline recipe dump (JSON lines of title / ingredients / directions, may be "
+                             "gzipped) instead; needs -o")
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help="with --dump: save progress here, and resume from it if it already exists")
+    parser.add_argument('--serve', action='store_true',
+                        help="run the HTTP service (POST /parse, POST /transform, GET /stats) with the models kept loaded")
+    parser.add_argument('--host', default='127.0.0.1', help="with --serve: address to listen on")
+    parser.add_argument('--port', type=int, default=8337, help="with --serve: port to listen on")
+    parser.add_argument('--max-wait', type=float, default=5.0,
+                        help="with --serve: ms to wait for other requests' tagging to batch together")
+    parser.add_argument('--max-batch', type=int, default=256, help="with --serve: sentences per tagging batch, at most")
+    parser.add_argument('--load-test', metavar='URL',
+                        help="send the recipes from --dump to a running service at URL (e.g. http://127.0.0.1:8337/transform) "
+                             "and report throughput and p50 / p99 latency")
+    parser.add_argument('--requests', type=int, default=200, help="with --load-test: requests to send")
+    parser.add_argument('--clients', type=int, default=16, help="with --load-test: concurrent connections")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="time every stage and count tagged tokens, cache hits etc. (see Instrumentation), and write "
+                             "the aggregates here at the end (Prometheus text format for .prom, JSON otherwise); "
+                             "per-recipe traces also go into the JSON lines")
+    parser.add_argument('-t', '--transform', action='append', default=[], choices=sorted(TRANSFORMS) + ['all'],
+                        help="transform to run on every recipe (can be repeated)")
+    parser.add_argument('-o', '--output', help="where to write the JSON lines (default: stdout)")
+    parser.add_argument('--format', choices=sorted(RENDERERS), default='json',
+                        help="with --batch / --dump: write JSON lines (default), or text / Markdown for reading")
+    parser.add_argument('-j', '--processes', type=int, help="number of worker processes (default: one per CPU)")
+    parser.add_argument('--ordered', action='store_true', help="write results in input order instead of as they finish")
+    parser.add_argument('--cache-dir', help="keep downloaded pages in a PageCache in this directory")
+    parser.add_argument('--offline', action='store_true', help="only use pages from --cache-dir, never download")
+    parser.add_argument('--parse-cache', metavar='FILE',
+                        help="keep ingredient parses in this SQLite file between runs (same as RECIPE_PARSE_CACHE)")
+    parser.add_argument('--concurrency', type=int, default=8, help="pages downloaded at once")
+    parser.add_argument('--rate', type=float, default=2.0, help="max requests per second per host")
+    parser.add_argument('--warm', choices=WARM_MODES, default='fork',
+                        help="how worker processes get the NLTK models: loaded before forking them (default), "
+                             "loaded once per worker, or loaded on first use")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        enable_instrumentation()
+        try:
+            run_main(parser, args)
+        finally:
+            instrumentation.write(args.metrics)
+    else:
+        run_main(parser, args)
+
+def run_main(parser, args):
+    if args.serve:
+        serve(args.host, args.port, args.max_wait / 1000, args.max_batch)
+        return
+    if args.load_test:
+        if args.dump is None:
+            parser.error("--load-test needs --dump (the recipes to send)")
+        payloads = [recipe for start, end, recipe in itertools.islice(read_recipe_dump(args.dump), args.requests)
+                    if 'error' not in recipe]
+        if args.transform:
+            for recipe in payloads:
+                recipe['transforms'] = sorted(TRANSFORMS) if 'all' in args.transform else args.transform
+        print(json.dumps(load_test(args.load_test, payloads, args.requests, args.clients)))
+        return
+    if args.batch is None and args.dump is None:
+        interactive_main()
+        return
+    if args.dump is not None and not args.output:
+        parser.error("--dump needs -o (results get appended to it when resuming)")
+    if args.offline and not args.cache_dir:
+        parser.error("--offline needs --cache-dir")
+    if args.parse_cache:
+        #  through the environment as well, so that worker processes that don't get forked pick it up too
+        global ingredient_cache
+        os.environ['RECIPE_PARSE_CACHE'] = args.parse_cache
+        ingredient_cache = IngredientParseCache(path=args.parse_cache)
+    transforms = sorted(TRANSFORMS) if 'all' in args.transform else args.transform
+    if args.dump is not None:
+        writer = run_dump(args.dump, args.output, transforms, args.checkpoint, output_format=args.format)
+        print("{0} recipes written, {1} failed".format(writer.written, writer.failed), file=sys.stderr)
+        return
+    input_file = sys.stdin if args.batch == '-' else open(args.batch)
+    try:
+        sources = [line.strip() for line in input_file if line.strip()]
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+    cache = PageCache(args.cache_dir, offline=args.offline) if args.cache_dir else None
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        writer = run_batch(sources, transforms, output, args.processes, args.ordered, cache,
+                           {'concurrency': args.concurrency, 'requests_per_second': args.rate}, args.warm, args.format)
+    finally:
+        if cache is not None:
+            cache.close()
+        if args.output:
+            output.close()
+    print("{0} recipes written, {1} failed".format(writer.written, writer.failed), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()